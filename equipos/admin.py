@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils.html import format_html, format_html_join
 
 from .models import (
     AuditLog,
@@ -6,6 +7,8 @@ from .models import (
     CentroCosto,
     Division,
     Equipo,
+    ImportJob,
+    ImportLock,
     ImportLog,
     Marca,
     ModeloEquipo,
@@ -95,9 +98,100 @@ class ModeloEquipoAdmin(admin.ModelAdmin):
 
 @admin.register(ImportLog)
 class ImportLogAdmin(admin.ModelAdmin):
-    list_display = ('fecha', 'usuario', 'archivo', 'total_filas', 'creados', 'actualizados', 'omitidos', 'errores')
+    list_display = (
+        'fecha',
+        'usuario',
+        'archivo',
+        'modo',
+        'total_filas',
+        'creados',
+        'actualizados',
+        'sin_cambios',
+        'omitidos',
+        'errores',
+        'incremental_desde',
+        'marca_modificacion',
+        'duracion',
+        'filas_por_segundo',
+    )
+    search_fields = ('archivo', 'archivo_sha256', 'usuario__username')
+    list_filter = ('fecha', 'modo')
+    exclude = ('metricas',)
+    readonly_fields = ('detalle_metricas',)
+
+    @admin.display(description='Duración (s)')
+    def duracion(self, obj):
+        return obj.metricas.get('segundos', '-')
+
+    @admin.display(description='Filas/s')
+    def filas_por_segundo(self, obj):
+        return obj.metricas.get('filas_por_segundo', '-')
+
+    @admin.display(description='Métricas')
+    def detalle_metricas(self, obj):
+        metricas = obj.metricas or {}
+        if not metricas:
+            return '-'
+        filas = format_html_join(
+            '',
+            '<tr><td>{}</td><td>{}</td></tr>',
+            ((fase, segundos) for fase, segundos in metricas.get('fases', {}).items()),
+        )
+        aciertos = ''
+        cache = metricas.get('cache_normalizacion')
+        if cache:
+            aciertos = format_html(
+                '<table><tr><th>Columna</th><th>Aciertos del cache</th><th>Valores normalizados</th></tr>{}</table>',
+                format_html_join(
+                    '',
+                    '<tr><td>{}</td><td>{}</td><td>{}</td></tr>',
+                    (
+                        (columna, f"{conteo['tasa_aciertos'] * 100:.1f}%", conteo['fallos'])
+                        for columna, conteo in cache['columnas'].items()
+                    ),
+                ),
+            )
+        return format_html(
+            '<table><tr><th>Fase</th><th>Segundos</th></tr>{}</table>'
+            '<p>Total: {} s · {} filas/s · {} consultas ({} s) · pico de memoria {} KB</p>{}',
+            filas,
+            metricas.get('segundos'),
+            metricas.get('filas_por_segundo'),
+            metricas.get('consultas'),
+            metricas.get('segundos_consultas'),
+            metricas.get('pico_memoria_kb'),
+            aciertos,
+        )
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'creado_en',
+        'usuario',
+        'modo',
+        'estado',
+        'es_vista_previa',
+        'fase',
+        'filas_procesadas',
+        'filas_por_segundo',
+        'import_log',
+    )
+    list_filter = ('estado', 'modo', 'es_vista_previa')
     search_fields = ('archivo', 'usuario__username')
-    list_filter = ('fecha',)
+    exclude = ('cambios',)
+
+
+@admin.register(ImportLock)
+class ImportLockAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'propietario', 'usuario', 'job', 'host', 'pid', 'adquirido_en', 'latido')
+    readonly_fields = ('nombre', 'token', 'propietario', 'usuario', 'job', 'host', 'pid', 'adquirido_en', 'latido')
+    actions = ('liberar',)
+
+    @admin.action(description='Liberar el candado (solo si la importación ya no corre)')
+    def liberar(self, request, queryset):
+        queryset.update(token='')
 
 
 @admin.register(AuditLog)
@@ -1,6 +1,45 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+MODELOS_INVENTARIO = (
+    "Equipo",
+    "Sociedad",
+    "Division",
+    "CentroCosto",
+    "Marca",
+    "SistemaOperativo",
+    "TipoEquipo",
+    "ModeloEquipo",
+)
+
+
+def instalar_busqueda(sender, using, **kwargs):
+    from django.db import connections
+
+    from inventario.busqueda import indice_disponible, instalar_indice
+
+    # La migración 0020 crea el índice; aquí solo se reparan sus triggers.
+    if indice_disponible(connections[using]):
+        instalar_indice(connections[using])
+
+
+def inventario_modificado(sender, **kwargs):
+    from inventario.conteos import marcar_cambio
+
+    marcar_cambio()
 
 
 class EquiposConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'equipos'
+
+    def ready(self):
+        # Los triggers del índice de búsqueda se pierden si una migración reconstruye
+        # equipos_equipo en SQLite; se revisan después de cada migrate.
+        post_migrate.connect(instalar_busqueda, sender=self)
+        # Las escrituras masivas (importaciones) marcan el cambio por su cuenta. Los
+        # catálogos cuentan también: sus nombres aparecen en las opciones de los filtros.
+        for modelo in MODELOS_INVENTARIO:
+            post_save.connect(inventario_modificado, sender=self.get_model(modelo))
+            post_delete.connect(inventario_modificado, sender=self.get_model(modelo))
@@ -0,0 +1,140 @@
+import json
+import platform
+import tempfile
+import time
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from equipos.management.commands.generar_inventario_sintetico import add_generator_arguments, build_generator
+from inventario.importer import import_inventario_csv
+from inventario.metrics import QueryCounter, peak_rss_kb, reset_peak_rss
+from inventario.staging import import_inventario_staging
+
+MODOS = ["update_create", "update_only", "create_only"]
+RESULTADOS = ("total", "creados", "actualizados", "sin_cambios", "omitidos", "errores")
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide import_inventario_csv con CSV sintéticos y reporta filas/s, pico de memoria y "
+        "consultas en JSON. Cada corrida se revierte al terminar, así que la base no cambia. "
+        "Ejemplo: python manage.py benchmark_importacion --filas 10000 100000 --salida bench.json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--filas",
+            type=int,
+            nargs="+",
+            default=[10000],
+            help="Tamaños de archivo a medir (por defecto: 10000).",
+        )
+        parser.add_argument(
+            "--modos",
+            nargs="+",
+            choices=MODOS,
+            default=MODOS,
+            help="Modos de importación a medir (por defecto: los tres).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Tamaño de lote para bulk_create/bulk_update (por defecto: escritura fila por fila).",
+        )
+        parser.add_argument(
+            "--motor",
+            choices=["orm", "staging"],
+            default="orm",
+            help="Motor de importación a medir (por defecto: orm).",
+        )
+        parser.add_argument(
+            "--directorio",
+            default=None,
+            help="Dónde dejar los CSV generados (por defecto un directorio temporal que se borra).",
+        )
+        parser.add_argument("--salida", default=None, help="Archivo JSON de salida (por defecto: stdout).")
+        add_generator_arguments(parser)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory(prefix="benchmark_importacion_") as temporal:
+            directorio = Path(options["directorio"] or temporal)
+            directorio.mkdir(parents=True, exist_ok=True)
+            corridas = []
+            for filas in options["filas"]:
+                archivo = directorio / f"inventario_{filas}.csv"
+                base = directorio / f"inventario_{filas}_base.csv"
+                conteo = build_generator(options).escribir(filas, archivo, base)
+                for modo in options["modos"]:
+                    corrida = {
+                        "filas": filas,
+                        "filas_base": conteo["base"],
+                        **self._medir(archivo, base, modo, options["batch_size"], options["motor"]),
+                    }
+                    corridas.append(corrida)
+                    self.stderr.write(
+                        f"{filas} filas, {modo}: {corrida['filas_por_segundo']} filas/s, "
+                        f"{corrida['consultas']} consultas, pico {corrida['pico_memoria_kb']} KB"
+                    )
+
+        reporte = {
+            "generado_en": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "base_de_datos": connection.vendor,
+            "batch_size": options["batch_size"],
+            "motor": options["motor"],
+            "parametros": {
+                campo: options[campo]
+                for campo in (
+                    "sociedades",
+                    "divisiones",
+                    "centros",
+                    "marcas",
+                    "modelos",
+                    "nuevos",
+                    "actualizados",
+                    "invalidos",
+                    "semilla",
+                )
+            },
+            "corridas": corridas,
+        }
+        salida = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if options["salida"]:
+            Path(options["salida"]).write_text(salida + "\n", encoding="utf-8")
+        else:
+            self.stdout.write(salida)
+
+    def _importar(self, path, modo, batch_size, motor):
+        if motor == "staging":
+            return import_inventario_staging(path, modo)
+        return import_inventario_csv(path, modo, batch_size=batch_size)
+
+    def _medir(self, archivo, base, modo, batch_size, motor):
+        with transaction.atomic():
+            # El archivo base deja los equipos "existentes"; no entra en la medición.
+            self._importar(base, "update_create", batch_size, motor)
+            contador = QueryCounter()
+            reset_peak_rss()
+            memoria_inicial = peak_rss_kb()
+            inicio = time.perf_counter()
+            with contador.contar():
+                resultados, _ = self._importar(archivo, modo, batch_size, motor)
+            segundos = time.perf_counter() - inicio
+            pico = peak_rss_kb()
+            transaction.set_rollback(True)
+        return {
+            "modo": modo,
+            "segundos": round(segundos, 3),
+            "filas_por_segundo": round(resultados["total"] / segundos, 1) if segundos else 0.0,
+            "consultas": contador.consultas,
+            "segundos_en_consultas": round(contador.segundos, 3),
+            "memoria_inicial_kb": memoria_inicial,
+            "pico_memoria_kb": pico,
+            "resultados": {campo: resultados[campo] for campo in RESULTADOS},
+        }
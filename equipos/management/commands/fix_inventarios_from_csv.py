@@ -1,10 +1,32 @@
+import cProfile
+import io
+import pstats
+import sys
 from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
 
-from equipos.models import AuditLog, ImportLog
+from equipos.models import ImportJob
 from inventario.importer import import_inventario_csv
+from inventario.jobs import (
+    claim_job,
+    confirmar_vista_previa,
+    find_previous_import,
+    find_watermark,
+    reanudar_importacion,
+    registrar_importacion,
+    run_import_job,
+    ruta_errores,
+)
+from inventario.locks import ImportacionEnCurso, bloqueo_importacion, describir_lock, lock_actual
+from inventario.staging import import_inventario_staging
+from inventario.uploads import eliminar_subida, file_sha256, save_import_stream
+
+PREVIEW_LINES = 20
+PROFILE_PATH = "fix_inventarios_from_csv.prof"
+PROFILE_LINES = 15
 
 
 class Command(BaseCommand):
@@ -23,41 +45,324 @@ class Command(BaseCommand):
         parser.add_argument(
             "--path",
             default=None,
-            help="Ruta opcional al CSV (por defecto usa settings.CSV_INVENTARIO_PATH).",
+            help=(
+                "Ruta opcional al CSV, .csv.gz, .zip o .xlsx; '-' lo lee de la entrada estándar "
+                "(por defecto usa settings.CSV_INVENTARIO_PATH)."
+            ),
+        )
+        parser.add_argument(
+            "--hoja",
+            default="",
+            help="Con un archivo .xlsx, la hoja a importar por nombre o número desde 1 (por defecto: la primera).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Escribe los equipos con bulk_create/bulk_update en lotes de N filas.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                "Procesos que leen y normalizan las filas en paralelo; la escritura sigue en un "
+                "solo proceso y en el orden del archivo (por defecto: 1)."
+            ),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=None,
+            help=(
+                "Hace commit cada N filas y guarda un checkpoint; si la importación falla se "
+                "reanuda con --reanudar."
+            ),
+        )
+        parser.add_argument(
+            "--reanudar",
+            type=int,
+            default=None,
+            metavar="JOB_ID",
+            help="Reanuda una importación por bloques que falló desde su último checkpoint.",
+        )
+        parser.add_argument(
+            "--motor",
+            choices=["orm", "staging"],
+            default="orm",
+            help=(
+                "orm escribe con el ORM (por defecto); staging carga el archivo en una tabla temporal "
+                "y lo fusiona con INSERT ... ON CONFLICT, pensado para cargas completas muy grandes."
+            ),
+        )
+        parser.add_argument(
+            "--preview",
+            action="store_true",
+            help="Calcula los cambios sin escribirlos y guarda la vista previa para confirmarla.",
+        )
+        parser.add_argument(
+            "--confirmar",
+            type=int,
+            default=None,
+            metavar="JOB_ID",
+            help="Aplica los cambios de una vista previa guardada sin volver a leer el CSV.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Reimporta el archivo aunque ya exista una importación con el mismo contenido y modo.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Solo procesa las filas cuya Modificación no es anterior a la marca de la última importación.",
+        )
+        parser.add_argument(
+            "--profile",
+            nargs="?",
+            const=PROFILE_PATH,
+            default=None,
+            metavar="ARCHIVO",
+            help=(
+                "Muestra los tiempos por fase, consultas y memoria, y guarda un perfil de cProfile "
+                f"(por defecto en {PROFILE_PATH})."
+            ),
         )
 
     def handle(self, *args, **options):
+        if not options["profile"]:
+            self._importar(options)
+            return
+        perfil = cProfile.Profile()
+        perfil.enable()
+        try:
+            self._importar(options)
+        finally:
+            perfil.disable()
+            perfil.dump_stats(options["profile"])
+            self.stdout.write(f"Perfil de cProfile guardado en {options['profile']}.")
+            salida = io.StringIO()
+            pstats.Stats(perfil, stream=salida).sort_stats("cumulative").print_stats(PROFILE_LINES)
+            self.stdout.write(salida.getvalue())
+
+    def _importar(self, options):
         modo = options["modo"]
+        if options["motor"] == "staging" and (options["preview"] or options["confirmar"]):
+            raise CommandError("El motor staging no admite --preview ni --confirmar.")
+        if options["chunk_size"] and (options["preview"] or options["motor"] == "staging"):
+            raise CommandError("--chunk-size no se puede usar con --preview ni con el motor staging.")
+        if options["workers"] < 1:
+            raise CommandError("--workers debe ser al menos 1.")
+        if options["workers"] > 1 and options["motor"] == "staging":
+            raise CommandError("El motor staging no admite --workers.")
+        if not options["preview"]:
+            # Solo una importación escribe a la vez; el cron no espera a la otra.
+            lock = lock_actual()
+            if lock is not None:
+                raise CommandError(describir_lock(lock))
         path = Path(options["path"]) if options["path"] else settings.CSV_INVENTARIO_PATH
-        resultados, errores = import_inventario_csv(path, modo)
-
-        log = ImportLog.objects.create(
-            usuario=None,
-            archivo=str(path),
-            total_filas=resultados["total"],
-            creados=resultados["creados"],
-            actualizados=resultados["actualizados"],
-            omitidos=resultados["omitidos"],
-            errores=resultados["errores"],
-            resumen_errores=errores,
-        )
-        AuditLog.objects.create(
-            usuario=None,
-            accion="IMPORT",
-            resumen=(
-                "Importación CSV ejecutada desde comando. "
-                f"Total: {resultados['total']}, "
-                f"Creados: {resultados['creados']}, "
-                f"Actualizados: {resultados['actualizados']}, "
-                f"Omitidos: {resultados['omitidos']}, "
-                f"Errores: {resultados['errores']}."
-            ),
-        )
+        sha256 = ""
+        if options["path"] == "-" and not (options["confirmar"] or options["reanudar"]):
+            path, sha256, tamano = save_import_stream(sys.stdin.buffer, "stdin.csv")
+            self.stdout.write(f"Entrada guardada en {path} ({tamano} bytes, SHA-256 {sha256}).")
+        if options["reanudar"]:
+            job = ImportJob.objects.filter(pk=options["reanudar"], es_vista_previa=False).first()
+            if job is None:
+                raise CommandError(f"No existe la importación #{options['reanudar']}.")
+            try:
+                job = reanudar_importacion(job, encolar=False)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f"Reanudando la importación #{job.pk} desde la fila {job.checkpoint['fila'] + 1}.")
+            job = self._ejecutar_job(job, options["batch_size"], options["workers"])
+            resultados = job.resultados
+            log = job.import_log
+        elif options["confirmar"]:
+            vista_previa = ImportJob.objects.filter(pk=options["confirmar"], es_vista_previa=True).first()
+            if vista_previa is None:
+                raise CommandError(f"No existe la vista previa #{options['confirmar']}.")
+            try:
+                job = confirmar_vista_previa(vista_previa, encolar=False)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            job = self._ejecutar_job(job, options["batch_size"])
+            resultados = job.resultados
+            log = job.import_log
+        elif options["preview"]:
+            job = ImportJob.objects.create(
+                archivo=str(path),
+                sha256=sha256,
+                modo=modo,
+                fase="en_cola",
+                es_vista_previa=True,
+                incremental=options["incremental"],
+                hoja=options["hoja"],
+            )
+            job = self._ejecutar_job(job, workers=options["workers"])
+            resultados = job.resultados
+            log = None
+            self._write_preview(job)
+        else:
+            if not sha256 and path.exists():
+                sha256 = file_sha256(path)
+            previo = None if options["force"] else find_previous_import(sha256, modo)
+            if previo is not None:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Ya importado: el archivo se importó en modo {modo} el {timezone.localtime(previo.fecha):%Y-%m-%d %H:%M} "
+                        f"(Log ID: {previo.pk}). Use --force para procesarlo de nuevo."
+                    )
+                )
+                if options["path"] == "-":
+                    eliminar_subida(path)
+                return
+            desde = find_watermark(modo) if options["incremental"] else None
+            if desde:
+                self.stdout.write(f"Incremental desde {timezone.localtime(desde):%Y-%m-%d %H:%M}.")
+            if options["chunk_size"]:
+                # Por bloques se ejecuta como job para que el checkpoint quede guardado.
+                job = ImportJob.objects.create(
+                    archivo=str(path),
+                    sha256=sha256,
+                    modo=modo,
+                    fase="en_cola",
+                    forzar=True,
+                    incremental=options["incremental"],
+                    hoja=options["hoja"],
+                    chunk_size=options["chunk_size"],
+                )
+                job = self._ejecutar_job(job, options["batch_size"], options["workers"])
+                resultados = job.resultados
+                log = job.import_log
+            else:
+                archivo_errores = ruta_errores(f"comando_{timezone.now():%Y%m%d_%H%M%S}.csv.gz")
+                try:
+                    with bloqueo_importacion("Comando fix_inventarios_from_csv"):
+                        resultados, errores = self._importar_archivo(path, modo, desde, options, archivo_errores)
+                        log = registrar_importacion(
+                            None,
+                            path,
+                            resultados,
+                            errores,
+                            resumen="Importación CSV ejecutada desde comando.",
+                            sha256=sha256,
+                            modo=modo,
+                        )
+                except (ImportacionEnCurso, ValueError) as exc:
+                    raise CommandError(str(exc))
+                finally:
+                    # La entrada de stdin solo se guarda para importarla; los jobs borran la suya.
+                    if options["path"] == "-":
+                        eliminar_subida(path)
+
+        if resultados.get("columnas_faltantes_obligatorias"):
+            self.stdout.write(
+                self.style.ERROR(
+                    "Faltan columnas obligatorias: " + ", ".join(resultados["columnas_faltantes_obligatorias"])
+                )
+            )
+        if resultados.get("columnas_faltantes"):
+            self.stdout.write(
+                self.style.WARNING("Campos sin columna en el CSV: " + ", ".join(resultados["columnas_faltantes"]))
+            )
+        if resultados.get("columnas_duplicadas"):
+            self.stdout.write(
+                self.style.WARNING(
+                    "Encabezados repetidos (se usa la última columna): "
+                    + ", ".join(resultados["columnas_duplicadas"])
+                )
+            )
 
-        self.stdout.write(self.style.SUCCESS("Importación finalizada."))
+        if log is None:
+            self.stdout.write(self.style.SUCCESS(f"Vista previa #{job.pk} guardada; no se escribió ningún cambio."))
+            self.stdout.write(f"Para aplicarla: python manage.py fix_inventarios_from_csv --confirmar {job.pk}")
+            encabezado = "Vista previa"
+        else:
+            self.stdout.write(self.style.SUCCESS("Importación finalizada."))
+            encabezado = f"Log ID: {log.pk}"
         self.stdout.write(
-            f"Log ID: {log.pk} | Total: {resultados['total']} | "
+            f"{encabezado} | Total: {resultados['total']} | "
             f"Actualizados: {resultados['actualizados']} | "
+            f"Sin cambios: {resultados['sin_cambios']} | "
             f"Creados: {resultados['creados']} | "
             f"Errores: {resultados['errores']}"
         )
+        if resultados.get("incremental_desde"):
+            self.stdout.write(f"Anteriores a la marca (no procesadas): {resultados['omitidos_por_marca']}")
+        if resultados.get("marca_modificacion"):
+            self.stdout.write(f"Marca de modificación: {resultados['marca_modificacion']}")
+        if resultados.get("archivo_errores"):
+            self.stdout.write(f"Errores completos en {resultados['archivo_errores']}")
+        if options["profile"] and resultados.get("metricas"):
+            self._write_metricas(resultados["metricas"])
+        elif resultados.get("metricas"):
+            self.stdout.write(f"Pico de memoria: {resultados['metricas']['pico_memoria_kb']} KB")
+
+    def _importar_archivo(self, path, modo, desde, options, archivo_errores):
+        if options["motor"] == "staging":
+            return import_inventario_staging(
+                path,
+                modo,
+                progress=self._progreso,
+                desde=desde,
+                hoja=options["hoja"],
+                archivo_errores=archivo_errores,
+            )
+        return import_inventario_csv(
+            path,
+            modo,
+            batch_size=options["batch_size"],
+            progress=self._progreso,
+            desde=desde,
+            workers=options["workers"],
+            hoja=options["hoja"],
+            archivo_errores=archivo_errores,
+        )
+
+    def _progreso(self, fase, filas):
+        if fase == "procesando" and filas:
+            self.stdout.write(f"Procesadas {filas} filas...")
+
+    def _ejecutar_job(self, job, batch_size=None, workers=None):
+        job = run_import_job(claim_job(job.pk), batch_size=batch_size, workers=workers)
+        if job.estado == ImportJob.Estado.PENDIENTE:
+            # Otra importación tomó el candado entre la revisión inicial y este punto.
+            raise CommandError(f"{job.mensaje} La importación #{job.pk} quedó en cola para procesar_importaciones.")
+        if job.estado == ImportJob.Estado.ERROR:
+            if job.puede_reanudarse:
+                raise CommandError(
+                    f"{job.mensaje} Confirmadas {job.checkpoint['resultados']['total']} filas; para continuar: "
+                    f"python manage.py fix_inventarios_from_csv --reanudar {job.pk}"
+                )
+            raise CommandError(job.mensaje)
+        return job
+
+    def _write_metricas(self, metricas):
+        self.stdout.write(
+            f"Tiempo: {metricas['segundos']} s | Filas/s: {metricas['filas_por_segundo']} | "
+            f"Consultas: {metricas['consultas']} ({metricas['segundos_consultas']} s) | "
+            f"Pico de memoria: {metricas['pico_memoria_kb']} KB (al iniciar: {metricas.get('memoria_inicial_kb', 0)} KB)"
+        )
+        for fase, segundos in metricas["fases"].items():
+            porcentaje = segundos * 100 / metricas["segundos"] if metricas["segundos"] else 0
+            self.stdout.write(f"  {fase:<14} {segundos:>10.3f} s {porcentaje:>6.1f}%")
+        cache = metricas.get("cache_normalizacion")
+        if cache:
+            self.stdout.write(f"Cache de normalización: {cache['tasa_aciertos'] * 100:.1f}% de aciertos")
+            for columna, conteo in cache["columnas"].items():
+                self.stdout.write(
+                    f"  {columna:<24} {conteo['tasa_aciertos'] * 100:>6.1f}% ({conteo['fallos']} valores normalizados)"
+                )
+
+    def _write_preview(self, job):
+        operaciones = job.cambios["operaciones"]
+        for operacion in operaciones[:PREVIEW_LINES]:
+            if operacion["accion"] == "crear":
+                self.stdout.write(f"Fila {operacion['fila']}: crear {operacion['numero_serie']}")
+                continue
+            detalle = ", ".join(
+                f"{campo}: {antes!r} -> {despues!r}" for campo, (antes, despues) in operacion["cambios"].items()
+            )
+            self.stdout.write(f"Fila {operacion['fila']}: actualizar {operacion['numero_serie']} ({detalle})")
+        if len(operaciones) > PREVIEW_LINES:
+            self.stdout.write(f"... y {len(operaciones) - PREVIEW_LINES} operaciones más.")
@@ -0,0 +1,85 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventario.synthetic import InventoryGenerator
+
+
+def add_generator_arguments(parser):
+    parser.add_argument(
+        "--plantilla",
+        default=None,
+        help="CSV del que se copia el encabezado (por defecto settings.CSV_INVENTARIO_PATH).",
+    )
+    parser.add_argument("--sociedades", type=int, default=3, help="Número de sociedades (por defecto: 3).")
+    parser.add_argument("--divisiones", type=int, default=12, help="Número de divisiones (por defecto: 12).")
+    parser.add_argument("--centros", type=int, default=60, help="Número de centros de costo (por defecto: 60).")
+    parser.add_argument("--marcas", type=int, default=8, help="Número de marcas (por defecto: 8).")
+    parser.add_argument("--modelos", type=int, default=40, help="Número de modelos (por defecto: 40).")
+    parser.add_argument(
+        "--nuevos",
+        type=float,
+        default=0.2,
+        help="Proporción de filas de equipos que no existen en el archivo base (por defecto: 0.2).",
+    )
+    parser.add_argument(
+        "--actualizados",
+        type=float,
+        default=0.3,
+        help="Proporción de filas que cambian respecto al archivo base (por defecto: 0.3).",
+    )
+    parser.add_argument(
+        "--invalidos",
+        type=float,
+        default=0.02,
+        help="Proporción de filas sin un campo obligatorio (por defecto: 0.02).",
+    )
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla para reproducir el mismo archivo.")
+
+
+def build_generator(options):
+    plantilla = Path(options["plantilla"]) if options["plantilla"] else settings.CSV_INVENTARIO_PATH
+    try:
+        return InventoryGenerator(
+            plantilla,
+            sociedades=options["sociedades"],
+            divisiones=options["divisiones"],
+            centros=options["centros"],
+            marcas=options["marcas"],
+            modelos=options["modelos"],
+            nuevos=options["nuevos"],
+            actualizados=options["actualizados"],
+            invalidos=options["invalidos"],
+            semilla=options["semilla"],
+        )
+    except (OSError, ValueError) as exc:
+        raise CommandError(str(exc))
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un CSV de inventario sintético con el encabezado del CSV real. "
+        "Ejemplo: python manage.py generar_inventario_sintetico --filas 100000 "
+        "--salida /tmp/inventario.csv --base /tmp/inventario_base.csv"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--filas", type=int, default=10000, help="Filas a generar (por defecto: 10000).")
+        parser.add_argument("--salida", required=True, help="Ruta del CSV a generar (.csv o .csv.gz).")
+        parser.add_argument(
+            "--base",
+            default=None,
+            help=(
+                "Ruta opcional de un segundo CSV con el estado previo de los equipos "
+                "actualizados y sin cambios; se importa antes para medir actualizaciones."
+            ),
+        )
+        add_generator_arguments(parser)
+
+    def handle(self, *args, **options):
+        generador = build_generator(options)
+        conteo = generador.escribir(options["filas"], options["salida"], options["base"])
+        self.stdout.write(self.style.SUCCESS(f"Generadas {conteo['filas']} filas en {options['salida']}."))
+        if options["base"]:
+            self.stdout.write(f"Archivo base con {conteo['base']} filas en {options['base']}.")
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.jobs import limpiar_archivos_importacion, next_pending_job, run_import_job
+
+LIMPIEZA_INTERVALO = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa las importaciones encoladas desde la vista de importación. "
+        "Ejemplo: python manage.py procesar_importaciones --once"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Procesa los trabajos pendientes y termina en lugar de quedarse esperando.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=5.0,
+            help="Segundos entre revisiones de la cola (por defecto: 5).",
+        )
+
+    def handle(self, *args, **options):
+        ultima_limpieza = None
+        while True:
+            if ultima_limpieza is None or time.monotonic() - ultima_limpieza >= LIMPIEZA_INTERVALO:
+                self._limpiar()
+                ultima_limpieza = time.monotonic()
+            job = next_pending_job()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["intervalo"])
+                continue
+
+            self.stdout.write(f"Procesando importación #{job.pk} ({job.modo})...")
+            job = run_import_job(job)
+            if job.estado == job.Estado.PENDIENTE:
+                # Otra importación tiene el candado; el job sigue en la cola.
+                self.stdout.write(self.style.WARNING(f"Importación #{job.pk} en espera. {job.mensaje}"))
+                if options["once"]:
+                    break
+                time.sleep(options["intervalo"])
+            elif job.estado == job.Estado.COMPLETADO:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Importación #{job.pk} finalizada. Log ID: {job.import_log_id} | "
+                        f"Filas: {job.filas_procesadas} | {job.filas_por_segundo} filas/s"
+                    )
+                )
+            else:
+                self.stdout.write(self.style.ERROR(f"Importación #{job.pk} con error: {job.mensaje}"))
+
+    def _limpiar(self):
+        subidas, errores = limpiar_archivos_importacion()
+        if subidas or errores:
+            self.stdout.write(f"Limpieza: {subidas} archivos subidos y {errores} archivos de errores borrados.")
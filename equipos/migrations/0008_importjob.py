@@ -0,0 +1,74 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("equipos", "0007_alter_equipo_numero_inventario_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("creado_en", models.DateTimeField(auto_now_add=True)),
+                ("archivo", models.CharField(max_length=255)),
+                ("modo", models.CharField(max_length=20)),
+                (
+                    "estado",
+                    models.CharField(
+                        choices=[
+                            ("PENDIENTE", "Pendiente"),
+                            ("EN_PROCESO", "En proceso"),
+                            ("COMPLETADO", "Completado"),
+                            ("ERROR", "Error"),
+                        ],
+                        db_index=True,
+                        default="PENDIENTE",
+                        max_length=20,
+                    ),
+                ),
+                ("fase", models.CharField(blank=True, max_length=30)),
+                ("filas_procesadas", models.PositiveIntegerField(default=0)),
+                ("filas_estimadas", models.PositiveIntegerField(default=0)),
+                ("filas_por_segundo", models.FloatField(default=0)),
+                ("iniciado_en", models.DateTimeField(blank=True, null=True)),
+                ("finalizado_en", models.DateTimeField(blank=True, null=True)),
+                ("mensaje", models.TextField(blank=True)),
+                ("resultados", models.JSONField(blank=True, null=True)),
+                (
+                    "import_log",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="jobs",
+                        to="equipos.importlog",
+                    ),
+                ),
+                (
+                    "usuario",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0008_importjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="equipo",
+            name="import_hash",
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="importlog",
+            name="sin_cambios",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0009_equipo_import_hash_importlog_sin_cambios"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="cambios",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="es_vista_previa",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="vista_previa",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="aplicaciones",
+                to="equipos.importjob",
+            ),
+        ),
+    ]
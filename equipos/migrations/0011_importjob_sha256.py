@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0010_importjob_vista_previa"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="sha256",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0011_importjob_sha256"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="forzar",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="importlog",
+            name="archivo_sha256",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="importlog",
+            name="archivo_tamano",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="importlog",
+            name="modo",
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
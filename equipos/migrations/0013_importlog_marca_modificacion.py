@@ -0,0 +1,28 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0012_importlog_archivo_sha256"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="incremental",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="importlog",
+            name="incremental_desde",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="importlog",
+            name="marca_modificacion",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
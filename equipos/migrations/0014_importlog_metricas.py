@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0013_importlog_marca_modificacion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importlog",
+            name="metricas",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-17 02:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0014_importlog_metricas"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="checkpoint",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="chunk_size",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
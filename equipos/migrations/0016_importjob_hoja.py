@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-17 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0015_importjob_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="hoja",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
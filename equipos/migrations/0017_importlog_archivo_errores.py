@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-17 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0016_importjob_hoja"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importlog",
+            name="archivo_errores",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.11 on 2026-10-17 02:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0018_importlock"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="auditlog",
+            name="cambios",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="auditlog",
+            name="import_log",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="audit_logs",
+                to="equipos.importlog",
+            ),
+        ),
+        migrations.AddField(
+            model_name="auditlog",
+            name="lote",
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,192 @@
+# Generated by Django 4.2.11 on 2026-10-17 02:53
+
+from django.db import DatabaseError, migrations, models
+import django.db.models.deletion
+
+# El SQL del índice queda fijo aquí tal como era al crear la migración; inventario.busqueda
+# puede cambiar después sin alterar lo que hace esta migración.
+COLUMNAS = (
+    "identificador, clave, numero_inventario, numero_serie, direccion_ip, direccion_mac, "
+    "rpe_responsable, nombre_responsable, modelo, marca, nombre"
+)
+VIGILADAS = (
+    "identificador, clave, numero_inventario, numero_serie, direccion_ip, direccion_mac, "
+    "rpe_responsable, nombre_responsable, nombre, modelo_id, marca_id"
+)
+
+
+def _valores(fila):
+    return (
+        f"{fila}.identificador, {fila}.clave, {fila}.numero_inventario, {fila}.numero_serie, "
+        f"{fila}.direccion_ip, {fila}.direccion_mac, {fila}.rpe_responsable, {fila}.nombre_responsable, "
+        f"(SELECT nombre FROM equipos_modeloequipo WHERE id = {fila}.modelo_id), "
+        f"(SELECT nombre FROM equipos_marca WHERE id = {fila}.marca_id), {fila}.nombre"
+    )
+
+
+def _cambio(old, new, distinto):
+    return " OR ".join(f"{old}.{columna} {distinto} {new}.{columna}" for columna in VIGILADAS.split(", "))
+
+
+FTS_CREAR = (
+    f"CREATE VIRTUAL TABLE equipos_equipobusqueda USING fts5({COLUMNAS}, tokenize = 'trigram')",
+    "INSERT INTO equipos_equipobusqueda (equipos_equipobusqueda, rank) "
+    "VALUES ('rank', 'bm25(10.0, 4.0, 8.0, 8.0, 4.0, 4.0, 3.0, 2.0, 2.0, 2.0, 3.0)')",
+)
+FTS_TRIGGERS = (
+    f"""
+CREATE TRIGGER IF NOT EXISTS equipos_equipobusqueda_ai AFTER INSERT ON equipos_equipo BEGIN
+    INSERT INTO equipos_equipobusqueda (rowid, {COLUMNAS}) VALUES (new.id, {_valores("new")});
+END
+""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS equipos_equipobusqueda_au AFTER UPDATE OF {VIGILADAS} ON equipos_equipo
+WHEN {_cambio("old", "new", "IS NOT")} BEGIN
+    DELETE FROM equipos_equipobusqueda WHERE rowid = old.id;
+    INSERT INTO equipos_equipobusqueda (rowid, {COLUMNAS}) VALUES (new.id, {_valores("new")});
+END
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS equipos_equipobusqueda_ad AFTER DELETE ON equipos_equipo BEGIN
+    DELETE FROM equipos_equipobusqueda WHERE rowid = old.id;
+END
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS equipos_equipobusqueda_marca AFTER UPDATE OF nombre ON equipos_marca BEGIN
+    UPDATE equipos_equipobusqueda SET marca = new.nombre
+    WHERE rowid IN (SELECT id FROM equipos_equipo WHERE marca_id = new.id);
+END
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS equipos_equipobusqueda_modelo AFTER UPDATE OF nombre ON equipos_modeloequipo BEGIN
+    UPDATE equipos_equipobusqueda SET modelo = new.nombre
+    WHERE rowid IN (SELECT id FROM equipos_equipo WHERE modelo_id = new.id);
+END
+""",
+)
+FTS_LLENAR = f"INSERT INTO equipos_equipobusqueda (rowid, {COLUMNAS}) SELECT e.id, {_valores('e')} FROM equipos_equipo e"
+FTS_ELIMINAR = (
+    "DROP TRIGGER IF EXISTS equipos_equipobusqueda_ai",
+    "DROP TRIGGER IF EXISTS equipos_equipobusqueda_au",
+    "DROP TRIGGER IF EXISTS equipos_equipobusqueda_ad",
+    "DROP TRIGGER IF EXISTS equipos_equipobusqueda_marca",
+    "DROP TRIGGER IF EXISTS equipos_equipobusqueda_modelo",
+    "DROP TABLE IF EXISTS equipos_equipobusqueda",
+)
+
+PG_CREAR = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE TABLE IF NOT EXISTS equipos_equipobusqueda (rowid bigint PRIMARY KEY, documento text NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS equipos_equipobusqueda_trgm ON equipos_equipobusqueda USING gin (documento gin_trgm_ops)",
+    f"""
+CREATE OR REPLACE FUNCTION equipos_equipobusqueda_equipo() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM equipos_equipobusqueda WHERE rowid = OLD.id;
+        RETURN OLD;
+    END IF;
+    INSERT INTO equipos_equipobusqueda (rowid, documento) VALUES (NEW.id, concat_ws(chr(31), {_valores("new")}))
+    ON CONFLICT (rowid) DO UPDATE SET documento = excluded.documento;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""",
+    f"""
+CREATE OR REPLACE FUNCTION equipos_equipobusqueda_catalogo() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO equipos_equipobusqueda (rowid, documento)
+    SELECT e.id, concat_ws(chr(31), {_valores("e")}) FROM equipos_equipo e
+    WHERE (TG_TABLE_NAME = 'equipos_marca' AND e.marca_id = NEW.id)
+       OR (TG_TABLE_NAME = 'equipos_modeloequipo' AND e.modelo_id = NEW.id)
+    ON CONFLICT (rowid) DO UPDATE SET documento = excluded.documento;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE OR REPLACE FUNCTION equipos_equipobusqueda_vaciar() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM equipos_equipobusqueda;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""",
+    "CREATE TRIGGER equipos_equipobusqueda_ai AFTER INSERT OR DELETE ON equipos_equipo "
+    "FOR EACH ROW EXECUTE FUNCTION equipos_equipobusqueda_equipo()",
+    f"CREATE TRIGGER equipos_equipobusqueda_au AFTER UPDATE OF {VIGILADAS} ON equipos_equipo "
+    f"FOR EACH ROW WHEN ({_cambio('OLD', 'NEW', 'IS DISTINCT FROM')}) EXECUTE FUNCTION equipos_equipobusqueda_equipo()",
+    "CREATE TRIGGER equipos_equipobusqueda_at AFTER TRUNCATE ON equipos_equipo "
+    "FOR EACH STATEMENT EXECUTE FUNCTION equipos_equipobusqueda_vaciar()",
+    "CREATE TRIGGER equipos_equipobusqueda_marca AFTER UPDATE OF nombre ON equipos_marca "
+    "FOR EACH ROW EXECUTE FUNCTION equipos_equipobusqueda_catalogo()",
+    "CREATE TRIGGER equipos_equipobusqueda_modelo AFTER UPDATE OF nombre ON equipos_modeloequipo "
+    "FOR EACH ROW EXECUTE FUNCTION equipos_equipobusqueda_catalogo()",
+    f"INSERT INTO equipos_equipobusqueda (rowid, documento) "
+    f"SELECT e.id, concat_ws(chr(31), {_valores('e')}) FROM equipos_equipo e",
+)
+PG_ELIMINAR = (
+    "DROP TABLE IF EXISTS equipos_equipobusqueda",
+    "DROP FUNCTION IF EXISTS equipos_equipobusqueda_equipo() CASCADE",
+    "DROP FUNCTION IF EXISTS equipos_equipobusqueda_catalogo() CASCADE",
+    "DROP FUNCTION IF EXISTS equipos_equipobusqueda_vaciar() CASCADE",
+)
+
+
+def crear_indice(apps, schema_editor):
+    # Sin soporte (otra base, o SQLite anterior a 3.34 o sin FTS5) no se crea nada y la
+    # búsqueda sigue con icontains.
+    conexion = schema_editor.connection
+    with conexion.cursor() as cursor:
+        if conexion.vendor == "postgresql":
+            for sentencia in PG_CREAR:
+                cursor.execute(sentencia)
+            return
+        if conexion.vendor != "sqlite" or conexion.Database.sqlite_version_info < (3, 34, 0):
+            return
+        try:
+            cursor.execute(FTS_CREAR[0])
+        except DatabaseError:
+            return
+        for sentencia in FTS_CREAR[1:] + FTS_TRIGGERS:
+            cursor.execute(sentencia)
+        cursor.execute(FTS_LLENAR)
+
+
+def eliminar_indice(apps, schema_editor):
+    conexion = schema_editor.connection
+    if conexion.vendor not in ("postgresql", "sqlite"):
+        return
+    with conexion.cursor() as cursor:
+        for sentencia in PG_ELIMINAR if conexion.vendor == "postgresql" else FTS_ELIMINAR:
+            cursor.execute(sentencia)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0019_auditlog_importacion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EquipoBusqueda",
+            fields=[
+                (
+                    "equipo",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="busqueda",
+                        serialize=False,
+                        to="equipos.equipo",
+                    ),
+                ),
+            ],
+            options={
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
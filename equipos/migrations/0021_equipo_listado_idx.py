@@ -0,0 +1,20 @@
+# Generated by Django 4.2.11 on 2026-10-17 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0020_equipobusqueda"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="equipo",
+            index=models.Index(
+                fields=["-actualizado_en", "identificador", "id"],
+                name="equipo_listado_idx",
+            ),
+        ),
+    ]
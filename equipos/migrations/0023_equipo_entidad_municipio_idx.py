@@ -0,0 +1,21 @@
+# Generated by Django 4.2.11 on 2026-10-17 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipos", "0022_versioninventario"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="equipo",
+            index=models.Index(fields=["entidad"], name="equipo_entidad_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="equipo",
+            index=models.Index(fields=["municipio"], name="equipo_municipio_idx"),
+        ),
+    ]
@@ -1,6 +1,45 @@
+import hashlib
+
 from django.db import models
 from django.utils import timezone
 
+EQUIPO_IMPORT_FIELDS = [
+    "centro_costo",
+    "clave",
+    "numero_inventario",
+    "nombre",
+    "numero_serie",
+    "marca",
+    "sistema_operativo",
+    "tipo_equipo",
+    "modelo",
+    "codigo_postal",
+    "domicilio",
+    "antiguedad",
+    "rpe_responsable",
+    "nombre_responsable",
+    "infraestructura_critica",
+    "direccion_ip",
+    "direccion_mac",
+    "entidad",
+    "municipio",
+]
+
+
+def calcular_import_hash(valores):
+    # Las llaves foráneas pueden venir como instancia o como id; se comparan por pk. Un
+    # catálogo aún sin guardar no tiene pk y se confundiría con una llave vacía: ahí no hay
+    # huella (None no coincide con ninguna guardada) y la fila se compara campo por campo.
+    partes = []
+    for campo in EQUIPO_IMPORT_FIELDS:
+        valor = valores.get(campo)
+        if isinstance(valor, models.Model):
+            if valor.pk is None:
+                return None
+            valor = valor.pk
+        partes.append("" if valor is None else str(valor))
+    return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
 
 class Sociedad(models.Model):
     nombre = models.CharField(max_length=150)
@@ -97,6 +136,7 @@ class Equipo(models.Model):
     rpe_responsable = models.CharField(max_length=15, blank=True, null=True)
     nombre_responsable = models.CharField(max_length=150, blank=True, null=True)
     infraestructura_critica = models.BooleanField(default=False)
+    import_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     class Meta:
         constraints = [
@@ -107,10 +147,42 @@ class Equipo(models.Model):
                 name="unique_numero_inventario_nonempty",
             )
         ]
+        # Mismo orden que equipos.paginacion.ORDEN_LISTADO, para la paginación por cursor.
+        # entidad y municipio: filtros de la lista y opciones de sus selects
+        # (inventario.opciones).
+        indexes = [
+            models.Index(fields=["-actualizado_en", "identificador", "id"], name="equipo_listado_idx"),
+            models.Index(fields=["entidad"], name="equipo_entidad_idx"),
+            models.Index(fields=["municipio"], name="equipo_municipio_idx"),
+        ]
 
     def __str__(self):
         return f"{self.nombre} ({self.numero_serie})"
 
+    def valores_importacion(self):
+        valores = {}
+        for campo in EQUIPO_IMPORT_FIELDS:
+            field = self._meta.get_field(campo)
+            if field.is_relation:
+                relacionado = field.get_cached_value(self, None)
+                valores[campo] = relacionado if relacionado is not None else getattr(self, field.attname)
+            else:
+                valores[campo] = getattr(self, campo)
+        return valores
+
+    def calcular_import_hash(self):
+        return calcular_import_hash(self.valores_importacion())
+
+    def save(self, *args, **kwargs):
+        # La huella permite a la importación CSV detectar filas sin cambios, así que se
+        # recalcula en cualquier guardado que toque los campos importados.
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or set(update_fields) & set(EQUIPO_IMPORT_FIELDS):
+            self.import_hash = self.calcular_import_hash()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "import_hash"}
+        super().save(*args, **kwargs)
+
     def registrar_baja(self, tipo_baja, usuario=None, resumen=None, motivo=None, comentarios=None):
         self.is_baja = True
         self.fecha_baja = timezone.now()
@@ -140,21 +212,155 @@ class Equipo(models.Model):
         )
 
 
+class EquipoBusqueda(models.Model):
+    # Índice del filtro de texto (FTS5 en SQLite, trigramas en PostgreSQL). La tabla y los
+    # triggers que la sincronizan los crea inventario.busqueda; el modelo solo sirve para
+    # unirla a Equipo en las consultas.
+    equipo = models.OneToOneField(
+        Equipo,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        related_name="busqueda",
+    )
+
+    class Meta:
+        managed = False
+
+
 class ImportLog(models.Model):
     fecha = models.DateTimeField(auto_now_add=True)
     usuario = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True)
     archivo = models.CharField(max_length=255)
+    archivo_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    archivo_tamano = models.PositiveBigIntegerField(default=0)
+    modo = models.CharField(max_length=20, blank=True)
     total_filas = models.PositiveIntegerField(default=0)
     creados = models.PositiveIntegerField(default=0)
     actualizados = models.PositiveIntegerField(default=0)
+    sin_cambios = models.PositiveIntegerField(default=0)
     omitidos = models.PositiveIntegerField(default=0)
     errores = models.PositiveIntegerField(default=0)
+    # Muestra de errores; la lista completa está en archivo_errores (CSV con gzip).
     resumen_errores = models.JSONField(blank=True, null=True)
+    archivo_errores = models.CharField(max_length=255, blank=True)
+    # Mayor "Modificación" del CSV ya aplicada; la siguiente importación incremental
+    # salta las filas anteriores a esta marca.
+    marca_modificacion = models.DateTimeField(null=True, blank=True)
+    incremental_desde = models.DateTimeField(null=True, blank=True)
+    # Tiempos por fase, consultas y pico de memoria (ver inventario.metrics.ImportMetrics).
+    metricas = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Importación {self.fecha:%Y-%m-%d %H:%M}"
 
 
+class ImportJob(models.Model):
+    class Estado(models.TextChoices):
+        PENDIENTE = "PENDIENTE", "Pendiente"
+        EN_PROCESO = "EN_PROCESO", "En proceso"
+        COMPLETADO = "COMPLETADO", "Completado"
+        ERROR = "ERROR", "Error"
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+    usuario = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True)
+    archivo = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, blank=True)
+    modo = models.CharField(max_length=20)
+    forzar = models.BooleanField(default=False)
+    incremental = models.BooleanField(default=False)
+    # Hoja a leer cuando el archivo es .xlsx (nombre o número desde 1; vacía es la primera).
+    hoja = models.CharField(max_length=100, blank=True)
+    estado = models.CharField(
+        max_length=20,
+        choices=Estado.choices,
+        default=Estado.PENDIENTE,
+        db_index=True,
+    )
+    fase = models.CharField(max_length=30, blank=True)
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    filas_estimadas = models.PositiveIntegerField(default=0)
+    filas_por_segundo = models.FloatField(default=0)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    finalizado_en = models.DateTimeField(null=True, blank=True)
+    mensaje = models.TextField(blank=True)
+    resultados = models.JSONField(blank=True, null=True)
+    es_vista_previa = models.BooleanField(default=False)
+    # Operaciones calculadas por la vista previa; confirmarla las aplica tal cual.
+    cambios = models.JSONField(blank=True, null=True)
+    # Con chunk_size la importación hace commit cada N filas y deja en checkpoint el
+    # offset y los conteos del último bloque confirmado, para reanudarla si falla.
+    chunk_size = models.PositiveIntegerField(null=True, blank=True)
+    checkpoint = models.JSONField(blank=True, null=True)
+    vista_previa = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="aplicaciones",
+    )
+    import_log = models.ForeignKey(
+        ImportLog,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="jobs",
+    )
+
+    @property
+    def terminado(self):
+        return self.estado in {self.Estado.COMPLETADO, self.Estado.ERROR}
+
+    @property
+    def puede_confirmarse(self):
+        return (
+            self.es_vista_previa
+            and self.estado == self.Estado.COMPLETADO
+            and self.cambios is not None
+            and not self.aplicaciones.exists()
+        )
+
+    @property
+    def puede_reanudarse(self):
+        return self.estado == self.Estado.ERROR and bool(self.checkpoint)
+
+    def __str__(self):
+        return f"Importación #{self.pk} ({self.get_estado_display()})"
+
+
+class ImportLock(models.Model):
+    # Una fila por candado; token vacío significa libre. Quien lo toma guarda host y pid
+    # para que otro proceso del mismo equipo detecte un dueño que ya murió, y renueva
+    # latido para que lo detecten desde otros equipos.
+    nombre = models.CharField(max_length=50, unique=True)
+    token = models.CharField(max_length=32, blank=True)
+    propietario = models.CharField(max_length=200, blank=True)
+    usuario = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True)
+    job = models.ForeignKey(ImportJob, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    host = models.CharField(max_length=255, blank=True)
+    pid = models.PositiveIntegerField(null=True, blank=True)
+    adquirido_en = models.DateTimeField(null=True, blank=True)
+    latido = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def ocupado(self):
+        return bool(self.token)
+
+    def __str__(self):
+        return f"{self.nombre}: {self.propietario or 'libre'}"
+
+
+class VersionInventario(models.Model):
+    # Contador que sube con cada transacción que escribe equipos (ver inventario.conteos).
+    # Las llaves de la caché de conteos lo incluyen, así que subirlo las invalida todas.
+    nombre = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.nombre}: {self.version}"
+
+
 class AuditLog(models.Model):
     fecha = models.DateTimeField(auto_now_add=True)
     usuario = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True)
@@ -167,6 +373,17 @@ class AuditLog(models.Model):
         blank=True,
         related_name="audit_logs",
     )
+    # Registros por equipo de una importación: cambios es {campo: [antes, después]} y
+    # lote los identifica hasta que registrar_importacion los liga a su ImportLog.
+    import_log = models.ForeignKey(
+        ImportLog,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="audit_logs",
+    )
+    cambios = models.JSONField(blank=True, null=True)
+    lote = models.CharField(max_length=32, blank=True, db_index=True)
 
     def __str__(self):
         return f"{self.accion} {self.fecha:%Y-%m-%d %H:%M}"
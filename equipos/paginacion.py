@@ -0,0 +1,111 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+# Orden del listado de equipos; identificador ya es único, id solo asegura el desempate.
+ORDEN_LISTADO = ("-actualizado_en", "identificador", "id")
+CURSOR_ULTIMA = "ultima"
+
+
+def codificar_cursor(direccion, equipo):
+    datos = [direccion, equipo.actualizado_en.isoformat(), equipo.identificador, equipo.pk]
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(valor):
+    # Devuelve (dirección, actualizado_en, identificador, id) o None si el cursor no es válido.
+    if valor == CURSOR_ULTIMA:
+        return (CURSOR_ULTIMA, None, None, None)
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(valor + "=" * (-len(valor) % 4)))
+        direccion, actualizado_en, identificador, pk = datos
+        if direccion not in {"sig", "ant"}:
+            return None
+        return (direccion, datetime.fromisoformat(actualizado_en), str(identificador), int(pk))
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def _despues_de(actualizado_en, identificador, pk):
+    # Filas que van después de la clave en ORDEN_LISTADO. El primer término acota un rango
+    # del índice compuesto, así la consulta salta directo a la posición en vez de recorrer.
+    return Q(actualizado_en__lte=actualizado_en) & (
+        Q(actualizado_en__lt=actualizado_en)
+        | Q(actualizado_en=actualizado_en, identificador__gt=identificador)
+        | Q(actualizado_en=actualizado_en, identificador=identificador, id__gt=pk)
+    )
+
+
+def _antes_de(actualizado_en, identificador, pk):
+    return Q(actualizado_en__gte=actualizado_en) & (
+        Q(actualizado_en__gt=actualizado_en)
+        | Q(actualizado_en=actualizado_en, identificador__lt=identificador)
+        | Q(actualizado_en=actualizado_en, identificador=identificador, id__lt=pk)
+    )
+
+
+class PaginaCursor:
+    # Misma interfaz que usa la plantilla de un Page de Paginator, sin número de página.
+    def __init__(self, object_list, anterior=None, siguiente=None, es_primera=False, es_ultima=False):
+        self.object_list = object_list
+        self.cursor_anterior = anterior
+        self.cursor_siguiente = siguiente
+        self.es_primera = es_primera
+        self.es_ultima = es_ultima
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+def paginar_por_cursor(equipos, cursor, por_pagina):
+    # Paginación por llave (keyset) sobre ORDEN_LISTADO: cada página se pide por la última
+    # fila vista, así las páginas profundas cuestan lo mismo que la primera y una
+    # importación que toca actualizado_en no corre filas entre páginas ya mostradas.
+    equipos = equipos.order_by(*ORDEN_LISTADO)
+    posicion = decodificar_cursor(cursor) if cursor else None
+    direccion = posicion[0] if posicion else "sig"
+    if direccion == "sig":
+        if posicion:
+            equipos = equipos.filter(_despues_de(*posicion[1:]))
+        filas = list(equipos[: por_pagina + 1])
+        hay_mas = len(filas) > por_pagina
+        filas = filas[:por_pagina]
+        anterior = codificar_cursor("ant", filas[0]) if posicion and filas else None
+        siguiente = codificar_cursor("sig", filas[-1]) if hay_mas else None
+        return PaginaCursor(filas, anterior, siguiente, es_primera=not posicion, es_ultima=not hay_mas)
+
+    invertido = equipos.reverse()
+    if direccion == "ant":
+        invertido = invertido.filter(_antes_de(*posicion[1:]))
+    filas = list(invertido[: por_pagina + 1])
+    hay_mas = len(filas) > por_pagina
+    if direccion == "ant" and not hay_mas:
+        # Se llegó al inicio: se muestra la primera página completa.
+        return paginar_por_cursor(equipos, None, por_pagina)
+    filas = filas[:por_pagina][::-1]
+    anterior = codificar_cursor("ant", filas[0]) if hay_mas else None
+    siguiente = codificar_cursor("sig", filas[-1]) if direccion == "ant" and filas else None
+    return PaginaCursor(filas, anterior, siguiente, es_primera=not hay_mas, es_ultima=direccion == CURSOR_ULTIMA)
+
+
+class PaginatorConTotal(Paginator):
+    # Paginator con el total ya calculado, por ejemplo desde la caché de conteos.
+    def __init__(self, object_list, per_page, total):
+        super().__init__(object_list, per_page)
+        self.count = total
@@ -0,0 +1,1443 @@
+import contextlib
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from equipos.models import (
+    AuditLog,
+    CentroCosto,
+    Division,
+    Equipo,
+    EquipoBusqueda,
+    ImportJob,
+    ImportLock,
+    ImportLog,
+    Marca,
+    ModeloEquipo,
+    SistemaOperativo,
+    Sociedad,
+)
+from equipos.paginacion import CURSOR_ULTIMA, ORDEN_LISTADO, paginar_por_cursor
+from inventario.busqueda import buscar_equipos, filtro_texto, indice_disponible, instalar_indice
+from inventario.facetas import FACETAS, PresupuestoAgotado, facetas_equipos
+from inventario.importer import (
+    BulkEquipoWriter,
+    CacheNormalizacion,
+    CargadorEquipos,
+    CatalogResolver,
+    ChangeSet,
+    ERRORS_LIMIT,
+    HeaderMap,
+    ResumenEquipo,
+    aplicar_cambios,
+    import_inventario_csv,
+    parse_row,
+    resumen_equipo,
+)
+from inventario.jobs import (
+    claim_job,
+    confirmar_vista_previa,
+    enqueue_import,
+    estimar_filas,
+    find_watermark,
+    limpiar_archivos_importacion,
+    next_pending_job,
+    reanudar_importacion,
+    registrar_importacion,
+    run_import_job,
+)
+from inventario.locks import HOST, IMPORT_LOCK, ImportacionEnCurso, adquirir_lock, bloqueo_importacion, lock_actual
+from inventario.metrics import PhaseTimer
+from inventario.opciones import opciones_filtros
+from inventario.staging import import_inventario_staging
+from inventario.synthetic import InventoryGenerator
+from inventario.uploads import file_sha256, save_import_stream
+
+ENCABEZADO = [
+    "Número de inventario*",
+    "Número de serie*",
+    "Nombre",
+    "Sociedad",
+    "División",
+    "Centro de Costo",
+    "Marca*",
+    "Sistema operativo*",
+    "Modificación",
+]
+
+
+CONTEOS = ("total", "creados", "actualizados", "sin_cambios", "omitidos", "errores")
+ESCRITURAS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def fila(inventario, serie, marca="", nombre=None, sistema="", modificacion="", centro="C1"):
+    return [inventario, serie, nombre or f"EQ {serie}", "S1", "D1", centro, marca, sistema, modificacion]
+
+
+class ImportacionMixin:
+    def setUp(self):
+        self.directorio = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        sociedad = Sociedad.objects.create(codigo="S1", nombre="Sociedad 1")
+        division = Division.objects.create(sociedad=sociedad, codigo="D1", nombre="División 1")
+        self.centro_costo = CentroCosto.objects.create(division=division, codigo="C1", nombre="C1")
+
+    def escribir_csv(self, filas, nombre="inventario.csv", encabezado=ENCABEZADO):
+        ruta = self.directorio / nombre
+        with open(ruta, "w", newline="", encoding="utf-8") as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(encabezado)
+            escritor.writerows(filas)
+        return ruta
+
+    def crear_equipo(self, inventario, serie, **valores):
+        return Equipo.objects.create(
+            identificador=inventario or serie,
+            numero_inventario=inventario,
+            numero_serie=serie,
+            nombre=valores.pop("nombre", f"EQ {serie}"),
+            centro_costo=self.centro_costo,
+            **valores,
+        )
+
+    def estado(self):
+        return list(
+            Equipo.objects.order_by("numero_serie").values_list(
+                "identificador",
+                "numero_serie",
+                "numero_inventario",
+                "nombre",
+                "centro_costo__codigo",
+                "marca__nombre",
+                "sistema_operativo__nombre",
+            )
+        )
+
+    def importar_y_revertir(self, ruta, modo="update_create", importar=import_inventario_csv, **opciones):
+        # Importa dentro de un savepoint y lo revierte, así cada modo parte de la misma base.
+        with transaction.atomic():
+            resultados, errores = importar(ruta, modo, **opciones)
+            estado = self.estado()
+            transaction.set_rollback(True)
+        conteos = {campo: resultados[campo] for campo in CONTEOS}
+        return conteos, [(error["fila"], error["mensaje"]) for error in errores], estado
+
+
+class ImportacionTestCase(ImportacionMixin, TestCase):
+    pass
+
+
+class HuellaImportacionTests(ImportacionTestCase):
+    def test_catalogo_nuevo_en_equipo_sin_marca_se_actualiza_en_todos_los_modos(self):
+        # Un catálogo diferido aún no tiene pk; su huella no debe confundirse con marca vacía.
+        for opciones in ({}, {"batch_size": 100}):
+            with self.subTest(**opciones):
+                Equipo.objects.all().delete()
+                self.crear_equipo("INV1", "SER1")
+                ruta = self.escribir_csv([fila("INV1", "SER1", marca=f"Marca {len(opciones)}")])
+                resultados, _ = import_inventario_csv(ruta, "update_create", **opciones)
+                equipo = Equipo.objects.select_related("marca").get()
+                self.assertEqual((resultados["actualizados"], resultados["sin_cambios"]), (1, 0))
+                self.assertEqual(equipo.marca.nombre, f"Marca {len(opciones)}")
+                self.assertEqual(equipo.import_hash, equipo.calcular_import_hash())
+
+    def test_catalogo_nuevo_en_equipo_sin_marca_aparece_en_la_vista_previa(self):
+        self.crear_equipo("INV1", "SER1")
+        ruta = self.escribir_csv([fila("INV1", "SER1", marca="Marca nueva")])
+        cambios = ChangeSet("update_create")
+        resultados, _ = import_inventario_csv(ruta, "update_create", preview=cambios)
+        self.assertEqual((resultados["actualizados"], resultados["sin_cambios"]), (1, 0))
+        self.assertEqual(cambios.operaciones[0]["cambios"]["marca"], [None, "Marca nueva"])
+
+    def test_reimportar_el_mismo_archivo_no_escribe_equipos(self):
+        ruta = self.escribir_csv([fila(f"INV{numero}", f"SER{numero}", marca="HP") for numero in range(4)])
+        import_inventario_csv(ruta, "update_create")
+        self.assertTrue(all(equipo.import_hash == equipo.calcular_import_hash() for equipo in Equipo.objects.all()))
+        for opciones in ({}, {"batch_size": 100}):
+            with self.subTest(**opciones):
+                with CaptureQueriesContext(connection) as consultas:
+                    resultados, _ = import_inventario_csv(ruta, "update_create", **opciones)
+                self.assertEqual((resultados["actualizados"], resultados["sin_cambios"]), (0, 4))
+                escrituras = [
+                    consulta["sql"] for consulta in consultas if consulta["sql"].startswith('UPDATE "equipos_equipo"')
+                ]
+                self.assertEqual(escrituras, [])
+
+    def test_guardar_recalcula_la_huella(self):
+        equipo = self.crear_equipo("INV1", "SER1")
+        huella = equipo.import_hash
+        equipo.nombre = "Otro nombre"
+        equipo.save(update_fields=["nombre"])
+        equipo.refresh_from_db()
+        self.assertNotEqual(equipo.import_hash, huella)
+        self.assertEqual(equipo.import_hash, equipo.calcular_import_hash())
+
+        ruta = self.escribir_csv([fila("INV1", "SER1")])
+        resultados, _ = import_inventario_csv(ruta, "update_create", batch_size=100)
+        self.assertEqual(resultados["actualizados"], 1)
+        self.assertEqual(Equipo.objects.get().nombre, "EQ SER1")
+
+
+class VistaPreviaTests(ImportacionTestCase):
+    def test_vista_previa_que_reasigna_un_inventario_liberado_no_escribe(self):
+        # La fila 2 toma el inventario que libera la fila 1: el modo por lotes escribe lo
+        # pendiente en ese punto, pero la vista previa no debe tocar la base.
+        self.crear_equipo("INV1", "SER1")
+        self.crear_equipo("INV2", "SER2")
+        ruta = self.escribir_csv(
+            [
+                fila("INV3", "SER1", marca="Marca nueva"),
+                fila("INV1", "SER2", marca="Marca nueva"),
+            ]
+        )
+        cambios = ChangeSet("update_create")
+        resultados, errores = import_inventario_csv(ruta, "update_create", preview=cambios)
+        self.assertEqual((resultados["actualizados"], resultados["errores"]), (2, 0))
+        self.assertFalse(Marca.objects.exists())
+        self.assertEqual(
+            dict(Equipo.objects.values_list("numero_serie", "numero_inventario")),
+            {"SER1": "INV1", "SER2": "INV2"},
+        )
+        self.assertEqual(cambios.catalogos()["marca"], ["Marca nueva"])
+
+        resultados, _ = aplicar_cambios(cambios.as_dict(resultados, errores))
+        self.assertEqual((resultados["actualizados"], resultados["errores"]), (2, 0))
+        self.assertEqual(
+            dict(Equipo.objects.values_list("numero_serie", "numero_inventario")),
+            {"SER1": "INV3", "SER2": "INV1"},
+        )
+        self.assertEqual(set(Equipo.objects.values_list("marca__nombre", flat=True)), {"Marca nueva"})
+
+    def test_vista_previa_coincide_con_la_importacion_y_no_escribe(self):
+        self.crear_equipo("INV1", "SER1")
+        self.crear_equipo("INV2", "SER2", nombre="Sin cambios")
+        ruta = self.escribir_csv(
+            [
+                fila("INV1", "SER1", nombre="Renombrado", marca="HP", sistema="Windows 11"),
+                fila("INV2", "SER2", nombre="Sin cambios"),
+                fila("INV3", "SER3", marca="HP", centro="C7"),
+                fila("INV3", "SER4"),
+                fila("INV5", ""),
+                fila("INV6", "SER3", nombre="Alta corregida", marca="HP"),
+            ]
+        )
+        antes = self.estado()
+        cambios = ChangeSet("update_create")
+        with CaptureQueriesContext(connection) as consultas:
+            resultados, errores = import_inventario_csv(ruta, "update_create", preview=cambios)
+        escrituras = [consulta["sql"] for consulta in consultas if consulta["sql"].split()[0] in ESCRITURAS]
+        self.assertEqual(escrituras, [])
+        self.assertEqual(self.estado(), antes)
+
+        esperado = self.importar_y_revertir(ruta, batch_size=100)
+        self.assertEqual({campo: resultados[campo] for campo in CONTEOS}, esperado[0])
+        self.assertEqual([(error["fila"], error["mensaje"]) for error in errores], esperado[1])
+        aplicados, _ = aplicar_cambios(cambios.as_dict(resultados, errores))
+        self.assertEqual(
+            (aplicados["creados"], aplicados["actualizados"]), (esperado[0]["creados"], esperado[0]["actualizados"])
+        )
+        self.assertEqual(self.estado(), esperado[2])
+
+    def test_aplicar_rechaza_equipos_modificados_despues_de_la_vista_previa(self):
+        equipo = self.crear_equipo("INV1", "SER1")
+        ruta = self.escribir_csv([fila("INV1", "SER1", nombre="Desde el archivo")])
+        cambios = ChangeSet("update_create")
+        resultados, errores = import_inventario_csv(ruta, "update_create", preview=cambios)
+        equipo.nombre = "Editado a mano"
+        equipo.save()
+        aplicados, errores = aplicar_cambios(cambios.as_dict(resultados, errores))
+        self.assertEqual((aplicados["actualizados"], aplicados["errores"]), (0, 1))
+        self.assertEqual(errores[0]["mensaje"], "El equipo cambió después de la vista previa.")
+        self.assertEqual(Equipo.objects.get().nombre, "Editado a mano")
+
+
+class ConteoListaTests(ImportacionTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "clave"))
+        for numero in range(60):
+            self.crear_equipo(f"INV{numero}", f"SER{numero}")
+
+    def test_el_total_solo_se_calcula_a_pedido(self):
+        respuesta = self.client.get(reverse("equipos_list"))
+        self.assertIsNone(respuesta.context["total_encontrados"])
+        self.assertContains(respuesta, "Contar resultados")
+
+        respuesta = self.client.get(reverse("equipos_list"), {"conteo": "1"})
+        self.assertEqual((respuesta.context["total_encontrados"], respuesta.context["conteo_aproximado"]), (60, False))
+
+        # Ya en caché, el total se muestra sin pedirlo.
+        respuesta = self.client.get(reverse("equipos_list"))
+        self.assertEqual(respuesta.context["total_encontrados"], 60)
+
+    @override_settings(EQUIPOS_CONTEO_EXACTO_HASTA=10)
+    def test_tabla_grande_estima_y_cuenta_exacto_a_pedido(self):
+        respuesta = self.client.get(reverse("equipos_list"), {"conteo": "1"})
+        self.assertTrue(respuesta.context["conteo_aproximado"])
+        self.assertContains(respuesta, "Contar exacto")
+        self.assertIsNone(self.client.get(reverse("equipos_list")).context["total_encontrados"])
+
+        respuesta = self.client.get(reverse("equipos_list"), {"conteo": "exacto"})
+        self.assertEqual((respuesta.context["total_encontrados"], respuesta.context["conteo_aproximado"]), (60, False))
+
+
+class ArchivosImportacionTests(ImportacionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.subidas = self.directorio / "subidas"
+        self.errores = self.directorio / "errores"
+        ajustes = override_settings(IMPORT_UPLOAD_DIR=self.subidas, IMPORT_ERRORS_DIR=self.errores)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def subir(self, filas):
+        with open(self.escribir_csv(filas), "rb") as archivo:
+            ruta, sha256, _ = save_import_stream(archivo, "inventario.csv")
+        return ruta, sha256
+
+    def ejecutar(self, job):
+        return run_import_job(claim_job(job.pk))
+
+    @override_settings(IMPORT_JOBS_WORKER="command")
+    def test_la_vista_guarda_la_subida_en_disco_con_su_sha256(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "clave"))
+        ruta = self.escribir_csv([fila("INV1", "SER1")])
+        with open(ruta, "rb") as archivo:
+            respuesta = self.client.post(
+                reverse("importar"),
+                {"modo": "update_create", "archivo": archivo},
+                HTTP_ACCEPT="application/json",
+            )
+        self.assertEqual(respuesta.status_code, 202)
+        job = ImportJob.objects.get(pk=respuesta.json()["id"])
+        self.assertEqual(Path(job.archivo).parent, self.subidas)
+        self.assertEqual(Path(job.archivo).read_bytes(), ruta.read_bytes())
+        self.assertEqual(job.sha256, hashlib.sha256(ruta.read_bytes()).hexdigest())
+        self.assertEqual(list(self.subidas.glob("*.part")), [])
+
+    def test_gzip_y_zip_se_importan_igual_que_el_csv(self):
+        self.crear_equipo("INV1", "SER1")
+        ruta = self.escribir_csv([fila("INV1", "SER1", nombre="Nuevo"), fila("INV2", "SER2"), fila("INV3", "")])
+        comprimido = self.directorio / "inventario.csv.gz"
+        comprimido.write_bytes(gzip.compress(ruta.read_bytes()))
+        empacado = self.directorio / "inventario.zip"
+        with zipfile.ZipFile(empacado, "w") as archivo_zip:
+            archivo_zip.writestr("LEEME.txt", "")
+            archivo_zip.write(ruta, "inventario.csv")
+        esperado = self.importar_y_revertir(ruta)
+        for variante in (comprimido, empacado):
+            with self.subTest(variante=variante.name):
+                self.assertEqual(self.importar_y_revertir(variante), esperado)
+
+    def test_la_subida_se_borra_al_terminar_la_importacion(self):
+        ruta, sha256 = self.subir([fila("INV1", "SER1")])
+        job = self.ejecutar(enqueue_import(ruta, "update_create", sha256=sha256))
+        self.assertEqual(job.estado, ImportJob.Estado.COMPLETADO)
+        self.assertFalse(ruta.exists())
+
+        # Un archivo fuera de IMPORT_UPLOAD_DIR (CSV_INVENTARIO_PATH, el comando) no se borra.
+        ruta = self.escribir_csv([fila("INV1", "SER1")])
+        self.ejecutar(enqueue_import(ruta, "update_create", forzar=True))
+        self.assertTrue(ruta.exists())
+
+    def test_la_vista_previa_conserva_la_subida_hasta_aplicarla(self):
+        ruta, sha256 = self.subir([fila("INV1", "SER1")])
+        vista_previa = self.ejecutar(enqueue_import(ruta, "update_create", preview=True, sha256=sha256))
+        self.assertEqual(vista_previa.estado, ImportJob.Estado.COMPLETADO)
+        self.assertTrue(ruta.exists())
+        job = self.ejecutar(confirmar_vista_previa(vista_previa, encolar=False))
+        self.assertEqual(job.estado, ImportJob.Estado.COMPLETADO)
+        self.assertTrue(Equipo.objects.filter(numero_serie="SER1").exists())
+        self.assertFalse(ruta.exists())
+
+    def test_limpieza_borra_archivos_vencidos_salvo_los_de_jobs_activos(self):
+        ruta, sha256 = self.subir([fila("INV1", "")])
+        job = self.ejecutar(enqueue_import(ruta, "update_create", sha256=sha256))
+        log = job.import_log
+        self.assertEqual(log.archivo_errores, str(self.errores / f"job_{job.pk}.csv.gz"))
+        pendiente, _ = self.subir([fila("INV2", "SER2")])
+        enqueue_import(pendiente, "update_create")
+        huerfana, _ = self.subir([fila("INV3", "SER3")])
+        vencido = time.time() - 40 * 86400
+        for archivo in (Path(log.archivo_errores), pendiente, huerfana):
+            os.utime(archivo, (vencido, vencido))
+
+        self.assertEqual(limpiar_archivos_importacion(), (1, 1))
+        self.assertFalse(huerfana.exists())
+        self.assertTrue(pendiente.exists())
+        log.refresh_from_db()
+        self.assertEqual(log.archivo_errores, "")
+        self.assertTrue(log.resumen_errores)
+
+    def leer_errores(self, ruta):
+        with gzip.open(ruta, "rt", encoding="utf-8", newline="") as archivo:
+            return list(csv.reader(archivo))
+
+    def test_el_archivo_de_errores_guarda_todos_los_errores(self):
+        ruta, sha256 = self.subir([fila(f"INV{numero}", "") for numero in range(120)] + [fila("INV999", "SER1")])
+        log = self.ejecutar(enqueue_import(ruta, "update_create", sha256=sha256)).import_log
+        self.assertEqual((log.errores, len(log.resumen_errores)), (120, ERRORS_LIMIT))
+        filas = self.leer_errores(log.archivo_errores)
+        self.assertEqual(filas[0], ["fila", "identificador", "mensaje"])
+        self.assertEqual([fila_error[0] for fila_error in filas[1:]], [str(numero) for numero in range(2, 122)])
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "clave"))
+        respuesta = self.client.get(reverse("importar"), {"download": "1", "log_id": log.pk})
+        descargado = b"".join(respuesta.streaming_content).decode("utf-8")
+        self.assertEqual(list(csv.reader(io.StringIO(descargado))), filas)
+
+    @override_settings(IMPORT_JOBS_WORKER="command")
+    def test_reanudar_no_repite_errores_en_el_archivo(self):
+        filas = [fila(f"INV{numero}", f"SER{numero}" if numero % 2 else "") for numero in range(1, 9)]
+        job = enqueue_import(self.escribir_csv(filas), "update_create", chunk_size=2)
+        flush = BulkEquipoWriter.flush
+        llamadas = []
+
+        def falla_en_el_tercer_bloque(writer):
+            llamadas.append(writer)
+            if len(llamadas) == 3:
+                raise DatabaseError("disco lleno")
+            return flush(writer)
+
+        with mock.patch.object(BulkEquipoWriter, "flush", falla_en_el_tercer_bloque):
+            job = run_import_job(claim_job(job.pk), batch_size=100)
+        self.assertEqual(job.estado, ImportJob.Estado.ERROR)
+        job = run_import_job(claim_job(reanudar_importacion(job, encolar=False).pk), batch_size=100)
+        self.assertEqual(job.estado, ImportJob.Estado.COMPLETADO)
+        filas_error = [fila_error[0] for fila_error in self.leer_errores(job.import_log.archivo_errores)[1:]]
+        self.assertEqual(filas_error, ["3", "5", "7", "9"])
+        self.assertEqual(job.import_log.errores, 4)
+
+
+class EscrituraPorLotesTests(ImportacionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.crear_equipo("INV1", "SER1")
+        self.crear_equipo("INV2", "SER2")
+        self.ruta = self.escribir_csv(
+            [
+                fila("INV1", "SER1", nombre="Renombrado", marca="HP"),
+                fila("INV2", "SER2"),
+                fila("INV3", "SER3", marca="HP", sistema="Windows 10"),
+                fila("INV3", "SER4"),
+                fila("INV5", ""),
+                fila("INV6", "SER3", nombre="Alta corregida"),
+                fila("INV7", "SER5", centro="C9"),
+            ]
+        )
+
+    def test_por_lotes_y_fila_por_fila_dejan_el_mismo_inventario(self):
+        esperado = self.importar_y_revertir(self.ruta)
+        self.assertEqual(esperado[0]["creados"], 2)
+        self.assertEqual(esperado[0]["errores"], 2)
+        for batch_size in (1, 2, 1000):
+            with self.subTest(batch_size=batch_size):
+                self.assertEqual(self.importar_y_revertir(self.ruta, batch_size=batch_size), esperado)
+
+    def test_un_identificador_ocupado_es_un_error_de_fila_en_todos_los_motores(self):
+        # ABC es el identificador de un equipo sin inventario; la fila que lo toma como
+        # inventario no puede crear otro equipo con el mismo identificador.
+        self.crear_equipo("", "ABC")
+        ruta = self.escribir_csv([fila("INV8", "SER8"), fila("ABC", "SER9"), fila("INV10", "SER10")])
+        esperado = self.importar_y_revertir(ruta)
+        self.assertEqual((esperado[0]["creados"], esperado[1]), (2, [(3, "Identificador ya existe en otro equipo.")]))
+        self.assertEqual(self.importar_y_revertir(ruta, batch_size=100), esperado)
+        self.assertEqual(self.importar_y_revertir(ruta, importar=import_inventario_staging), esperado)
+
+    def test_el_motor_staging_deja_el_mismo_inventario(self):
+        for modo in ("update_create", "update_only", "create_only"):
+            with self.subTest(modo=modo):
+                self.assertEqual(
+                    self.importar_y_revertir(self.ruta, modo, importar=import_inventario_staging),
+                    self.importar_y_revertir(self.ruta, modo, batch_size=100),
+                )
+
+    def test_el_motor_staging_cuenta_las_series_repetidas_como_fila_por_fila(self):
+        ruta = self.escribir_csv(
+            [
+                fila("INV1", "SER1", nombre="Primero"),
+                fila("INV10", "SER10", marca="Dell"),
+                fila("", "SER1", nombre="Primero"),
+                fila("INV10", "SER10", marca="Dell"),
+                fila("INV11", "SER11", marca="Acer"),
+                fila("INV2", "SER2"),
+                fila("INV1", "SER1", nombre="Segundo"),
+                fila("INV11", "SER11", marca="Lenovo"),
+                fila("INV2", "SER2"),
+                fila("INV12", "SER12"),
+                fila("INV2", "SER12"),
+                fila("INV12", "SER12", nombre="Otro"),
+            ],
+            "repetidas.csv",
+        )
+        omitir = ("metricas", "lote_auditoria", "archivo_errores")
+
+        def importar(modo, funcion, **opciones):
+            with transaction.atomic():
+                resultados, errores = funcion(ruta, modo, **opciones)
+                estado = (self.estado(), sorted(Marca.objects.values_list("nombre", flat=True)))
+                transaction.set_rollback(True)
+            return {campo: valor for campo, valor in resultados.items() if campo not in omitir}, errores, estado
+
+        for modo in ("update_create", "update_only", "create_only"):
+            with self.subTest(modo=modo):
+                esperado = importar(modo, import_inventario_csv)
+                self.assertEqual(importar(modo, import_inventario_staging), esperado)
+                self.assertEqual(importar(modo, import_inventario_csv, batch_size=100), esperado)
+
+    def test_el_motor_staging_cuenta_igual_sin_series_repetidas(self):
+        ruta = self.escribir_csv(
+            [
+                fila("INV2", "SER1", marca="HP"),
+                fila("INV1", "SER2"),
+                fila("", "SER3", sistema="Linux"),
+                fila("INV1", "SER4"),
+                fila("INV9", "SER5", centro="C2"),
+            ],
+            "intercambio.csv",
+        )
+        for modo in ("update_create", "update_only", "create_only"):
+            with self.subTest(modo=modo):
+                self.assertEqual(
+                    self.importar_y_revertir(ruta, modo, importar=import_inventario_staging),
+                    self.importar_y_revertir(ruta, modo, batch_size=100),
+                )
+
+    def test_el_motor_staging_avisa_el_avance_solo_por_el_callback(self):
+        avance = []
+        salida = io.StringIO()
+        with transaction.atomic(), contextlib.redirect_stdout(salida):
+            import_inventario_staging(self.ruta, "update_create", progress=lambda *args: avance.append(args))
+            transaction.set_rollback(True)
+        self.assertEqual(avance, [("cargando", 0), ("procesando", 0), ("guardando", 7)])
+        self.assertEqual(salida.getvalue(), "")
+
+    def test_por_lotes_agrupa_las_escrituras(self):
+        ruta = self.escribir_csv([fila(f"N{numero}", f"NS{numero}", marca="HP") for numero in range(200)], "altas.csv")
+        with CaptureQueriesContext(connection) as por_lotes:
+            conteos, _, _ = self.importar_y_revertir(ruta, batch_size=100)
+        self.assertEqual(conteos["creados"], 200)
+        # Dos bulk_create de equipos más lecturas y catálogos, no una consulta por fila.
+        self.assertLess(len(por_lotes), 50)
+
+
+class CatalogResolverTests(ImportacionTestCase):
+    def test_resuelve_lo_existente_sin_consultas(self):
+        Marca.objects.create(nombre="HP")
+        resolver = CatalogResolver()
+        with self.assertNumQueries(0):
+            sociedad = resolver.sociedad("S1", "")
+            division = resolver.division(sociedad, "D1", "")
+            centro_costo = resolver.centro_costo(division, "C1", "")
+            marca = resolver.catalogo(Marca, "HP")
+        self.assertEqual(centro_costo, self.centro_costo)
+        self.assertEqual(marca.nombre, "HP")
+        self.assertIsNone(resolver.catalogo(Marca, ""))
+
+    def test_diferido_crea_cada_clave_nueva_una_vez_al_hacer_flush(self):
+        resolver = CatalogResolver(diferido=True)
+        sociedad = resolver.sociedad("S2", "Sociedad 2")
+        division = resolver.division(sociedad, "D2", "")
+        resolver.centro_costo(division, "C2", "")
+        self.assertIs(resolver.catalogo(Marca, "Dell"), resolver.catalogo(Marca, "Dell"))
+        self.assertFalse(Marca.objects.exists())
+        resolver.flush()
+        self.assertEqual(list(Marca.objects.values_list("nombre", flat=True)), ["Dell"])
+        self.assertTrue(
+            CentroCosto.objects.filter(codigo="C2", division__codigo="D2", division__sociedad__codigo="S2").exists()
+        )
+
+    def test_la_importacion_crea_catalogos_y_jerarquia_una_sola_vez(self):
+        ruta = self.escribir_csv(
+            [fila(f"INV{numero}", f"SER{numero}", marca="Lenovo", centro="C2") for numero in range(5)]
+        )
+        for opciones in ({}, {"batch_size": 2}):
+            with self.subTest(**opciones):
+                conteos, errores, estado = self.importar_y_revertir(ruta, **opciones)
+                self.assertEqual((conteos["creados"], errores), (5, []))
+                self.assertEqual({(centro, marca) for *_, centro, marca, _ in estado}, {("C2", "Lenovo")})
+        import_inventario_csv(ruta, "update_create", batch_size=2)
+        self.assertEqual(Marca.objects.count(), 1)
+        self.assertEqual(CentroCosto.objects.filter(codigo="C2").count(), 1)
+
+
+class HeaderMapTests(TestCase):
+    def test_alias_sin_acentos_ni_asteriscos(self):
+        encabezado = HeaderMap(
+            ["\ufeffNumero de Serie", " numero  de inventario* ", "Division", "Centro de costo", "Sociedad"]
+        )
+        fila_csv = ["SER1", "INV1", "D1", "C1", "S1"]
+        self.assertEqual(encabezado.get(fila_csv, "numero_serie"), "SER1")
+        self.assertEqual(encabezado.get(fila_csv, "inventario"), "INV1")
+        self.assertEqual(encabezado.get(fila_csv, "division"), "D1")
+        self.assertEqual(encabezado.faltantes_obligatorias, [])
+        self.assertIn("marca", encabezado.faltantes)
+
+    def test_repetidas_desconocidas_y_faltantes(self):
+        encabezado = HeaderMap(["Nombre", "Número de serie*", "Nombre", "Color"])
+        self.assertEqual(encabezado.get(["Primero", "SER1", "Último", "Rojo"], "nombre"), "Último")
+        self.assertEqual(encabezado.duplicadas, ["Nombre"])
+        self.assertIn("Color", encabezado.desconocidas)
+        self.assertEqual(encabezado.faltantes_obligatorias, ["sociedad", "division", "centro_costo"])
+
+    def test_fila_corta_cae_al_siguiente_alias(self):
+        encabezado = HeaderMap(["Serie", "Nombre", "Número de serie"])
+        self.assertEqual(encabezado.get(["SER1", "EQ"], "numero_serie"), "SER1")
+        self.assertEqual(encabezado.get(["SER1", "EQ", "SER2"], "numero_serie"), "SER2")
+        self.assertEqual(encabezado.get([], "nombre"), "")
+
+
+@override_settings(IMPORT_JOBS_WORKER="command")
+class ImportacionEnSegundoPlanoTests(ImportacionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_superuser("admin", "admin@example.com", "clave")
+        self.client.force_login(self.usuario)
+
+    def test_la_vista_encola_y_el_estado_refleja_el_avance(self):
+        ruta = self.escribir_csv([fila(f"INV{numero}", f"SER{numero}") for numero in range(3)])
+        with self.settings(CSV_INVENTARIO_PATH=ruta):
+            respuesta = self.client.post(
+                reverse("importar"), {"modo": "update_create"}, HTTP_ACCEPT="application/json"
+            )
+        self.assertEqual(respuesta.status_code, 202)
+        estado = respuesta.json()
+        self.assertEqual((estado["estado"], estado["terminado"]), (ImportJob.Estado.PENDIENTE, False))
+        self.assertFalse(Equipo.objects.exists())
+
+        job = next_pending_job()
+        self.assertEqual(job.pk, estado["id"])
+        self.assertIsNone(next_pending_job())
+        run_import_job(job)
+
+        estado = self.client.get(reverse("importar_estado", args=[job.pk])).json()
+        self.assertEqual((estado["estado"], estado["porcentaje"]), (ImportJob.Estado.COMPLETADO, 100))
+        self.assertEqual(estado["filas_procesadas"], 3)
+        self.assertEqual(ImportLog.objects.get(pk=estado["log_id"]).creados, 3)
+        self.assertEqual(Equipo.objects.count(), 3)
+
+    def test_el_avance_llega_solo_por_el_callback(self):
+        ruta = self.escribir_csv([fila(f"INV{numero}", f"SER{numero}") for numero in range(5)])
+        avance = []
+        salida = io.StringIO()
+        with mock.patch("inventario.importer.PROGRESS_EVERY", 2), contextlib.redirect_stdout(salida):
+            import_inventario_csv(ruta, "update_create", progress=lambda fase, filas: avance.append((fase, filas)))
+        self.assertEqual(
+            avance, [("cargando", 0), ("procesando", 0), ("procesando", 2), ("procesando", 4), ("guardando", 5)]
+        )
+        self.assertEqual(salida.getvalue(), "")
+
+    def test_un_job_terminado_no_se_vuelve_a_tomar(self):
+        job = enqueue_import(self.escribir_csv([fila("INV1", "SER1")]), "update_create", usuario=self.usuario)
+        self.assertIsNotNone(claim_job(job.pk))
+        self.assertIsNone(claim_job(job.pk))
+
+
+@override_settings(IMPORT_JOBS_WORKER="command")
+class ImportacionIdempotenteTests(ImportacionTestCase):
+    def ejecutar(self, ruta, modo="update_create", **opciones):
+        job = enqueue_import(ruta, modo, sha256=file_sha256(ruta), **opciones)
+        return run_import_job(claim_job(job.pk))
+
+    def test_el_mismo_archivo_y_modo_no_se_vuelve_a_leer(self):
+        ruta = self.escribir_csv([fila("INV1", "SER1")])
+        primero = self.ejecutar(ruta)
+        Equipo.objects.all().delete()
+
+        copia = self.escribir_csv([fila("INV1", "SER1")], "copia.csv")
+        segundo = self.ejecutar(copia)
+        self.assertEqual(segundo.estado, ImportJob.Estado.COMPLETADO)
+        self.assertTrue(segundo.resultados["ya_importado"])
+        self.assertEqual(segundo.import_log_id, primero.import_log_id)
+        self.assertEqual(segundo.resultados["creados"], 1)
+        self.assertEqual(ImportLog.objects.count(), 1)
+        self.assertFalse(Equipo.objects.exists())
+
+    def test_otro_modo_o_forzar_vuelven_a_importar(self):
+        ruta = self.escribir_csv([fila("INV1", "SER1")])
+        self.ejecutar(ruta)
+        Equipo.objects.all().delete()
+        self.assertNotIn("ya_importado", self.ejecutar(ruta, "create_only").resultados)
+        Equipo.objects.all().delete()
+        self.assertNotIn("ya_importado", self.ejecutar(ruta, forzar=True).resultados)
+        self.assertEqual(ImportLog.objects.count(), 3)
+        self.assertTrue(Equipo.objects.exists())
+
+
+class ImportacionIncrementalTests(ImportacionTestCase):
+    def test_salta_filas_anteriores_a_la_marca(self):
+        ruta = self.escribir_csv(
+            [
+                fila("INV1", "SER1", modificacion="01/03/2024 10:00"),
+                fila("INV2", "SER2", modificacion="15/03/2024 08:30"),
+                fila("INV3", "SER3", modificacion="20/03/2024 09:15"),
+                fila("INV4", "SER4"),
+            ]
+        )
+        desde = timezone.make_aware(datetime(2024, 3, 15, 8, 30))
+        for opciones in ({}, {"batch_size": 100}):
+            with self.subTest(**opciones):
+                with transaction.atomic():
+                    resultados, _ = import_inventario_csv(ruta, "update_create", desde=desde, **opciones)
+                    series = set(Equipo.objects.values_list("numero_serie", flat=True))
+                    transaction.set_rollback(True)
+                self.assertEqual(series, {"SER2", "SER3", "SER4"})
+                self.assertEqual(resultados["omitidos_por_marca"], 1)
+                self.assertEqual(resultados["incremental_desde"], desde.isoformat())
+                self.assertEqual(
+                    resultados["marca_modificacion"], timezone.make_aware(datetime(2024, 3, 20, 9, 15)).isoformat()
+                )
+
+    def test_la_marca_no_pasa_de_la_primera_fila_con_error(self):
+        ruta = self.escribir_csv(
+            [
+                fila("INV1", "SER1", modificacion="01/03/2024 10:00"),
+                fila("INV2", "", modificacion="05/03/2024 10:00"),
+                fila("INV3", "SER3", modificacion="20/03/2024 09:15"),
+            ]
+        )
+        resultados, _ = import_inventario_csv(ruta, "update_create")
+        self.assertEqual(resultados["errores"], 1)
+        self.assertEqual(
+            resultados["marca_modificacion"], timezone.make_aware(datetime(2024, 3, 5, 10, 0)).isoformat()
+        )
+
+    @override_settings(IMPORT_JOBS_WORKER="command")
+    def test_el_job_incremental_parte_de_la_ultima_marca_del_modo(self):
+        primero = self.escribir_csv([fila("INV1", "SER1", modificacion="10/03/2024 10:00")])
+        run_import_job(claim_job(enqueue_import(primero, "update_create").pk))
+        self.assertEqual(find_watermark("update_create"), timezone.make_aware(datetime(2024, 3, 10, 10, 0)))
+        self.assertIsNone(find_watermark("create_only"))
+
+        segundo = self.escribir_csv(
+            [
+                fila("INV1", "SER1", nombre="Viejo", modificacion="01/03/2024 10:00"),
+                fila("INV2", "SER2", modificacion="11/03/2024 10:00"),
+            ],
+            "segundo.csv",
+        )
+        job = run_import_job(claim_job(enqueue_import(segundo, "update_create", incremental=True).pk))
+        self.assertEqual((job.resultados["omitidos_por_marca"], job.resultados["creados"]), (1, 1))
+        self.assertEqual(Equipo.objects.get(numero_serie="SER1").nombre, "EQ SER1")
+        self.assertEqual(job.import_log.incremental_desde, timezone.make_aware(datetime(2024, 3, 10, 10, 0)))
+
+
+class InventarioSinteticoTests(TestCase):
+    def setUp(self):
+        self.directorio = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+
+    def test_mismo_archivo_con_la_misma_semilla(self):
+        rutas = []
+        for nombre in ("a.csv", "b.csv"):
+            generador = InventoryGenerator(settings.CSV_INVENTARIO_PATH, semilla=7)
+            generador.escribir(50, self.directorio / nombre, self.directorio / f"base_{nombre}")
+            rutas.append((self.directorio / nombre).read_bytes())
+        self.assertEqual(rutas[0], rutas[1])
+
+    def test_las_proporciones_se_reflejan_al_importar(self):
+        generador = InventoryGenerator(settings.CSV_INVENTARIO_PATH, nuevos=0.2, actualizados=0.3, invalidos=0.1)
+        archivo, base = self.directorio / "inventario.csv.gz", self.directorio / "base.csv"
+        conteo = generador.escribir(200, archivo, base)
+        import_inventario_csv(base, "update_create", batch_size=100)
+        resultados, _ = import_inventario_csv(archivo, "update_create", batch_size=100)
+        self.assertEqual(resultados["total"], conteo["filas"])
+        self.assertEqual(resultados["actualizados"] + resultados["sin_cambios"], conteo["base"])
+        self.assertEqual(resultados["creados"] + resultados["errores"], conteo["filas"] - conteo["base"])
+        self.assertTrue(resultados["actualizados"] and resultados["sin_cambios"] and resultados["errores"])
+
+    def test_el_benchmark_reporta_cada_modo_y_no_deja_cambios(self):
+        salida = io.StringIO()
+        call_command(
+            "benchmark_importacion",
+            "--filas",
+            "30",
+            "--modos",
+            "update_create",
+            "create_only",
+            "--batch-size",
+            "10",
+            stdout=salida,
+            stderr=io.StringIO(),
+        )
+        reporte = json.loads(salida.getvalue())
+        self.assertEqual([corrida["modo"] for corrida in reporte["corridas"]], ["update_create", "create_only"])
+        self.assertTrue(all(corrida["resultados"]["total"] == 30 for corrida in reporte["corridas"]))
+        self.assertFalse(Equipo.objects.exists())
+
+
+class MetricasImportacionTests(ImportacionTestCase):
+    def test_las_metricas_cuentan_fases_y_consultas(self):
+        ruta = self.escribir_csv([fila(f"INV{numero}", f"SER{numero}") for numero in range(20)])
+        with CaptureQueriesContext(connection) as consultas:
+            resultados, _ = import_inventario_csv(ruta, "update_create", batch_size=10)
+        metricas = resultados["metricas"]
+        self.assertEqual(metricas["filas"], 20)
+        self.assertEqual(metricas["consultas"], len(consultas))
+        self.assertTrue({"lectura", "comparacion", "escritura", "otros"} <= set(metricas["fases"]))
+        self.assertAlmostEqual(sum(metricas["fases"].values()), metricas["segundos"], delta=0.01)
+        self.assertGreater(metricas["pico_memoria_kb"], 0)
+
+    def test_el_log_guarda_las_metricas(self):
+        ruta = self.escribir_csv([fila("INV1", "SER1")])
+        resultados, errores = import_inventario_csv(ruta, "update_create")
+        log = registrar_importacion(None, ruta, resultados, errores, modo="update_create")
+        log.refresh_from_db()
+        self.assertEqual(log.metricas["filas"], 1)
+        self.assertEqual(log.metricas["consultas"], resultados["metricas"]["consultas"])
+
+    def test_el_temporizador_reparte_el_tiempo_entre_fases(self):
+        temporizador = PhaseTimer()
+        with mock.patch("inventario.metrics.time.perf_counter", side_effect=[0.0, 1.0, 3.5, 4.0]):
+            temporizador.cambiar("lectura")
+            temporizador.cambiar("escritura")
+            temporizador.cambiar("lectura")
+            temporizador.detener()
+        self.assertEqual(temporizador.segundos, {"lectura": 1.5, "escritura": 2.5})
+
+
+@override_settings(IMPORT_JOBS_WORKER="command")
+class ImportacionPorBloquesTests(ImportacionTestCase):
+    def test_reanuda_desde_el_ultimo_bloque_confirmado(self):
+        ruta = self.escribir_csv([fila(f"INV{numero}", f"SER{numero}") for numero in range(1, 6)] + [fila("INV9", "")])
+        job = enqueue_import(ruta, "update_create", chunk_size=2)
+        flush = BulkEquipoWriter.flush
+        llamadas = []
+
+        def falla_en_el_segundo_bloque(writer):
+            llamadas.append(writer)
+            if len(llamadas) == 2:
+                raise DatabaseError("disco lleno")
+            return flush(writer)
+
+        with mock.patch.object(BulkEquipoWriter, "flush", falla_en_el_segundo_bloque):
+            job = run_import_job(claim_job(job.pk), batch_size=100)
+        self.assertEqual((job.estado, job.mensaje), (ImportJob.Estado.ERROR, "disco lleno"))
+        self.assertTrue(job.puede_reanudarse)
+        self.assertEqual(job.checkpoint["fila"], 3)
+        self.assertEqual(set(Equipo.objects.values_list("numero_serie", flat=True)), {"SER1", "SER2"})
+
+        job = run_import_job(claim_job(reanudar_importacion(job, encolar=False).pk), batch_size=100)
+        self.assertEqual(job.estado, ImportJob.Estado.COMPLETADO)
+        self.assertIsNone(job.checkpoint)
+        self.assertEqual(job.resultados["reanudado_en_fila"], 4)
+        self.assertEqual(
+            {campo: job.resultados[campo] for campo in ("total", "creados", "errores")},
+            {"total": 6, "creados": 5, "errores": 1},
+        )
+        self.assertEqual(Equipo.objects.count(), 5)
+        self.assertEqual(job.import_log.errores, 1)
+
+    def test_solo_se_reanuda_un_job_fallido_con_checkpoint(self):
+        job = enqueue_import(self.escribir_csv([fila("INV1", "SER1")]), "update_create", chunk_size=2)
+        job = run_import_job(claim_job(job.pk))
+        self.assertEqual(job.estado, ImportJob.Estado.COMPLETADO)
+        with self.assertRaises(ValueError):
+            reanudar_importacion(job)
+        with self.assertRaises(ValueError):
+            import_inventario_csv(self.escribir_csv([fila("INV1", "SER1")]), "update_create", checkpoint={"fila": 2})
+
+    def test_sin_bloques_una_falla_no_deja_filas(self):
+        ruta = self.escribir_csv([fila(f"INV{numero}", f"SER{numero}") for numero in range(1, 6)])
+        with mock.patch.object(BulkEquipoWriter, "flush", side_effect=DatabaseError("disco lleno")):
+            with self.assertRaises(DatabaseError):
+                import_inventario_csv(ruta, "update_create", batch_size=2)
+        self.assertFalse(Equipo.objects.exists())
+
+
+class NormalizacionEnParaleloTests(ImportacionTestCase):
+    def test_el_pool_de_procesos_da_el_mismo_resultado(self):
+        self.crear_equipo("INV1", "SER1")
+        filas = [fila(f"INV{numero}", f"SER{numero}", marca=f"Marca {numero % 3}") for numero in range(1, 40)]
+        filas += [fila("INV2", "SER99"), fila("INV50", ""), fila("INV51", "SER51", modificacion="no es fecha")]
+        ruta = self.escribir_csv(filas)
+        for opciones in ({}, {"batch_size": 10}):
+            with self.subTest(**opciones):
+                esperado = self.importar_y_revertir(ruta, **opciones)
+                # Bloques chicos: varios en vuelo a la vez, que deben volver en orden.
+                with mock.patch("inventario.importer.PARSE_BLOCK_ROWS", 5):
+                    self.assertEqual(self.importar_y_revertir(ruta, workers=2, **opciones), esperado)
+
+    def test_el_pool_respeta_la_marca_incremental(self):
+        ruta = self.escribir_csv(
+            [
+                fila("INV1", "SER1", modificacion="01/03/2024 10:00"),
+                fila("INV2", "SER2", modificacion="20/03/2024 10:00"),
+            ]
+        )
+        desde = timezone.make_aware(datetime(2024, 3, 15))
+        resultados, _ = import_inventario_csv(ruta, "update_create", desde=desde, workers=2)
+        self.assertEqual((resultados["omitidos_por_marca"], resultados["creados"]), (1, 1))
+        self.assertEqual(list(Equipo.objects.values_list("numero_serie", flat=True)), ["SER2"])
+
+
+class ImportacionXlsxTests(ImportacionTestCase):
+    def escribir_xlsx(self, hojas, nombre="inventario.xlsx"):
+        libro = Workbook()
+        libro.remove(libro.active)
+        for titulo, filas in hojas.items():
+            hoja = libro.create_sheet(titulo)
+            hoja.append(ENCABEZADO)
+            for valores in filas:
+                hoja.append(valores)
+        ruta = self.directorio / nombre
+        libro.save(ruta)
+        return ruta
+
+    def series_importadas(self, ruta, **opciones):
+        return [valores[1] for valores in self.importar_y_revertir(ruta, **opciones)[2]]
+
+    def test_las_celdas_tipadas_importan_igual_que_el_csv(self):
+        self.crear_equipo("1001", "SER1")
+        texto = [
+            fila("1001", "SER1", marca="Dell", modificacion="01/03/2024 10:00"),
+            fila("1002", "SER2", marca="HP", modificacion="02/03/2024"),
+            fila("1003", "", marca="HP"),
+        ]
+        tipadas = [
+            fila(1001, "SER1", marca="Dell", modificacion=datetime(2024, 3, 1, 10, 0)),
+            fila(1002.0, "SER2", marca="HP", modificacion=datetime(2024, 3, 2).date()),
+            fila(1003, None, marca="HP"),
+        ]
+        ruta = self.escribir_xlsx({"Inventario": tipadas})
+        esperado = self.importar_y_revertir(self.escribir_csv(texto))
+        for opciones in ({}, {"batch_size": 2}):
+            with self.subTest(**opciones):
+                self.assertEqual(self.importar_y_revertir(ruta, **opciones), esperado)
+        self.assertEqual(self.importar_y_revertir(ruta, importar=import_inventario_staging), esperado)
+
+    def test_elige_la_hoja_por_nombre_o_numero(self):
+        ruta = self.escribir_xlsx(
+            {"Resumen": [fila("INV1", "SER1")], "Equipos": [fila("INV2", "SER2"), fila("INV3", "SER3")]}
+        )
+        self.assertEqual(self.series_importadas(ruta), ["SER1"])
+        for hoja in ("Equipos", "2", 2):
+            with self.subTest(hoja=hoja):
+                self.assertEqual(self.series_importadas(ruta, hoja=hoja), ["SER2", "SER3"])
+        with self.assertRaises(ValueError):
+            import_inventario_csv(ruta, "update_create", hoja="Bajas")
+        self.assertEqual((estimar_filas(ruta), estimar_filas(ruta, "Equipos")), (1, 2))
+
+
+class CargaCompactaTests(ImportacionTestCase):
+    def consultas_de_instancias(self, contexto):
+        # in_bulk trae las instancias completas filtrando por id.
+        return [
+            consulta["sql"]
+            for consulta in contexto.captured_queries
+            if consulta["sql"].startswith("SELECT") and '"equipos_equipo"."id" IN' in consulta["sql"]
+        ]
+
+    def test_solo_trae_instancias_de_las_filas_que_actualizan(self):
+        for numero in range(1, 31):
+            self.crear_equipo(f"INV{numero}", f"SER{numero}")
+        filas = [fila(f"INV{numero}", f"SER{numero}") for numero in range(1, 31)]
+        import_inventario_csv(self.escribir_csv(filas), "update_create")
+        for opciones in ({}, {"batch_size": 7}):
+            with self.subTest(**opciones):
+                with CaptureQueriesContext(connection) as contexto:
+                    conteos, _, _ = self.importar_y_revertir(self.escribir_csv(filas), **opciones)
+                self.assertEqual(conteos["sin_cambios"], 30)
+                self.assertEqual(self.consultas_de_instancias(contexto), [])
+
+                cambiadas = [fila(f"INV{numero}", f"SER{numero}", nombre=f"Nuevo {numero}") for numero in range(1, 31)]
+                with CaptureQueriesContext(connection) as contexto:
+                    conteos, _, _ = self.importar_y_revertir(self.escribir_csv(cambiadas), **opciones)
+                self.assertEqual(conteos["actualizados"], 30)
+                # Las 30 filas caben en la ventana de anticipación: una sola consulta.
+                self.assertEqual(len(self.consultas_de_instancias(contexto)), 1)
+
+    def test_una_ventana_chica_trae_las_instancias_por_tramos(self):
+        equipos = [self.crear_equipo(f"INV{numero}", f"SER{numero}") for numero in range(1, 8)]
+        equipos_por_serie = {equipo.numero_serie: resumen_equipo(equipo) for equipo in equipos}
+        equipos_por_serie["SER7"] = equipos[6]
+        filas = ["SER1", "SER2", "SER9", "SER3", "SER4", "SER5", "SER6", "SER7"]
+        cargador = CargadorEquipos(filas, lambda serie: serie, equipos_por_serie, tamano=3)
+        vistas = []
+        with CaptureQueriesContext(connection) as contexto:
+            for serie in cargador:
+                existente = equipos_por_serie.get(serie)
+                if isinstance(existente, ResumenEquipo):
+                    vistas.append(cargador.instancia(existente).numero_serie)
+        self.assertEqual(vistas, ["SER1", "SER2", "SER3", "SER4", "SER5", "SER6"])
+        # SER1 trae también SER2 (SER9 no existe); SER3 trae SER4 y SER5; SER6 va sola, y
+        # SER7 ya es una instancia.
+        self.assertEqual(len(contexto.captured_queries), 3)
+
+
+class CacheNormalizacionTests(ImportacionTestCase):
+    def test_normaliza_igual_que_sin_cache(self):
+        columnas = HeaderMap(ENCABEZADO)
+        filas = [
+            fila("INV1", "SER1", marca=" dell ", sistema="Windows  11"),
+            fila("INV2", "SER2", marca="dell", sistema="Windows 11"),
+            fila("INV3", "SER3", marca=" dell ", sistema=""),
+        ]
+        cache = CacheNormalizacion()
+        for valores in filas:
+            self.assertEqual(parse_row(columnas, valores, cache), parse_row(columnas, valores))
+        metricas = cache.as_dict()
+        self.assertEqual(metricas["filas"], 3)
+        self.assertEqual(metricas["columnas"]["marca"], {"aciertos": 1, "fallos": 2, "tasa_aciertos": 0.3333})
+        self.assertEqual(metricas["columnas"]["sociedad"], {"aciertos": 2, "fallos": 1, "tasa_aciertos": 0.6667})
+
+    def test_la_columna_llena_deja_de_guardar_valores(self):
+        cache = CacheNormalizacion()
+        with mock.patch("inventario.importer.NORMALIZATION_CACHE_SIZE", 2):
+            resultados = [cache.normalizar("marca", valor) for valor in (" a ", "b", "c", "c", " a ")]
+        self.assertEqual(resultados, ["a", "b", "c", "c", "a"])
+        self.assertEqual(set(cache.valores["marca"]), {" a ", "b"})
+        self.assertEqual(cache.fallos["marca"], 4)
+
+    def test_la_importacion_reporta_los_aciertos(self):
+        filas = [fila(f"INV{numero}", f"SER{numero}", marca=f"Marca {numero % 2}") for numero in range(1, 11)]
+        ruta = self.escribir_csv(filas)
+        metricas = []
+        for opciones in ({}, {"workers": 2}):
+            with transaction.atomic():
+                resultados, _ = import_inventario_csv(ruta, "update_create", **opciones)
+                transaction.set_rollback(True)
+            metricas.append(resultados["metricas"]["cache_normalizacion"])
+        self.assertEqual(metricas[0], metricas[1])
+        self.assertEqual(metricas[0]["filas"], 10)
+        self.assertEqual(metricas[0]["columnas"]["marca"]["fallos"], 2)
+        self.assertEqual(metricas[0]["columnas"]["centro_costo"]["aciertos"], 9)
+
+
+@override_settings(IMPORT_JOBS_WORKER="command")
+class CandadoImportacionTests(ImportacionTestCase):
+    def ocupar(self, **valores):
+        # Un candado tomado por otra importación: por defecto, este mismo proceso (vivo).
+        datos = {"token": "otro", "propietario": "Otra importación", "host": HOST, "pid": os.getpid()}
+        datos.update(valores)
+        datos.setdefault("adquirido_en", timezone.now())
+        datos.setdefault("latido", datos["adquirido_en"])
+        ImportLock.objects.update_or_create(nombre=IMPORT_LOCK, defaults=datos)
+
+    def test_una_sola_importacion_tiene_el_candado(self):
+        with bloqueo_importacion("Primera") as token:
+            self.assertEqual(lock_actual().token, token)
+            with self.assertRaises(ImportacionEnCurso) as contexto:
+                with bloqueo_importacion("Segunda"):
+                    pass
+            self.assertIn("Primera", str(contexto.exception))
+        self.assertIsNone(lock_actual())
+        with self.assertRaises(DatabaseError):
+            with bloqueo_importacion("Tercera"):
+                raise DatabaseError("falla")
+        # Una falla dentro del bloque también lo libera.
+        self.assertIsNone(lock_actual())
+
+    def test_el_job_espera_en_la_cola_mientras_el_candado_esta_ocupado(self):
+        ruta = self.escribir_csv([fila("INV1", "SER1")])
+        job = run_import_job(claim_job(enqueue_import(ruta, "update_create").pk))
+        self.assertEqual(job.estado, ImportJob.Estado.COMPLETADO)
+        self.ocupar()
+        job = run_import_job(claim_job(enqueue_import(self.escribir_csv([fila("INV2", "SER2")]), "update_create").pk))
+        self.assertEqual((job.estado, job.fase, job.iniciado_en), (ImportJob.Estado.PENDIENTE, "esperando_lock", None))
+        self.assertIn("Otra importación", job.mensaje)
+        self.assertTrue(Path(job.archivo).exists())
+        self.assertFalse(Equipo.objects.filter(numero_serie="SER2").exists())
+
+
+        # La vista previa no escribe: no espera el candado.
+        vista_previa = enqueue_import(ruta, "update_create", preview=True)
+        self.assertEqual(run_import_job(claim_job(vista_previa.pk)).estado, ImportJob.Estado.COMPLETADO)
+
+        ImportLock.objects.filter(nombre=IMPORT_LOCK).update(token="")
+        reclamado = next_pending_job()
+        self.assertEqual(reclamado.pk, job.pk)
+        job = run_import_job(reclamado)
+        self.assertEqual(job.estado, ImportJob.Estado.COMPLETADO)
+        self.assertTrue(Equipo.objects.filter(numero_serie="SER2").exists())
+
+    def test_un_candado_abandonado_se_puede_tomar(self):
+        hace_rato = timezone.now() - timedelta(seconds=settings.IMPORT_LOCK_TIMEOUT + 60)
+        casos = (
+            ("dueño vivo", {}, True),
+            ("dueño muerto", {"pid": 999999}, False),
+            ("otro equipo con latido", {"host": "otro-equipo"}, True),
+            ("otro equipo sin latido", {"host": "otro-equipo", "adquirido_en": hace_rato}, False),
+        )
+        for descripcion, valores, ocupado in casos:
+            with self.subTest(descripcion):
+                self.ocupar(**valores)
+                with mock.patch("inventario.locks._proceso_vivo", lambda pid: pid == os.getpid()):
+                    self.assertEqual(lock_actual() is not None, ocupado)
+                    if ocupado:
+                        with self.assertRaises(ImportacionEnCurso):
+                            adquirir_lock("Nueva")
+                    else:
+                        token = adquirir_lock("Nueva")
+                        self.assertEqual((lock_actual().token, lock_actual().propietario), (token, "Nueva"))
+
+    def test_el_comando_no_importa_con_el_candado_ocupado(self):
+        self.ocupar()
+        with self.assertRaises(CommandError) as contexto:
+            ruta = self.escribir_csv([fila("INV1", "SER1")])
+            call_command("fix_inventarios_from_csv", "--path", str(ruta), stdout=io.StringIO())
+        self.assertIn("Otra importación", str(contexto.exception))
+        self.assertFalse(Equipo.objects.exists())
+
+
+class AuditoriaImportacionTests(ImportacionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.crear_equipo("INV1", "SER1")
+        self.crear_equipo("INV2", "SER2")
+        import_inventario_csv(self.escribir_csv([fila("INV1", "SER1"), fila("INV2", "SER2")]), "update_create")
+        AuditLog.objects.all().delete()
+        self.ruta = self.escribir_csv(
+            [
+                fila("INV1", "SER1"),
+                fila("INV2", "SER2", nombre="Renombrado", marca="Dell"),
+                fila("INV3", "SER3"),
+                fila("INV4", "SER4"),
+                fila("INV5", ""),
+            ]
+        )
+
+    def auditoria(self, resultados):
+        registros = AuditLog.objects.filter(lote=resultados["lote_auditoria"]).order_by("equipo__numero_serie")
+        return [(registro.accion, registro.equipo.numero_serie, registro.cambios) for registro in registros]
+
+    def test_un_registro_por_equipo_creado_o_actualizado(self):
+        esperado = [
+            ("IMPORT_CAMBIO", "SER2", {"nombre": ["EQ SER2", "Renombrado"], "marca": [None, "Dell"]}),
+            ("IMPORT_ALTA", "SER3", None),
+            ("IMPORT_ALTA", "SER4", None),
+        ]
+        motores = (
+            ("filas", import_inventario_csv, {}),
+            ("lotes", import_inventario_csv, {"batch_size": 2}),
+            ("staging", import_inventario_staging, {}),
+        )
+        for motor, importar, opciones in motores:
+            with self.subTest(motor), transaction.atomic():
+                resultados, _ = importar(self.ruta, "update_create", **opciones)
+                self.assertEqual(self.auditoria(resultados), esperado)
+                transaction.set_rollback(True)
+
+        cambios = ChangeSet("update_create")
+        resultados, errores = import_inventario_csv(self.ruta, "update_create", preview=cambios)
+        self.assertFalse(AuditLog.objects.exists())
+        aplicados, _ = aplicar_cambios(cambios.as_dict(resultados, errores))
+        self.assertEqual(self.auditoria(aplicados), esperado)
+
+    def test_una_fila_con_identificador_ocupado_no_impide_escribir_la_auditoria(self):
+        # Fila por fila, la alta ya auditada y el error de la siguiente no deben dejar la
+        # transacción inservible para el flush de la auditoría.
+        self.crear_equipo("", "ABC")
+        ruta = self.escribir_csv([fila("INV8", "SER8"), fila("ABC", "SER9"), fila("INV10", "SER10")])
+        resultados, errores = import_inventario_csv(ruta, "update_create")
+        self.assertEqual((resultados["creados"], resultados["errores"]), (2, 1))
+        self.assertEqual([error["mensaje"] for error in errores], ["Identificador ya existe en otro equipo."])
+        self.assertEqual(self.auditoria(resultados), [("IMPORT_ALTA", "SER10", None), ("IMPORT_ALTA", "SER8", None)])
+
+    def test_los_registros_se_insertan_por_lote_y_se_ligan_al_log(self):
+        usuario = User.objects.create_user("importador")
+        with CaptureQueriesContext(connection) as contexto:
+            resultados, errores = import_inventario_csv(self.ruta, "update_create", batch_size=2)
+        inserciones = [consulta for consulta in contexto.captured_queries if "INSERT INTO" in consulta["sql"]]
+        # Un executemany por lote de equipos con altas o cambios, no un INSERT por equipo.
+        self.assertEqual(len([consulta for consulta in inserciones if "equipos_auditlog" in consulta["sql"]]), 2)
+        log = registrar_importacion(usuario, self.ruta, resultados, errores)
+        self.assertEqual(log.audit_logs.count(), 3)
+        self.assertEqual(set(log.audit_logs.values_list("usuario", flat=True)), {usuario.pk})
+        self.assertEqual(AuditLog.objects.filter(accion="IMPORT", usuario=usuario).count(), 1)
+
+
+class BusquedaTextoTests(ImportacionTestCase):
+    def setUp(self):
+        super().setUp()
+        if not indice_disponible():
+            self.skipTest("La base no tiene el índice de búsqueda.")
+        self.dell = Marca.objects.create(nombre="Dell Latitude")
+        self.modelo = ModeloEquipo.objects.create(nombre="OptiPlex 7090")
+        self.crear_equipo("INV100", "ABC123XYZ", marca=self.dell, nombre="Laptop de contabilidad")
+        self.crear_equipo("INV200", "QWE456", modelo=self.modelo, nombre="Escritorio ABC123")
+        self.crear_equipo("INV300", "ZZZ999", nombre="Servidor", nombre_responsable="María López")
+
+    def buscar(self, texto):
+        return sorted(buscar_equipos(Equipo.objects.all(), texto).values_list("numero_serie", flat=True))
+
+    def test_encuentra_lo_mismo_que_icontains(self):
+        for texto in ("abc123", "INV", "nv20", "latitude", "optiplex", "lópez", "contab", "no existe", "ZZ", '"x'):
+            with self.subTest(texto=texto):
+                esperado = sorted(Equipo.objects.filter(filtro_texto(texto)).values_list("numero_serie", flat=True))
+                self.assertEqual(self.buscar(texto), esperado)
+
+    def test_ordena_por_relevancia(self):
+        # La coincidencia en la serie pesa más que la del nombre.
+        encontrados = buscar_equipos(Equipo.objects.all(), "ABC123")
+        self.assertEqual([equipo.numero_serie for equipo in encontrados], ["ABC123XYZ", "QWE456"])
+
+    def test_el_indice_sigue_los_cambios(self):
+        equipo = Equipo.objects.get(numero_serie="ZZZ999")
+        equipo.direccion_ip = "10.20.30.40"
+        equipo.save()
+        self.assertEqual(self.buscar("20.30"), ["ZZZ999"])
+        Equipo.objects.filter(pk=equipo.pk).update(nombre="Firewall perimetral")
+        self.assertEqual((self.buscar("perimetral"), self.buscar("Servidor")), (["ZZZ999"], []))
+        equipo.refresh_from_db()
+        equipo.marca = self.dell
+        Equipo.objects.bulk_update([equipo], ["marca"])
+        self.assertEqual(self.buscar("latitude"), ["ABC123XYZ", "ZZZ999"])
+
+        Marca.objects.filter(pk=self.dell.pk).update(nombre="Lenovo ThinkPad")
+        ModeloEquipo.objects.filter(pk=self.modelo.pk).update(nombre="ProDesk 400")
+        self.assertEqual((self.buscar("latitude"), self.buscar("thinkpad")), ([], ["ABC123XYZ", "ZZZ999"]))
+        self.assertEqual((self.buscar("optiplex"), self.buscar("prodesk")), ([], ["QWE456"]))
+
+        Equipo.objects.filter(numero_serie="ABC123XYZ").delete()
+        self.assertEqual(self.buscar("thinkpad"), ["ZZZ999"])
+
+    def test_las_importaciones_mantienen_el_indice(self):
+        ruta = self.escribir_csv([fila("INV100", "ABC123XYZ", nombre="Renombrada"), fila("INV400", "NUEVA77")])
+        for importar, opciones in ((import_inventario_csv, {"batch_size": 10}), (import_inventario_staging, {})):
+            with self.subTest(importar.__name__), transaction.atomic():
+                importar(ruta, "update_create", **opciones)
+                self.assertEqual((self.buscar("renombrada"), self.buscar("nueva7")), (["ABC123XYZ"], ["NUEVA77"]))
+                self.assertEqual(self.buscar("contabilidad"), [])
+                transaction.set_rollback(True)
+
+    def test_reinstalar_recupera_los_triggers_perdidos(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {EquipoBusqueda._meta.db_table}_ai")
+        self.crear_equipo("INV500", "PERDIDO1")
+        self.assertEqual(self.buscar("perdido"), [])
+        self.assertTrue(instalar_indice())
+        self.assertEqual(self.buscar("perdido"), ["PERDIDO1"])
+        self.crear_equipo("INV600", "PERDIDO2")
+        self.assertEqual(self.buscar("perdido"), ["PERDIDO1", "PERDIDO2"])
+
+    def test_la_lista_filtra_por_texto(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "clave"))
+        respuesta = self.client.get(reverse("equipos_list"), {"texto": "abc123"})
+        self.assertEqual([equipo.numero_serie for equipo in respuesta.context["equipos"]], ["ABC123XYZ", "QWE456"])
+
+
+class PaginacionCursorTests(ImportacionTestCase):
+    def setUp(self):
+        super().setUp()
+        base = timezone.now()
+        for numero in range(40):
+            equipo = self.crear_equipo(f"INV{numero:02d}", f"SER{numero:02d}")
+            # Varios equipos con el mismo actualizado_en: el desempate es identificador, id.
+            Equipo.objects.filter(pk=equipo.pk).update(actualizado_en=base - timedelta(minutes=numero // 3))
+        self.esperado = list(Equipo.objects.order_by(*ORDEN_LISTADO).values_list("pk", flat=True))
+
+    def recorrer(self, cursor, siguiente):
+        paginas = []
+        while True:
+            pagina = paginar_por_cursor(Equipo.objects.all(), cursor, 7)
+            paginas.append([equipo.pk for equipo in pagina])
+            cursor = pagina.cursor_siguiente if siguiente else pagina.cursor_anterior
+            if cursor is None:
+                return paginas
+
+    def test_hacia_adelante_coincide_con_offset(self):
+        paginas = self.recorrer(None, siguiente=True)
+        paginador = Paginator(Equipo.objects.order_by(*ORDEN_LISTADO), 7)
+        self.assertEqual(paginas, [[equipo.pk for equipo in paginador.page(numero)] for numero in paginador.page_range])
+
+    def test_hacia_atras_desde_la_ultima_sin_huecos_ni_repetidos(self):
+        paginas = self.recorrer(CURSOR_ULTIMA, siguiente=False)
+        self.assertEqual(paginas[0], self.esperado[-7:])
+        # La última página va completa; al llegar al inicio se muestra la primera completa.
+        self.assertEqual(paginas[-1], self.esperado[:7])
+        vistos = [pk for pagina in reversed(paginas[:-1]) for pk in pagina]
+        self.assertEqual(vistos, self.esperado[-len(vistos):])
+        self.assertEqual(len(vistos), len(set(vistos)))
+        self.assertLessEqual(len(self.esperado) - len(vistos), 7)
+
+    def test_ida_y_vuelta_regresa_a_la_misma_pagina(self):
+        primera = paginar_por_cursor(Equipo.objects.all(), None, 7)
+        segunda = paginar_por_cursor(Equipo.objects.all(), primera.cursor_siguiente, 7)
+        tercera = paginar_por_cursor(Equipo.objects.all(), segunda.cursor_siguiente, 7)
+        regreso = paginar_por_cursor(Equipo.objects.all(), tercera.cursor_anterior, 7)
+        self.assertEqual(list(regreso), list(segunda))
+        self.assertTrue(regreso.has_previous() and regreso.has_next())
+        inicio = paginar_por_cursor(Equipo.objects.all(), segunda.cursor_anterior, 7)
+        self.assertEqual((list(inicio), inicio.es_primera, inicio.has_previous()), (list(primera), True, False))
+        self.assertEqual(list(paginar_por_cursor(Equipo.objects.all(), "no-es-cursor", 7)), list(primera))
+
+    def test_un_alta_no_corre_las_filas_de_la_pagina_siguiente(self):
+        primera = paginar_por_cursor(Equipo.objects.all(), None, 7)
+        self.crear_equipo("INV99", "SER99")
+        segunda = paginar_por_cursor(Equipo.objects.all(), primera.cursor_siguiente, 7)
+        self.assertEqual([equipo.pk for equipo in segunda], self.esperado[7:14])
+
+    def test_la_lista_pagina_igual_con_cursor_y_con_numeros(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "clave"))
+        pks = []
+        cursor = None
+        while True:
+            respuesta = self.client.get(reverse("equipos_list"), {"cursor": cursor} if cursor else {})
+            pks += [equipo.pk for equipo in respuesta.context["equipos"]]
+            cursor = respuesta.context["equipos"].cursor_siguiente
+            if cursor is None:
+                break
+        por_numero = []
+        with override_settings(EQUIPOS_PAGINACION="paginas"):
+            for numero in (1, 2):
+                respuesta = self.client.get(reverse("equipos_list"), {"page": numero})
+                por_numero += [equipo.pk for equipo in respuesta.context["equipos"]]
+        self.assertEqual(pks, self.esperado)
+        self.assertEqual(por_numero, self.esperado)
+
+
+# Con transacciones reales: la versión del inventario sube al confirmar cada escritura.
+class OpcionesFiltrosTests(ImportacionMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.dell = Marca.objects.create(nombre="Dell")
+        Marca.objects.create(nombre="Sin equipos")
+        self.crear_equipo("INV1", "SER1", marca=self.dell, entidad="Jalisco", municipio="Zapopan")
+        self.crear_equipo("INV2", "SER2", entidad="Colima", municipio="")
+        self.crear_equipo("INV3", "SER3", entidad="Jalisco")
+
+    def test_solo_lista_lo_que_usa_algun_equipo(self):
+        opciones = opciones_filtros()
+        self.assertEqual(opciones["marcas"], [(self.dell.pk, "Dell")])
+        self.assertEqual(opciones["entidades"], ["Colima", "Jalisco"])
+        self.assertEqual(opciones["municipios"], ["Zapopan"])
+        self.assertEqual([codigo for _, codigo, _ in opciones["centros_costo"]], ["C1"])
+        self.assertEqual(opciones_filtros("entidades"), {"entidades": ["Colima", "Jalisco"]})
+
+    def test_la_cache_dura_hasta_que_cambia_el_inventario(self):
+        hp = Marca.objects.create(nombre="HP")
+        opciones_filtros()
+        # Ya en caché solo se consulta la versión del inventario.
+        with self.assertNumQueries(1):
+            self.assertEqual(opciones_filtros("marcas"), {"marcas": [(self.dell.pk, "Dell")]})
+
+        self.crear_equipo("INV4", "SER4", marca=hp, entidad="Nayarit")
+        opciones = opciones_filtros()
+        self.assertEqual(opciones["marcas"], [(self.dell.pk, "Dell"), (hp.pk, "HP")])
+        self.assertEqual(opciones["entidades"], ["Colima", "Jalisco", "Nayarit"])
+
+        # Los catálogos también cuentan: un nombre cambiado aparece en la siguiente consulta.
+        self.dell.nombre = "Dell Inc."
+        self.dell.save()
+        self.assertEqual(opciones_filtros("marcas")["marcas"][0], (self.dell.pk, "Dell Inc."))
+
+    def test_una_importacion_invalida_las_opciones(self):
+        opciones_filtros()
+        ruta = self.escribir_csv([fila("INV5", "SER5", marca="Lenovo")])
+        import_inventario_csv(ruta, "update_create", batch_size=10)
+        self.assertIn("Lenovo", [nombre for _, nombre in opciones_filtros("marcas")["marcas"]])
+
+
+class FacetasListaTests(ImportacionTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        sociedad = Sociedad.objects.create(codigo="S2", nombre="Sociedad 2")
+        division = Division.objects.create(sociedad=sociedad, codigo="D2", nombre="División 2")
+        centros = [self.centro_costo, CentroCosto.objects.create(division=division, codigo="C2", nombre="C2")]
+        marcas = [Marca.objects.create(nombre="Dell"), Marca.objects.create(nombre="HP"), None]
+        sistemas = [SistemaOperativo.objects.create(nombre="Windows"), SistemaOperativo.objects.create(nombre="Linux")]
+        for numero in range(30):
+            equipo = self.crear_equipo(
+                f"INV{numero}",
+                f"SER{numero}",
+                marca=marcas[numero % 3],
+                sistema_operativo=sistemas[numero % 2],
+                infraestructura_critica=numero % 5 == 0,
+                is_baja=numero % 7 == 0,
+            )
+            if numero % 4 == 0:
+                equipo.centro_costo = centros[1]
+                equipo.save()
+
+    def valores(self, equipo):
+        return {
+            "marca": str(equipo.marca_id or ""),
+            "sistema_operativo": str(equipo.sistema_operativo_id or ""),
+            "tipo_equipo": str(equipo.tipo_equipo_id or ""),
+            "sociedad": str(equipo.centro_costo.division.sociedad_id),
+            "estado": "baja" if equipo.is_baja else "activo",
+            "critico": "1" if equipo.infraestructura_critica else "0",
+        }
+
+    def contar_a_mano(self, seleccion):
+        # Cada faceta con las demás selecciones aplicadas y sin la suya.
+        esperado = {nombre: {} for nombre in FACETAS}
+        todos = [self.valores(equipo) for equipo in Equipo.objects.select_related("centro_costo__division")]
+        for valores in todos:
+            for nombre in FACETAS:
+                if all(seleccion[otra] in ("", valores[otra]) for otra in FACETAS if otra != nombre):
+                    esperado[nombre][valores[nombre]] = esperado[nombre].get(valores[nombre], 0) + 1
+        return esperado
+
+    def test_conteos_disyuntivos(self):
+        marca = str(Marca.objects.get(nombre="Dell").pk)
+        sociedad = str(Sociedad.objects.get(codigo="S2").pk)
+        selecciones = (
+            {},
+            {"estado": "activo"},
+            {"marca": marca, "estado": "activo"},
+            {"marca": marca, "sociedad": sociedad, "critico": "1"},
+            {"estado": "baja", "marca": ""},
+        )
+        for elegidas in selecciones:
+            seleccion = dict(dict.fromkeys(FACETAS, ""), **elegidas)
+            with self.subTest(**elegidas):
+                facetas, aproximado = facetas_equipos(Equipo.objects.all(), {"texto": ""}, seleccion)
+                self.assertFalse(aproximado)
+                self.assertEqual(facetas, self.contar_a_mano(seleccion))
+
+    def test_cambiar_una_faceta_no_vuelve_a_consultar(self):
+        seleccion = dict.fromkeys(FACETAS, "")
+        facetas_equipos(Equipo.objects.all(), {"texto": "", "marca": ""}, seleccion)
+        marca = str(Marca.objects.get(nombre="HP").pk)
+        # Solo la consulta de la versión del inventario: el cubo sale de la caché.
+        with self.assertNumQueries(1):
+            facetas, _ = facetas_equipos(
+                Equipo.objects.all(), {"texto": "", "marca": marca}, dict(seleccion, marca=marca)
+            )
+        self.assertEqual(facetas, self.contar_a_mano(dict(seleccion, marca=marca)))
+        # Otro filtro que no es faceta sí arma un cubo nuevo.
+        con_texto = Equipo.objects.filter(numero_serie__startswith="SER1")
+        facetas, _ = facetas_equipos(con_texto, {"texto": "SER1"}, seleccion)
+        self.assertEqual(sum(facetas["marca"].values()), con_texto.count())
+
+    def test_la_lista_muestra_los_conteos_en_los_selects(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "clave"))
+        dell = Marca.objects.get(nombre="Dell")
+        respuesta = self.client.get(reverse("equipos_list"), {"marca": dell.pk})
+        # La faceta elegida cuenta sin su propio filtro: las demás marcas siguen con conteo.
+        conteos = {nombre: conteo for _, nombre, conteo in respuesta.context["marcas"]}
+        esperado = self.contar_a_mano(dict(dict.fromkeys(FACETAS, ""), estado="activo"))["marca"]
+        self.assertEqual(conteos, {marca.nombre: esperado[str(marca.pk)] for marca in Marca.objects.all()})
+
+        cache.clear()
+        with mock.patch("inventario.facetas._cubo", side_effect=PresupuestoAgotado):
+            self.assertEqual(facetas_equipos(Equipo.objects.all(), {}, dict.fromkeys(FACETAS, "")), (None, False))
+            respuesta = self.client.get(reverse("equipos_list"), {"marca": dell.pk})
+        self.assertEqual({conteo for _, _, conteo in respuesta.context["marcas"]}, {None})
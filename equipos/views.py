@@ -2,6 +2,7 @@ import csv
 import re
 from urllib.parse import urlencode
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth import get_user_model
@@ -14,6 +15,11 @@ from django.utils import timezone
 from openpyxl import Workbook
 from openpyxl.styles import Font
 
+from inventario.busqueda import buscar_equipos
+from inventario.conteos import contar_equipos, conteo_en_cache
+from inventario.facetas import FACETAS, facetas_equipos
+from inventario.opciones import opciones_filtros
+
 from .models import (
     AuditLog,
     BajaEquipo,
@@ -27,6 +33,7 @@ from .models import (
     TipoEquipo,
 )
 from .forms import EquipoForm
+from .paginacion import ORDEN_LISTADO, PaginatorConTotal, paginar_por_cursor
 from .permissions import (
     can_audit,
     can_baja,
@@ -38,6 +45,7 @@ from .permissions import (
 
 IP_REGEX = re.compile(r"^(\d{1,3}\.){3}\d{1,3}$")
 MAC_REGEX = re.compile(r"^([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})$")
+HISTORIAL_LIMIT = 50
 
 
 def _build_querystring(request, exclude=None, extra=None):
@@ -51,7 +59,7 @@ def _build_querystring(request, exclude=None, extra=None):
     return params.urlencode()
 
 
-def _get_equipos_queryset(request):
+def _get_equipos_queryset(request, omitir=()):
     texto = request.GET.get("texto", "").strip()
     sociedad_id = request.GET.get("sociedad")
     division_id = request.GET.get("division")
@@ -74,48 +82,40 @@ def _get_equipos_queryset(request):
             "tipo_equipo",
             "modelo",
         )
-        .order_by("-actualizado_en", "identificador")
+        .order_by(*ORDEN_LISTADO)
     )
-    if estado == "activo":
+    if "estado" in omitir:
+        pass
+    elif estado == "activo":
         equipos = equipos.filter(is_baja=False)
     elif estado == "baja":
         equipos = equipos.filter(is_baja=True)
     elif not include_bajas:
         equipos = equipos.filter(is_baja=False)
-    if sociedad_id:
+    if sociedad_id and "sociedad" not in omitir:
         equipos = equipos.filter(centro_costo__division__sociedad_id=sociedad_id)
     if division_id:
         equipos = equipos.filter(centro_costo__division_id=division_id)
     if centro_costo_id:
         equipos = equipos.filter(centro_costo_id=centro_costo_id)
-    if marca_id:
+    if marca_id and "marca" not in omitir:
         equipos = equipos.filter(marca_id=marca_id)
-    if sistema_operativo_id:
+    if sistema_operativo_id and "sistema_operativo" not in omitir:
         equipos = equipos.filter(sistema_operativo_id=sistema_operativo_id)
-    if tipo_equipo_id:
+    if tipo_equipo_id and "tipo_equipo" not in omitir:
         equipos = equipos.filter(tipo_equipo_id=tipo_equipo_id)
     if entidad:
         equipos = equipos.filter(entidad=entidad)
     if municipio:
         equipos = equipos.filter(municipio=municipio)
-    if critico == "1":
+    if "critico" in omitir:
+        pass
+    elif critico == "1":
         equipos = equipos.filter(infraestructura_critica=True)
     elif critico == "0":
         equipos = equipos.filter(infraestructura_critica=False)
     if texto:
-        equipos = equipos.filter(
-            Q(identificador__icontains=texto)
-            | Q(clave__icontains=texto)
-            | Q(numero_inventario__icontains=texto)
-            | Q(numero_serie__icontains=texto)
-            | Q(direccion_ip__icontains=texto)
-            | Q(direccion_mac__icontains=texto)
-            | Q(rpe_responsable__icontains=texto)
-            | Q(nombre_responsable__icontains=texto)
-            | Q(modelo__nombre__icontains=texto)
-            | Q(marca__nombre__icontains=texto)
-            | Q(nombre__icontains=texto)
-        )
+        equipos = buscar_equipos(equipos, texto)
 
     filtros_activos = any(
         [
@@ -146,73 +146,75 @@ def _get_equipos_queryset(request):
         "municipio": municipio,
         "estado": estado,
         "critico": critico,
+        "include_bajas": "1" if include_bajas else "",
     }
     return equipos, filtros, filtros_activos
 
 
+def _facetas_lista(request, filtros):
+    # Conteos por opción de los selects de facetas; la consulta base deja fuera esos filtros
+    # y _sumar los vuelve a aplicar para cada faceta salvo la propia.
+    equipos, _, _ = _get_equipos_queryset(request, omitir=FACETAS)
+    seleccion = {nombre: filtros[nombre] for nombre in FACETAS}
+    if not seleccion["estado"] and not filtros["include_bajas"]:
+        seleccion["estado"] = "activo"
+    return facetas_equipos(equipos, filtros, seleccion)
+
+
+def _opciones_con_conteo(opciones, facetas):
+    # Agrega a cada opción su conteo (None sin facetas) como último elemento de la tupla.
+    for clave, faceta in (
+        ("marcas", "marca"),
+        ("sistemas_operativos", "sistema_operativo"),
+        ("tipos_equipo", "tipo_equipo"),
+        ("sociedades", "sociedad"),
+    ):
+        conteos = facetas[faceta] if facetas else {}
+        opciones[clave] = [
+            (*opcion, conteos.get(str(opcion[0]), 0) if facetas else None) for opcion in opciones[clave]
+        ]
+    return opciones
+
+
 @login_required
 def equipos_list(request):
     equipos, filtros, filtros_activos = _get_equipos_queryset(request)
-    total_encontrados = equipos.count()
+    # La búsqueda por texto ordena por relevancia; esos resultados se paginan por número.
+    por_cursor = (
+        getattr(settings, "EQUIPOS_PAGINACION", "cursor") == "cursor"
+        and "rango_busqueda" not in equipos.query.annotations
+    )
+    if por_cursor:
+        page_obj = paginar_por_cursor(equipos, request.GET.get("cursor"), 25)
+        # El total es opcional: sin pedirlo solo se muestra si ya está en caché.
+        conteo = request.GET.get("conteo")
+        if conteo in ("1", "exacto"):
+            total_encontrados, conteo_aproximado = contar_equipos(equipos, filtros, exacto=conteo == "exacto")
+        else:
+            total_encontrados, conteo_aproximado = conteo_en_cache(filtros), False
+    else:
+        # Los números de página necesitan el total exacto.
+        total_encontrados, conteo_aproximado = contar_equipos(equipos, filtros, exacto=True)
+        paginator = PaginatorConTotal(equipos, 25, total_encontrados)
+        page_obj = paginator.get_page(request.GET.get("page"))
 
-    paginator = Paginator(equipos, 25)
-    page_obj = paginator.get_page(request.GET.get("page"))
+    facetas, facetas_aproximadas = _facetas_lista(request, filtros)
 
     context = {
         "equipos": page_obj,
         "page_obj": page_obj,
-        "sociedades": Equipo.objects.values_list(
-            "centro_costo__division__sociedad__id",
-            "centro_costo__division__sociedad__codigo",
-            "centro_costo__division__sociedad__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__division__sociedad__codigo"),
-        "divisiones": Equipo.objects.values_list(
-            "centro_costo__division__id",
-            "centro_costo__division__codigo",
-            "centro_costo__division__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__division__codigo"),
-        "centros_costo": Equipo.objects.values_list(
-            "centro_costo__id",
-            "centro_costo__codigo",
-            "centro_costo__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__codigo"),
-        "marcas": Equipo.objects.values_list("marca__id", "marca__nombre")
-        .distinct()
-        .order_by("marca__nombre"),
-        "sistemas_operativos": Equipo.objects.values_list(
-            "sistema_operativo__id",
-            "sistema_operativo__nombre",
-        )
-        .distinct()
-        .order_by("sistema_operativo__nombre"),
-        "tipos_equipo": Equipo.objects.values_list("tipo_equipo__id", "tipo_equipo__nombre")
-        .distinct()
-        .order_by("tipo_equipo__nombre"),
-        "entidades": (
-            Equipo.objects.exclude(entidad__isnull=True)
-            .exclude(entidad__exact="")
-            .values_list("entidad", flat=True)
-            .distinct()
-            .order_by("entidad")
-        ),
-        "municipios": (
-            Equipo.objects.exclude(municipio__isnull=True)
-            .exclude(municipio__exact="")
-            .values_list("municipio", flat=True)
-            .distinct()
-            .order_by("municipio")
-        ),
+        **_opciones_con_conteo(dict(opciones_filtros()), facetas),
+        "facetas": facetas,
+        "facetas_aproximadas": facetas_aproximadas,
         "filtros": filtros,
         "total_encontrados": total_encontrados,
+        "conteo_aproximado": conteo_aproximado,
         "filtros_activos": filtros_activos,
-        "pagination_query": _build_querystring(request, exclude={"page"}),
-        "export_query": _build_querystring(request, exclude={"page"}),
+        "por_cursor": por_cursor,
+        "pagination_query": _build_querystring(request, exclude={"page", "cursor"}),
+        "conteo_query": _build_querystring(request, extra={"conteo": "1"}),
+        "conteo_exacto_query": _build_querystring(request, extra={"conteo": "exacto"}),
+        "export_query": _build_querystring(request, exclude={"page", "cursor", "conteo"}),
         "can_baja": can_baja(request.user),
         "can_edit": can_edit(request.user),
         "can_import": can_import(request.user),
@@ -276,6 +278,7 @@ def equipo_detail(request, pk):
     context = {
         "equipo": equipo,
         "bajas": equipo.bajas.all(),
+        "historial": equipo.audit_logs.select_related("usuario").order_by("-fecha", "-pk")[:HISTORIAL_LIMIT],
         "can_baja": can_baja(request.user),
         "can_edit": can_edit(request.user),
     }
@@ -423,7 +426,7 @@ def reporte_inventario_activo(request):
     marca_id = request.GET.get("marca")
     sistema_operativo_id = request.GET.get("sistema_operativo")
     tipo_equipo_id = request.GET.get("tipo_equipo")
-    texto = request.GET.get("texto")
+    texto = request.GET.get("texto", "").strip()
 
     if sociedad_id:
         equipos = equipos.filter(centro_costo__division__sociedad_id=sociedad_id)
@@ -438,12 +441,7 @@ def reporte_inventario_activo(request):
     if tipo_equipo_id:
         equipos = equipos.filter(tipo_equipo_id=tipo_equipo_id)
     if texto:
-        equipos = equipos.filter(
-            Q(identificador__icontains=texto)
-            | Q(numero_inventario__icontains=texto)
-            | Q(numero_serie__icontains=texto)
-            | Q(nombre__icontains=texto)
-        )
+        equipos = buscar_equipos(equipos, texto)
 
     if request.GET.get("export") == "1":
         if not can_view_report(request.user):
@@ -455,39 +453,14 @@ def reporte_inventario_activo(request):
 
     context = {
         "page_obj": page_obj,
-        "sociedades": Equipo.objects.values_list(
-            "centro_costo__division__sociedad__id",
-            "centro_costo__division__sociedad__codigo",
-            "centro_costo__division__sociedad__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__division__sociedad__codigo"),
-        "divisiones": Equipo.objects.values_list(
-            "centro_costo__division__id",
-            "centro_costo__division__codigo",
-            "centro_costo__division__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__division__codigo"),
-        "centros_costo": Equipo.objects.values_list(
-            "centro_costo__id",
-            "centro_costo__codigo",
-            "centro_costo__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__codigo"),
-        "marcas": Equipo.objects.values_list("marca__id", "marca__nombre")
-        .distinct()
-        .order_by("marca__nombre"),
-        "sistemas_operativos": Equipo.objects.values_list(
-            "sistema_operativo__id",
-            "sistema_operativo__nombre",
-        )
-        .distinct()
-        .order_by("sistema_operativo__nombre"),
-        "tipos_equipo": Equipo.objects.values_list("tipo_equipo__id", "tipo_equipo__nombre")
-        .distinct()
-        .order_by("tipo_equipo__nombre"),
+        **opciones_filtros(
+            "sociedades",
+            "divisiones",
+            "centros_costo",
+            "marcas",
+            "sistemas_operativos",
+            "tipos_equipo",
+        ),
         "filtros": {
             "sociedad": sociedad_id or "",
             "division": division_id or "",
@@ -591,25 +564,6 @@ def reporte_centro_costo(request):
         )
     )
 
-    sociedades = (
-        Equipo.objects.values_list(
-            "centro_costo__division__sociedad__id",
-            "centro_costo__division__sociedad__codigo",
-            "centro_costo__division__sociedad__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__division__sociedad__codigo")
-    )
-    divisiones = (
-        Equipo.objects.values_list(
-            "centro_costo__division__id",
-            "centro_costo__division__codigo",
-            "centro_costo__division__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__division__codigo")
-    )
-
     resumen_agrupado = []
     sociedad_actual = None
     division_actual = None
@@ -773,8 +727,7 @@ def reporte_centro_costo(request):
 
     context = {
         "resumen": resumen_agrupado,
-        "sociedades": sociedades,
-        "divisiones": divisiones,
+        **opciones_filtros("sociedades", "divisiones"),
         "filtros": {
             "sociedad": sociedad_id or "",
             "division": division_id or "",
@@ -838,27 +791,7 @@ def reporte_responsables(request):
 
     context = {
         "resumen": resumen,
-        "sociedades": Equipo.objects.values_list(
-            "centro_costo__division__sociedad__id",
-            "centro_costo__division__sociedad__codigo",
-            "centro_costo__division__sociedad__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__division__sociedad__codigo"),
-        "divisiones": Equipo.objects.values_list(
-            "centro_costo__division__id",
-            "centro_costo__division__codigo",
-            "centro_costo__division__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__division__codigo"),
-        "centros_costo": Equipo.objects.values_list(
-            "centro_costo__id",
-            "centro_costo__codigo",
-            "centro_costo__nombre",
-        )
-        .distinct()
-        .order_by("centro_costo__codigo"),
+        **opciones_filtros("sociedades", "divisiones", "centros_costo"),
         "filtros": {
             "sociedad": sociedad_id or "",
             "division": division_id or "",
@@ -1120,7 +1053,7 @@ def auditoria_list(request):
     entidad = request.GET.get("entidad")
 
     audit_logs = AuditLog.objects.select_related("usuario", "equipo").order_by("-fecha")
-    import_logs = ImportLog.objects.select_related("usuario").order_by("-fecha")
+    import_logs = ImportLog.objects.select_related("usuario").defer("resumen_errores", "metricas").order_by("-fecha")
 
     if fecha_desde:
         audit_logs = audit_logs.filter(fecha__date__gte=fecha_desde)
@@ -1161,6 +1094,7 @@ def auditoria_list(request):
                     f"Total: {log.total_filas}, "
                     f"Creados: {log.creados}, "
                     f"Actualizados: {log.actualizados}, "
+                    f"Sin cambios: {log.sin_cambios}, "
                     f"Omitidos: {log.omitidos}, "
                     f"Errores: {log.errores}."
                 ),
@@ -1194,13 +1128,7 @@ def auditoria_list(request):
         "page_obj": page_obj,
         "usuarios": usuarios,
         "acciones": acciones_disponibles,
-        "entidades": (
-            Equipo.objects.exclude(entidad__isnull=True)
-            .exclude(entidad__exact="")
-            .values_list("entidad", flat=True)
-            .distinct()
-            .order_by("entidad")
-        ),
+        **opciones_filtros("entidades"),
         "filtros": {
             "fecha_desde": request.GET.get("fecha_desde") or "",
             "fecha_hasta": request.GET.get("fecha_hasta") or "",
@@ -0,0 +1,287 @@
+from django.db import DatabaseError, connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from equipos.models import Equipo, EquipoBusqueda, Marca, ModeloEquipo
+
+# Campos del filtro "texto" de la lista de equipos, en el orden de las columnas del índice.
+CAMPOS_BUSQUEDA = [
+    "identificador",
+    "clave",
+    "numero_inventario",
+    "numero_serie",
+    "direccion_ip",
+    "direccion_mac",
+    "rpe_responsable",
+    "nombre_responsable",
+    "modelo__nombre",
+    "marca__nombre",
+    "nombre",
+]
+# Peso de cada columna en bm25: una coincidencia en identificador o serie pesa más que
+# una en el nombre del responsable.
+PESOS_BUSQUEDA = (10.0, 4.0, 8.0, 8.0, 4.0, 4.0, 3.0, 2.0, 2.0, 2.0, 3.0)
+# Los trigramas no encuentran subcadenas más cortas; ahí se usa el filtro de siempre.
+BUSQUEDA_MIN_CARACTERES = 3
+
+COLUMNAS_EQUIPO = [campo for campo in CAMPOS_BUSQUEDA if "__" not in campo]
+# Columnas de equipos_equipo cuyo cambio obliga a reindexar la fila.
+COLUMNAS_VIGILADAS = COLUMNAS_EQUIPO + ["modelo_id", "marca_id"]
+
+
+def tablas():
+    return {
+        "busqueda": EquipoBusqueda._meta.db_table,
+        "equipo": Equipo._meta.db_table,
+        "marca": Marca._meta.db_table,
+        "modelo": ModeloEquipo._meta.db_table,
+    }
+
+
+def _valores(fila):
+    # Expresiones SQL de cada columna del índice para la fila de equipos_equipo "fila".
+    t = tablas()
+    valores = []
+    for campo in CAMPOS_BUSQUEDA:
+        if campo == "modelo__nombre":
+            valores.append(f"(SELECT nombre FROM {t['modelo']} WHERE id = {fila}.modelo_id)")
+        elif campo == "marca__nombre":
+            valores.append(f"(SELECT nombre FROM {t['marca']} WHERE id = {fila}.marca_id)")
+        else:
+            valores.append(f"{fila}.{campo}")
+    return valores
+
+
+def _columnas():
+    return [campo.split("__")[0] for campo in CAMPOS_BUSQUEDA]
+
+
+def soporta_busqueda(conexion=None):
+    conexion = conexion or connection
+    if conexion.vendor == "postgresql":
+        return True
+    # El tokenizador trigram de FTS5 existe desde SQLite 3.34.
+    return conexion.vendor == "sqlite" and conexion.Database.sqlite_version_info >= (3, 34, 0)
+
+
+def indice_disponible(conexion=None):
+    conexion = conexion or connection
+    if not soporta_busqueda(conexion):
+        return False
+    with conexion.cursor() as cursor:
+        return EquipoBusqueda._meta.db_table in conexion.introspection.table_names(cursor)
+
+
+# SQLite: tabla FTS5 con trigramas (encuentra subcadenas, como icontains) cuyo rowid es el
+# id del equipo. Los triggers la mantienen al día en save(), bulk_create/bulk_update,
+# QuerySet.update() y en las sentencias del motor staging.
+FTS_CREAR = "CREATE VIRTUAL TABLE {busqueda} USING fts5({columnas}, tokenize = 'trigram')"
+FTS_LLENAR = "INSERT INTO {busqueda} (rowid, {columnas}) SELECT e.id, {valores} FROM {equipo} e"
+FTS_RANGO = "INSERT INTO {busqueda} ({busqueda}, rank) VALUES ('rank', 'bm25({pesos})')"
+FTS_TRIGGERS = (
+    """
+CREATE TRIGGER IF NOT EXISTS {busqueda}_ai AFTER INSERT ON {equipo} BEGIN
+    INSERT INTO {busqueda} (rowid, {columnas}) VALUES (new.id, {valores_new});
+END
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS {busqueda}_au AFTER UPDATE OF {vigiladas} ON {equipo}
+WHEN {cambio} BEGIN
+    DELETE FROM {busqueda} WHERE rowid = old.id;
+    INSERT INTO {busqueda} (rowid, {columnas}) VALUES (new.id, {valores_new});
+END
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS {busqueda}_ad AFTER DELETE ON {equipo} BEGIN
+    DELETE FROM {busqueda} WHERE rowid = old.id;
+END
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS {busqueda}_marca AFTER UPDATE OF nombre ON {marca} BEGIN
+    UPDATE {busqueda} SET marca = new.nombre
+    WHERE rowid IN (SELECT id FROM {equipo} WHERE marca_id = new.id);
+END
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS {busqueda}_modelo AFTER UPDATE OF nombre ON {modelo} BEGIN
+    UPDATE {busqueda} SET modelo = new.nombre
+    WHERE rowid IN (SELECT id FROM {equipo} WHERE modelo_id = new.id);
+END
+""",
+)
+
+# PostgreSQL: una fila por equipo con el texto de todas las columnas separado por \x1f
+# (así una subcadena no cruza de una columna a otra) y un índice GIN de trigramas, que
+# resuelve ILIKE '%texto%' sin recorrer la tabla.
+PG_CREAR = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE TABLE IF NOT EXISTS {busqueda} (rowid bigint PRIMARY KEY, documento text NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS {busqueda}_trgm ON {busqueda} USING gin (documento gin_trgm_ops)",
+)
+PG_LLENAR = """
+INSERT INTO {busqueda} (rowid, documento) SELECT e.id, concat_ws(chr(31), {valores}) FROM {equipo} e
+ON CONFLICT (rowid) DO UPDATE SET documento = excluded.documento
+"""
+PG_FUNCIONES = (
+    """
+CREATE OR REPLACE FUNCTION {busqueda}_equipo() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM {busqueda} WHERE rowid = OLD.id;
+        RETURN OLD;
+    END IF;
+    INSERT INTO {busqueda} (rowid, documento) VALUES (NEW.id, concat_ws(chr(31), {valores_new}))
+    ON CONFLICT (rowid) DO UPDATE SET documento = excluded.documento;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""",
+    """
+CREATE OR REPLACE FUNCTION {busqueda}_catalogo() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO {busqueda} (rowid, documento)
+    SELECT e.id, concat_ws(chr(31), {valores}) FROM {equipo} e
+    WHERE (TG_TABLE_NAME = '{marca}' AND e.marca_id = NEW.id)
+       OR (TG_TABLE_NAME = '{modelo}' AND e.modelo_id = NEW.id)
+    ON CONFLICT (rowid) DO UPDATE SET documento = excluded.documento;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""",
+    # manage.py flush vacía equipos_equipo con TRUNCATE, que no dispara los triggers por fila.
+    """
+CREATE OR REPLACE FUNCTION {busqueda}_vaciar() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM {busqueda};
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+""",
+)
+PG_TRIGGERS = (
+    ("{busqueda}_ai", "{equipo}", "AFTER INSERT OR DELETE", "FOR EACH ROW", "{busqueda}_equipo"),
+    ("{busqueda}_au", "{equipo}", "AFTER UPDATE OF {vigiladas}", "FOR EACH ROW WHEN ({cambio_pg})", "{busqueda}_equipo"),
+    ("{busqueda}_at", "{equipo}", "AFTER TRUNCATE", "FOR EACH STATEMENT", "{busqueda}_vaciar"),
+    ("{busqueda}_marca", "{marca}", "AFTER UPDATE OF nombre", "FOR EACH ROW", "{busqueda}_catalogo"),
+    ("{busqueda}_modelo", "{modelo}", "AFTER UPDATE OF nombre", "FOR EACH ROW", "{busqueda}_catalogo"),
+)
+CREAR_TRIGGER_PG = "CREATE TRIGGER {0} {2} ON {1} {3} EXECUTE FUNCTION {4}()"
+
+
+def _formato():
+    columnas = _columnas()
+    return {
+        **tablas(),
+        "columnas": ", ".join(columnas),
+        "valores": ", ".join(_valores("e")),
+        "valores_new": ", ".join(_valores("new")),
+        "vigiladas": ", ".join(COLUMNAS_VIGILADAS),
+        "cambio": " OR ".join(f"old.{columna} IS NOT new.{columna}" for columna in COLUMNAS_VIGILADAS),
+        "cambio_pg": " OR ".join(f"OLD.{columna} IS DISTINCT FROM NEW.{columna}" for columna in COLUMNAS_VIGILADAS),
+        "pesos": ", ".join(str(peso) for peso in PESOS_BUSQUEDA),
+    }
+
+
+def instalar_indice(conexion=None):
+    # Idempotente: crea y llena el índice si no existe y vuelve a crear los triggers, que
+    # SQLite pierde cuando una migración reconstruye equipos_equipo. Devuelve False si la
+    # base no lo soporta; la búsqueda sigue entonces con icontains.
+    conexion = conexion or connection
+    if not soporta_busqueda(conexion):
+        return False
+    formato = _formato()
+    nuevo = not indice_disponible(conexion)
+    with conexion.cursor() as cursor:
+        if conexion.vendor == "postgresql":
+            for sentencia in PG_CREAR + PG_FUNCIONES:
+                cursor.execute(sentencia.format(**formato))
+            for trigger in PG_TRIGGERS:
+                nombre, tabla, *_ = partes = [parte.format(**formato) for parte in trigger]
+                cursor.execute(f"DROP TRIGGER IF EXISTS {nombre} ON {tabla}")
+                cursor.execute(CREAR_TRIGGER_PG.format(*partes))
+            if nuevo:
+                cursor.execute(PG_LLENAR.format(**formato))
+            return True
+        if nuevo:
+            try:
+                cursor.execute(FTS_CREAR.format(**formato))
+            except DatabaseError:
+                # SQLite compilado sin FTS5.
+                return False
+            cursor.execute(FTS_RANGO.format(**formato))
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            [formato["busqueda"] + "_%"],
+        )
+        completo = cursor.fetchone()[0] == len(FTS_TRIGGERS)
+        for sentencia in FTS_TRIGGERS:
+            cursor.execute(sentencia.format(**formato))
+    if not completo:
+        # Índice nuevo, o la tabla se reconstruyó sin triggers y pudo quedar desfasado.
+        reconstruir_indice(conexion)
+    return True
+
+
+def reconstruir_indice(conexion=None):
+    conexion = conexion or connection
+    if not indice_disponible(conexion):
+        return instalar_indice(conexion)
+    formato = _formato()
+    with conexion.cursor() as cursor:
+        cursor.execute("DELETE FROM {busqueda}".format(**formato))
+        if conexion.vendor == "postgresql":
+            cursor.execute(PG_LLENAR.format(**formato))
+        else:
+            cursor.execute(FTS_LLENAR.format(**formato))
+    return True
+
+
+def eliminar_indice(conexion=None):
+    conexion = conexion or connection
+    formato = _formato()
+    with conexion.cursor() as cursor:
+        if conexion.vendor == "postgresql":
+            cursor.execute("DROP TABLE IF EXISTS {busqueda}".format(**formato))
+            cursor.execute("DROP FUNCTION IF EXISTS {busqueda}_equipo() CASCADE".format(**formato))
+            cursor.execute("DROP FUNCTION IF EXISTS {busqueda}_catalogo() CASCADE".format(**formato))
+            cursor.execute("DROP FUNCTION IF EXISTS {busqueda}_vaciar() CASCADE".format(**formato))
+        elif conexion.vendor == "sqlite":
+            for sufijo in ("ai", "au", "ad", "marca", "modelo"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {formato['busqueda']}_{sufijo}")
+            cursor.execute("DROP TABLE IF EXISTS {busqueda}".format(**formato))
+
+
+def filtro_texto(texto):
+    filtro = Q()
+    for campo in CAMPOS_BUSQUEDA:
+        filtro |= Q(**{f"{campo}__icontains": texto})
+    return filtro
+
+
+def _escapar_like(texto):
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def buscar_equipos(equipos, texto):
+    # Filtra por texto a través del índice y ordena por relevancia, conservando el orden
+    # previo del queryset como desempate. Sin índice (o con menos de tres caracteres)
+    # aplica el OR de icontains sobre los mismos campos.
+    if len(texto) < BUSQUEDA_MIN_CARACTERES or not indice_disponible():
+        return equipos.filter(filtro_texto(texto))
+    tabla = connection.ops.quote_name(EquipoBusqueda._meta.db_table)
+    if connection.vendor == "postgresql":
+        coincide = RawSQL(f"{tabla}.documento ILIKE %s", (f"%{_escapar_like(texto)}%",), output_field=BooleanField())
+        rango = RawSQL(f"-word_similarity(%s, {tabla}.documento)", (texto,), output_field=FloatField())
+    else:
+        # Frase entre comillas: la subcadena completa, dentro de una sola columna.
+        frase = '"' + texto.replace('"', '""') + '"'
+        coincide = RawSQL(f"{tabla} MATCH %s", (frase,), output_field=BooleanField())
+        rango = RawSQL(f"{tabla}.rank", (), output_field=FloatField())
+    orden = equipos.query.order_by or Equipo._meta.ordering
+    # busqueda__isnull=False agrega el INNER JOIN con el índice que usan MATCH y rank.
+    return (
+        equipos.filter(busqueda__isnull=False)
+        .filter(coincide)
+        .annotate(rango_busqueda=rango)
+        .order_by("rango_busqueda", *orden)
+    )
@@ -0,0 +1,100 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from equipos.models import Equipo, VersionInventario
+
+VERSION_INVENTARIO = "equipos"
+# La estimación cuenta el filtro sobre CONTEO_VENTANAS rangos de ids repartidos en la
+# tabla, CONTEO_MUESTRA filas en total, y lo escala al rango completo de ids.
+CONTEO_VENTANAS = 20
+CONTEO_MUESTRA = 20000
+# Con menos coincidencias en la muestra el filtro es selectivo: la estimación sería poco
+# fiable y el conteo exacto cuesta lo mismo que buscar la página.
+CONTEO_MINIMO_MUESTRA = 50
+
+
+def version_inventario():
+    version = VersionInventario.objects.filter(nombre=VERSION_INVENTARIO).values_list("version", flat=True).first()
+    return version or 0
+
+
+def incrementar_version():
+    if not VersionInventario.objects.filter(nombre=VERSION_INVENTARIO).update(version=F("version") + 1):
+        try:
+            VersionInventario.objects.get_or_create(nombre=VERSION_INVENTARIO)
+        except IntegrityError:
+            pass
+        VersionInventario.objects.filter(nombre=VERSION_INVENTARIO).update(version=F("version") + 1)
+
+
+def marcar_cambio():
+    # Una vez por transacción y al confirmarla: así una importación larga no retiene la
+    # fila del contador, y nadie guarda en caché un conteo con la versión nueva antes de
+    # que los datos nuevos sean visibles.
+    conexion = transaction.get_connection()
+    if any(funcion is incrementar_version for _, funcion, *_ in conexion.run_on_commit):
+        return
+    transaction.on_commit(incrementar_version)
+
+
+def clave_filtros(prefijo, filtros):
+    normalizados = sorted((campo, str(valor).strip()) for campo, valor in filtros.items() if valor)
+    huella = hashlib.sha256(json.dumps(normalizados).encode("utf-8")).hexdigest()[:32]
+    return f"equipos:{prefijo}:{version_inventario()}:{huella}"
+
+
+def muestra_ids():
+    # (filtro de la muestra, factor de escala), o None cuando la tabla es chica y contar
+    # de verdad sale barato.
+    ids = Equipo.objects.order_by("pk").values_list("pk", flat=True)
+    minimo, maximo = ids.first(), ids.last()
+    if minimo is None:
+        return None
+    extension = maximo - minimo + 1
+    if extension <= getattr(settings, "EQUIPOS_CONTEO_EXACTO_HASTA", 200000):
+        return None
+    paso = extension / CONTEO_VENTANAS
+    ventana = min(CONTEO_MUESTRA // CONTEO_VENTANAS, int(paso))
+    muestra = Q()
+    for numero in range(CONTEO_VENTANAS):
+        inicio = minimo + int(numero * paso)
+        muestra |= Q(pk__gte=inicio, pk__lt=inicio + ventana)
+    return muestra, extension / (ventana * CONTEO_VENTANAS)
+
+
+def estimar_conteo(equipos):
+    muestra = muestra_ids()
+    if muestra is None:
+        return None
+    filtro, factor = muestra
+    encontrados = equipos.filter(filtro).count()
+    if encontrados < CONTEO_MINIMO_MUESTRA:
+        return None
+    return round(encontrados * factor)
+
+
+def conteo_en_cache(filtros):
+    # El total exacto ya calculado para estos filtros, o None; no toca la tabla.
+    return cache.get(clave_filtros("conteo", filtros))
+
+
+def contar_equipos(equipos, filtros, exacto=False):
+    # Devuelve (total, aproximado). El total exacto se guarda en caché por filtros
+    # normalizados y versión del inventario; sin caché y con la tabla grande se estima,
+    # salvo que se pida exacto.
+    clave = clave_filtros("conteo", filtros)
+    total = cache.get(clave)
+    if total is not None:
+        return total, False
+    if not exacto:
+        estimado = estimar_conteo(equipos)
+        if estimado is not None:
+            return estimado, True
+    total = equipos.count()
+    cache.set(clave, total, getattr(settings, "EQUIPOS_CONTEO_CACHE_TIMEOUT", 3600))
+    return total, False
@@ -0,0 +1,132 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count
+
+from equipos.models import CentroCosto
+from inventario.conteos import CONTEO_MINIMO_MUESTRA, clave_filtros, muestra_ids
+
+# Facetas del listado, en el orden de las columnas del cubo. La sociedad no está en
+# equipos_equipo: se saca del centro de costo con el catálogo, que es chico.
+FACETAS = ("marca", "sistema_operativo", "tipo_equipo", "sociedad", "estado", "critico")
+COLUMNAS_CUBO = (
+    "marca_id",
+    "sistema_operativo_id",
+    "tipo_equipo_id",
+    "centro_costo_id",
+    "is_baja",
+    "infraestructura_critica",
+)
+# Hasta cuántas filas estimadas se agrupa la consulta completa en vez de la muestra.
+FACETAS_EXACTAS_HASTA = 50000
+
+
+class PresupuestoAgotado(Exception):
+    pass
+
+
+@contextmanager
+def limite_tiempo(milisegundos):
+    # Corta la consulta que se pase del presupuesto. En SQLite con un progress handler que
+    # interrumpe la sentencia; en PostgreSQL con statement_timeout local a un savepoint.
+    try:
+        if connection.vendor == "sqlite":
+            limite = time.monotonic() + milisegundos / 1000
+            connection.ensure_connection()
+            connection.connection.set_progress_handler(lambda: time.monotonic() > limite, 10000)
+            try:
+                yield
+            finally:
+                connection.connection.set_progress_handler(None, 0)
+        elif connection.vendor == "postgresql":
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout = %s", [int(milisegundos)])
+                yield
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout TO DEFAULT")
+        else:
+            yield
+    except OperationalError as exc:
+        raise PresupuestoAgotado() from exc
+
+
+def _cubo(equipos):
+    # Una sola pasada: filas agrupadas por todas las columnas de facetas a la vez.
+    filas = equipos.order_by().values_list(*COLUMNAS_CUBO).annotate(total=Count("pk"))
+    sociedades = dict(CentroCosto.objects.values_list("id", "division__sociedad_id"))
+    cubo = Counter()
+    for marca, sistema, tipo, centro, baja, critico, total in filas:
+        valores = (
+            str(marca or ""),
+            str(sistema or ""),
+            str(tipo or ""),
+            str(sociedades.get(centro) or ""),
+            "baja" if baja else "activo",
+            "1" if critico else "0",
+        )
+        cubo[valores] += total
+    return cubo
+
+
+def _calcular_cubo(equipos, presupuesto):
+    # Devuelve (cubo, factor). Con la tabla grande primero se agrupa una muestra de ids; si
+    # anticipa pocas filas se agrupa todo (las coincidencias amontonadas en pocos ids, como
+    # un prefijo de inventario, engañan a la muestra) y la muestra escalada queda de
+    # respaldo por si se acaba el tiempo.
+    fin = time.monotonic() + presupuesto / 1000
+    respaldo = None
+    muestra = muestra_ids()
+    if muestra is not None:
+        filtro, factor = muestra
+        with limite_tiempo(max(fin - time.monotonic(), 0) * 1000):
+            cubo = _cubo(equipos.filter(filtro))
+        if sum(cubo.values()) * factor > FACETAS_EXACTAS_HASTA:
+            return cubo, factor
+        if sum(cubo.values()) >= CONTEO_MINIMO_MUESTRA:
+            respaldo = (cubo, factor)
+    try:
+        with limite_tiempo(max(fin - time.monotonic(), 0) * 1000):
+            return _cubo(equipos), 1
+    except PresupuestoAgotado:
+        if respaldo is None:
+            raise
+        return respaldo
+
+
+def _sumar(cubo, seleccion, factor):
+    # Conteo disyuntivo: cada faceta cuenta con los filtros de las demás aplicados y sin el
+    # suyo, así cada opción muestra cuántos equipos habría al elegirla.
+    facetas = {nombre: Counter() for nombre in FACETAS}
+    for valores, total in cubo.items():
+        fuera = [nombre for nombre, valor in zip(FACETAS, valores) if seleccion.get(nombre) not in ("", valor)]
+        if len(fuera) > 1:
+            continue
+        for nombre, valor in zip(FACETAS, valores):
+            if not fuera or fuera == [nombre]:
+                facetas[nombre][valor] += total
+    return {
+        nombre: {valor: round(total * factor) for valor, total in conteos.items()} for nombre, conteos in facetas.items()
+    }
+
+
+def facetas_equipos(equipos, filtros, seleccion):
+    # equipos: la consulta de la lista sin los filtros de facetas; seleccion: el valor
+    # elegido de cada faceta ("" si no hay). Devuelve (facetas, aproximado), o (None, False)
+    # si no alcanzó el presupuesto. El cubo se guarda en caché por los demás filtros y la
+    # versión del inventario, así cambiar una faceta no vuelve a consultar la base.
+    otros = {campo: valor for campo, valor in filtros.items() if campo not in FACETAS and campo != "include_bajas"}
+    clave = clave_filtros("facetas", otros)
+    guardado = cache.get(clave)
+    if guardado is None:
+        try:
+            guardado = _calcular_cubo(equipos, getattr(settings, "EQUIPOS_FACETAS_PRESUPUESTO_MS", 300))
+        except PresupuestoAgotado:
+            return None, False
+        cache.set(clave, guardado, getattr(settings, "EQUIPOS_CONTEO_CACHE_TIMEOUT", 3600))
+    cubo, factor = guardado
+    return _sumar(cubo, seleccion, factor), factor != 1
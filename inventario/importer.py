@@ -1,10 +1,25 @@
+import codecs
 import csv
+import gzip
+import io
+import json
 import re
 import unicodedata
+import uuid
+import zipfile
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import date, datetime, time
+from pathlib import Path
 
-from django.db import transaction
+from django.db import connection, models, transaction
+from django.utils import timezone
+from openpyxl import load_workbook
 
 from equipos.models import (
+    EQUIPO_IMPORT_FIELDS,
+    AuditLog,
     CentroCosto,
     Division,
     Equipo,
@@ -13,9 +28,245 @@ from equipos.models import (
     SistemaOperativo,
     Sociedad,
     TipoEquipo,
+    calcular_import_hash,
 )
+from inventario.conteos import marcar_cambio
+from inventario.metrics import ImportMetrics
 
 ERRORS_LIMIT = 50
+PROGRESS_EVERY = 200
+APPLY_BATCH_SIZE = 500
+PARSE_BLOCK_ROWS = 1000
+LOOKAHEAD_ROWS = 500
+LOAD_CHUNK_SIZE = 10000
+MARCA_FORMATO = "%Y%m%d%H%M%S"
+MODIFICACION_FORMATOS = ("%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M")
+
+
+@contextmanager
+def open_import_file(path, binary=False):
+    # El CSV puede venir comprimido con gzip o zip; se descomprime al vuelo según la
+    # firma del archivo, sin importar la extensión.
+    with ExitStack() as stack:
+        crudo = stack.enter_context(open(path, "rb"))
+        firma = crudo.read(4)
+        crudo.seek(0)
+        if firma[:2] == b"\x1f\x8b":
+            stream = stack.enter_context(gzip.GzipFile(fileobj=crudo))
+        elif firma == b"PK\x03\x04":
+            comprimido = stack.enter_context(zipfile.ZipFile(crudo))
+            miembros = [info for info in comprimido.infolist() if not info.is_dir()]
+            csvs = [info for info in miembros if info.filename.lower().endswith(".csv")]
+            if not (csvs or miembros):
+                raise ValueError("El archivo ZIP no contiene ningún CSV.")
+            stream = stack.enter_context(comprimido.open((csvs or miembros)[0]))
+        else:
+            stream = crudo
+        if binary:
+            yield stream
+        else:
+            yield io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+
+
+class LineasConPosicion:
+    # Entrega las líneas del archivo ya descomprimido llevando el offset en bytes, para
+    # que la importación por bloques pueda guardar un checkpoint y reanudar desde él.
+    def __init__(self, binario):
+        self.binario = binario
+        self.posicion = 0
+
+    def saltar(self, posicion):
+        self.binario.seek(posicion)
+        self.posicion = posicion
+
+    def __iter__(self):
+        readline = self.binario.readline
+        while True:
+            linea = readline()
+            if not linea:
+                return
+            if self.posicion == 0 and linea.startswith(codecs.BOM_UTF8):
+                texto = linea[len(codecs.BOM_UTF8):].decode("utf-8", errors="replace")
+            else:
+                texto = linea.decode("utf-8", errors="replace")
+            self.posicion += len(linea)
+            yield texto
+
+
+def es_xlsx(path):
+    # Un .xlsx también es un ZIP; se distingue de un CSV comprimido por xl/workbook.xml.
+    try:
+        with zipfile.ZipFile(path) as comprimido:
+            return "xl/workbook.xml" in comprimido.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+def texto_celda(valor):
+    # Las celdas llegan tipadas; se llevan al texto que traería el CSV exportado.
+    if valor is None:
+        return ""
+    if isinstance(valor, str):
+        return valor
+    if isinstance(valor, bool):
+        return "SI" if valor else "NO"
+    if isinstance(valor, datetime):
+        return valor.strftime("%d/%m/%Y %H:%M:%S" if valor.second else "%d/%m/%Y %H:%M")
+    if isinstance(valor, date):
+        return valor.strftime("%d/%m/%Y")
+    if isinstance(valor, time):
+        return valor.strftime("%H:%M:%S")
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+class FilasXlsx:
+    # Recorre una hoja abierta en modo read_only (sin cargarla completa) y entrega las
+    # filas como listas de texto, igual que csv.reader. posicion cuenta las filas de la
+    # hoja ya leídas y sirve de checkpoint, como el offset en bytes del CSV.
+    def __init__(self, hoja):
+        self.filas = hoja.iter_rows(values_only=True)
+        self.posicion = 0
+
+    def saltar(self, posicion):
+        while self.posicion < posicion and next(self.filas, None) is not None:
+            self.posicion += 1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        valores = next(self.filas)
+        self.posicion += 1
+        if all(valor is None for valor in valores):
+            return []
+        return [texto_celda(valor) for valor in valores]
+
+
+def elegir_hoja(libro, hoja=None):
+    # hoja puede ser el nombre o el número (desde 1); sin hoja se usa la primera.
+    if hoja in (None, ""):
+        return libro.worksheets[0]
+    if str(hoja) in libro.sheetnames:
+        return libro[str(hoja)]
+    if str(hoja).isdigit() and 1 <= int(hoja) <= len(libro.worksheets):
+        return libro.worksheets[int(hoja) - 1]
+    raise ValueError(f"El archivo no tiene la hoja {hoja!r} (hojas: {', '.join(libro.sheetnames)}).")
+
+
+@contextmanager
+def open_import_rows(path, hoja=None, posicional=False):
+    # Devuelve (lector, lineas): lector entrega las filas del CSV o de la hoja del .xlsx
+    # como listas de texto; lineas (solo con posicional) lleva la posición para saltar().
+    if es_xlsx(path):
+        libro = load_workbook(path, read_only=True, data_only=True)
+        try:
+            filas = FilasXlsx(elegir_hoja(libro, hoja))
+            yield filas, filas
+        finally:
+            libro.close()
+        return
+    with open_import_file(path, binary=posicional) as archivo:
+        lineas = LineasConPosicion(archivo) if posicional else None
+        yield csv.reader(lineas if posicional else archivo), lineas
+
+
+class RegistroErrores:
+    # Cada error se escribe al momento en un CSV comprimido con gzip (si hay ruta); en
+    # memoria solo queda la muestra de ERRORS_LIMIT que se guarda en ImportLog.
+    def __init__(self, ruta=None, muestra=None, posicion=None, copiar_de=None):
+        self.muestra = list(muestra or [])
+        self.total = len(self.muestra)
+        self.ruta = Path(ruta) if ruta else None
+        self._crudo = None
+        if self.ruta is None:
+            return
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        nuevo = posicion is None or not self.ruta.exists()
+        if nuevo:
+            self._crudo = open(self.ruta, "wb")
+        else:
+            # Al reanudar se descarta lo escrito después del último checkpoint.
+            self._crudo = open(self.ruta, "r+b")
+            self._crudo.truncate(posicion)
+            self._crudo.seek(posicion)
+        self._abrir_miembro()
+        if nuevo:
+            self._escritor.writerow(["fila", "identificador", "mensaje"])
+        if copiar_de and Path(copiar_de).exists():
+            # La muestra ya viene incluida en el archivo copiado.
+            self.total = 0
+            with gzip.open(copiar_de, "rt", encoding="utf-8", newline="") as previo:
+                lector = csv.reader(previo)
+                next(lector, None)
+                for row in lector:
+                    self._escritor.writerow(row)
+                    self.total += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cerrar()
+
+    def _abrir_miembro(self):
+        self._texto = io.TextIOWrapper(gzip.GzipFile(fileobj=self._crudo, mode="wb"), encoding="utf-8", newline="")
+        self._escritor = csv.writer(self._texto)
+
+    def agregar(self, fila, identificador, mensaje, en_muestra=True):
+        self.total += 1
+        if en_muestra and len(self.muestra) < ERRORS_LIMIT:
+            self.muestra.append({"fila": fila, "identificador": identificador, "mensaje": mensaje})
+        if self._crudo is not None:
+            self._escritor.writerow([fila, identificador, mensaje])
+
+    def punto_de_control(self):
+        # Cierra el miembro gzip en curso (gzip admite varios concatenados) y devuelve el
+        # tamaño del archivo, que es donde se trunca si hay que reanudar.
+        if self._crudo is None:
+            return None
+        self._texto.close()
+        self._crudo.flush()
+        posicion = self._crudo.tell()
+        self._abrir_miembro()
+        return posicion
+
+    @property
+    def archivo(self):
+        return str(self.ruta) if self.ruta is not None and self.total else None
+
+    def cerrar(self):
+        if self._crudo is None:
+            return
+        self._texto.close()
+        self._crudo.close()
+        self._crudo = None
+        if not self.total:
+            self.ruta.unlink(missing_ok=True)
+
+
+class TransaccionPorBloques:
+    # Sin chunk_size equivale a transaction.atomic(); con chunk_size, confirmar() hace
+    # commit del bloque y abre el siguiente, así otras escrituras entran entre bloques.
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size
+        self.atomic = None
+
+    def __enter__(self):
+        self._abrir()
+        return self
+
+    def _abrir(self):
+        self.atomic = transaction.atomic()
+        self.atomic.__enter__()
+
+    def confirmar(self):
+        self.atomic.__exit__(None, None, None)
+        self._abrir()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.atomic.__exit__(exc_type, exc_value, traceback)
 
 
 def normalize_value(value):
@@ -38,24 +289,115 @@ def normalize_header(value):
     return "".join(char for char in cleaned if not unicodedata.combining(char))
 
 
-def build_normalized_row(row):
-    return {normalize_header(key): value for key, value in row.items()}
+IMPORT_COLUMNS = (
+    (
+        "inventario",
+        (
+            "Número de inventario*",
+            "Número de inventario",
+            "Numero de inventario",
+            "No. de inventario",
+            "Inventario",
+        ),
+    ),
+    (
+        "numero_serie",
+        ("Número de serie*", "Número de serie", "Numero de serie", "No. de serie", "Serie"),
+    ),
+    ("clave", ("Clave",)),
+    ("nombre", ("Nombre",)),
+    ("sociedad", ("Sociedad",)),
+    ("sociedad_nombre", ("Nombre de Sociedad",)),
+    ("division", ("División", "Division")),
+    ("division_nombre", ("Nombre de División", "Nombre de Division")),
+    ("centro_costo", ("Centro de Costo", "Centro de costo")),
+    ("marca", ("Marca",)),
+    ("sistema_operativo", ("Sistema operativo",)),
+    ("tipo_equipo", ("Tipo de equipos", "Tipo de equipo")),
+    ("modelo", ("Modelo",)),
+    ("codigo_postal", ("Código Postal", "Codigo Postal")),
+    ("domicilio", ("Domicilio",)),
+    ("antiguedad", ("Antigüedad", "Antiguedad")),
+    ("rpe_responsable", ("RPE de Responsable",)),
+    ("nombre_responsable", ("Nombre de Responsable",)),
+    ("infraestructura_critica", ("Es infraestructura crítica?", "Es infraestructura critica?")),
+    ("direccion_ip", ("Dirección IP", "Direccion IP", "IP")),
+    ("direccion_mac", ("Dirección MAC", "Direccion MAC", "MAC")),
+    ("entidad", ("Entidad",)),
+    ("municipio", ("Municipio",)),
+    ("modificacion", ("Modificación", "Modificacion")),
+)
+
+REQUIRED_COLUMNS = ("numero_serie", "sociedad", "division", "centro_costo")
+
+
+class HeaderMap:
+    def __init__(self, header):
+        normalizados = [normalize_header(columna) for columna in header]
+        posiciones = {}
+        for index, nombre in enumerate(normalizados):
+            posiciones.setdefault(nombre, []).append(index)
+
+        self.indices = {}
+        usados = set()
+        for campo, aliases in IMPORT_COLUMNS:
+            candidatos = []
+            for alias in aliases:
+                encontrados = posiciones.get(normalize_header(alias))
+                # Con encabezados repetidos (p. ej. "Nombre") gana la última columna,
+                # igual que con csv.DictReader.
+                if encontrados and encontrados[-1] not in candidatos:
+                    candidatos.append(encontrados[-1])
+            self.indices[campo] = tuple(candidatos)
+            usados.update(candidatos)
 
+        self.faltantes = [campo for campo, _ in IMPORT_COLUMNS if not self.indices[campo]]
+        self.faltantes_obligatorias = [campo for campo in REQUIRED_COLUMNS if not self.indices[campo]]
+        self.desconocidas = [
+            header[index] for index, nombre in enumerate(normalizados) if nombre and index not in usados
+        ]
+        self.duplicadas = sorted(
+            {header[indices[0]].lstrip("\ufeff") for nombre, indices in posiciones.items() if nombre and len(indices) > 1}
+        )
 
-def get_row_value(row, normalized_row, *headers):
-    for header in headers:
-        normalized_header = normalize_header(header)
-        if normalized_header in normalized_row and normalized_row[normalized_header] is not None:
-            return normalized_row[normalized_header]
+    def get(self, row, campo):
+        # Una fila más corta que el encabezado cae al siguiente alias disponible.
+        for index in self.indices[campo]:
+            if index < len(row):
+                return row[index]
+        return ""
+
+    def resumen(self):
+        return {
+            "columnas_faltantes": self.faltantes,
+            "columnas_faltantes_obligatorias": self.faltantes_obligatorias,
+            "columnas_desconocidas": self.desconocidas,
+            "columnas_duplicadas": self.duplicadas,
+        }
+
+
+def modificacion_key(value):
+    # Clave ordenable AAAAMMDDHHMMSS; el formato habitual "dd/mm/aaaa hh:mm" se arma
+    # rebanando la cadena, sin datetime ni normalización.
+    if len(value) == 16 and value[2] == "/" and value[5] == "/":
+        clave = value[6:10] + value[3:5] + value[0:2] + value[11:13] + value[14:16] + "00"
+        if clave.isdigit():
+            return clave
+    value = value.strip()
+    if not value:
+        return ""
+    for formato in MODIFICACION_FORMATOS:
+        try:
+            return datetime.strptime(value, formato).strftime(MARCA_FORMATO)
+        except ValueError:
+            continue
     return ""
 
 
-def get_or_create_catalog(model, value):
-    cleaned = normalize_value(value)
-    if not cleaned:
+def marca_desde_key(clave):
+    if not clave:
         return None
-    obj, _ = model.objects.get_or_create(nombre=cleaned)
-    return obj
+    return timezone.make_aware(datetime.strptime(clave, MARCA_FORMATO))
 
 
 def parse_boolean(value):
@@ -70,158 +412,878 @@ def parse_boolean(value):
     return normalized in {"si", "sí", "s", "true", "1", "x", "yes"}
 
 
-def import_inventario_csv(path, modo):
+def _registrar_liberado(liberados, campos, actuales):
+    # El inventario que deja un equipo solo puede tomarlo otro después de escribir el
+    # cambio, por unique_numero_inventario_nonempty.
+    if actuales is not None and "numero_inventario" in campos and actuales["numero_inventario"]:
+        liberados.add(actuales["numero_inventario"])
+
+
+class BulkEquipoWriter:
+    def __init__(self, batch_size, auditoria=None):
+        self.batch_size = batch_size
+        self.auditoria = auditoria
+        self.pendientes_crear = []
+        self.pendientes_actualizar = {}
+        self.inventarios_liberados = set()
+
+    def __len__(self):
+        return len(self.pendientes_crear) + len(self.pendientes_actualizar)
+
+    def crear(self, equipo, fila=None):
+        self.pendientes_crear.append(equipo)
+        if self.auditoria is not None:
+            self.auditoria.alta(equipo)
+
+    def actualizar(self, equipo, campos, fila=None, actuales=None):
+        _registrar_liberado(self.inventarios_liberados, campos, actuales)
+        # Un alta aún pendiente se escribe con sus valores finales en el bulk_create.
+        if equipo.pk is not None:
+            _, pendientes = self.pendientes_actualizar.get(equipo.pk, (equipo, set()))
+            self.pendientes_actualizar[equipo.pk] = (equipo, pendientes | set(campos))
+            if self.auditoria is not None and actuales is not None:
+                nuevos = {campo: getattr(equipo, campo) for campo in campos}
+                self.auditoria.cambio(equipo, self.auditoria.diferencias(campos, actuales, nuevos))
+
+    def pendientes(self):
+        return [*self.pendientes_crear, *(equipo for equipo, _ in self.pendientes_actualizar.values())]
+
+    def flush(self):
+        creados = self.pendientes_crear
+        if creados:
+            for equipo in creados:
+                equipo.import_hash = equipo.calcular_import_hash()
+            Equipo.objects.bulk_create(creados, batch_size=self.batch_size)
+            sin_pk = {equipo.numero_serie: equipo for equipo in creados if equipo.pk is None}
+            if sin_pk:
+                pks = Equipo.objects.filter(numero_serie__in=list(sin_pk)).values_list("numero_serie", "pk")
+                for numero_serie, pk in pks:
+                    sin_pk[numero_serie].pk = pk
+                    sin_pk[numero_serie]._state.adding = False
+        # bulk_update escribe las mismas columnas para todo el lote, así que se agrupa por
+        # conjunto de campos modificados.
+        grupos = {}
+        for equipo, campos in self.pendientes_actualizar.values():
+            grupos.setdefault(frozenset(campos), []).append(equipo)
+        ahora = timezone.now()
+        for campos, equipos in grupos.items():
+            campos = sorted(campos | {"import_hash"})
+            if set(campos) & set(EQUIPO_IMPORT_FIELDS):
+                campos.append("actualizado_en")
+            for equipo in equipos:
+                equipo.import_hash = equipo.calcular_import_hash()
+                equipo.actualizado_en = ahora
+            Equipo.objects.bulk_update(equipos, campos, batch_size=self.batch_size)
+        if creados or grupos:
+            marcar_cambio()
+        if self.auditoria is not None:
+            self.auditoria.flush()
+        self.pendientes_crear = []
+        self.pendientes_actualizar = {}
+        self.inventarios_liberados = set()
+        return creados
+
+
+# Lo que la importación necesita de un equipo existente mientras no haya que
+# actualizarlo; ocupa una fracción de lo que ocupa la instancia del modelo.
+ResumenEquipo = namedtuple("ResumenEquipo", "pk numero_inventario import_hash")
+
+
+def resumen_equipo(equipo):
+    return ResumenEquipo(equipo.pk, equipo.numero_inventario, equipo.import_hash)
+
+
+class CargadorEquipos:
+    # Recorre las filas con LOOKAHEAD_ROWS de anticipación. Cuando una fila necesita la
+    # instancia completa de un equipo se traen en una sola consulta también los de las
+    # filas ya leídas por delante; el lote anterior se descarta.
+    def __init__(self, filas, serie_de_fila, equipos_por_serie, tamano=LOOKAHEAD_ROWS):
+        self.filas = iter(filas)
+        self.serie_de_fila = serie_de_fila
+        self.equipos_por_serie = equipos_por_serie
+        self.tamano = tamano
+        self.ventana = deque()
+        self.instancias = {}
+
+    def __iter__(self):
+        while True:
+            while len(self.ventana) < self.tamano:
+                fila = next(self.filas, None)
+                if fila is None:
+                    break
+                self.ventana.append(fila)
+            if not self.ventana:
+                return
+            yield self.ventana.popleft()
+
+    def instancia(self, resumen):
+        equipo = self.instancias.get(resumen.pk)
+        if equipo is None:
+            pks = {resumen.pk}
+            for fila in self.ventana:
+                existente = self.equipos_por_serie.get(self.serie_de_fila(fila))
+                if isinstance(existente, ResumenEquipo):
+                    pks.add(existente.pk)
+            self.instancias = Equipo.objects.in_bulk(pks)
+            equipo = self.instancias[resumen.pk]
+        return equipo
+
+
+CATALOG_MODELS = (Marca, SistemaOperativo, TipoEquipo, ModeloEquipo)
+
+
+class CatalogResolver:
+    def __init__(self, diferido=False):
+        # diferido=True acumula las altas para hacerlas con bulk_create en flush();
+        # si no, cada clave nueva se guarda al resolverse (una vez por clave).
+        self.diferido = diferido
+        sociedades_por_pk = {sociedad.pk: sociedad for sociedad in Sociedad.objects.all()}
+        divisiones_por_pk = {}
+        self.sociedades = {sociedad.codigo: sociedad for sociedad in sociedades_por_pk.values()}
+        self.divisiones = {}
+        for division in Division.objects.all():
+            division.sociedad = sociedades_por_pk[division.sociedad_id]
+            divisiones_por_pk[division.pk] = division
+            self.divisiones[(division.sociedad.codigo, division.codigo)] = division
+        self.centros_costo = {}
+        for centro_costo in CentroCosto.objects.all():
+            centro_costo.division = divisiones_por_pk[centro_costo.division_id]
+            key = (centro_costo.division.sociedad.codigo, centro_costo.division.codigo, centro_costo.codigo)
+            self.centros_costo[key] = centro_costo
+        self.catalogos = {
+            model: {obj.nombre: obj for obj in model.objects.all()} for model in CATALOG_MODELS
+        }
+        self.pendientes = {model: [] for model in (Sociedad, Division, CentroCosto) + CATALOG_MODELS}
+        self.nombres_cambiados = {model: {} for model in (Sociedad, Division, CentroCosto)}
+
+    def _registrar(self, obj):
+        if self.diferido:
+            self.pendientes[type(obj)].append(obj)
+        else:
+            obj.save()
+        return obj
+
+    def _sincronizar_nombre(self, obj, nombre):
+        if nombre and obj.nombre != nombre:
+            obj.nombre = nombre
+            if obj.pk is not None:
+                self.nombres_cambiados[type(obj)][obj.pk] = obj
+
+    def sociedad(self, codigo, nombre):
+        obj = self.sociedades.get(codigo)
+        if obj is None:
+            obj = self._registrar(Sociedad(codigo=codigo, nombre=nombre or codigo))
+            self.sociedades[codigo] = obj
+        self._sincronizar_nombre(obj, nombre)
+        return obj
+
+    def division(self, sociedad, codigo, nombre):
+        key = (sociedad.codigo, codigo)
+        obj = self.divisiones.get(key)
+        if obj is None:
+            obj = self._registrar(Division(sociedad=sociedad, codigo=codigo, nombre=nombre or codigo))
+            self.divisiones[key] = obj
+        self._sincronizar_nombre(obj, nombre)
+        return obj
+
+    def centro_costo(self, division, codigo, nombre):
+        key = (division.sociedad.codigo, division.codigo, codigo)
+        obj = self.centros_costo.get(key)
+        if obj is None:
+            obj = self._registrar(CentroCosto(division=division, codigo=codigo, nombre=nombre or codigo))
+            self.centros_costo[key] = obj
+        self._sincronizar_nombre(obj, nombre)
+        return obj
+
+    def catalogo(self, model, nombre):
+        if not nombre:
+            return None
+        obj = self.catalogos[model].get(nombre)
+        if obj is None:
+            obj = self._registrar(model(nombre=nombre))
+            self.catalogos[model][nombre] = obj
+        return obj
+
+    def flush(self):
+        for model, pendientes in self.pendientes.items():
+            if pendientes:
+                model.objects.bulk_create(pendientes)
+                self.pendientes[model] = []
+        for model, cambiados in self.nombres_cambiados.items():
+            if cambiados:
+                model.objects.bulk_update(list(cambiados.values()), ["nombre"])
+                self.nombres_cambiados[model] = {}
+
+
+CATALOGOS_POR_CAMPO = {
+    "marca": Marca,
+    "sistema_operativo": SistemaOperativo,
+    "tipo_equipo": TipoEquipo,
+    "modelo": ModeloEquipo,
+}
+
+
+def _serializar(valor):
+    # Las llaves foráneas se guardan por su clave natural: los catálogos nuevos aún
+    # no tienen pk en la vista previa.
+    if isinstance(valor, CentroCosto):
+        return [valor.division.sociedad.codigo, valor.division.codigo, valor.codigo]
+    if isinstance(valor, models.Model):
+        return valor.nombre
+    return valor
+
+
+def _deserializar(resolver, campo, valor):
+    if campo == "centro_costo":
+        sociedad_codigo, division_codigo, centro_codigo = valor
+        sociedad = resolver.sociedad(sociedad_codigo, "")
+        division = resolver.division(sociedad, division_codigo, "")
+        return resolver.centro_costo(division, centro_codigo, "")
+    if campo in CATALOGOS_POR_CAMPO:
+        return resolver.catalogo(CATALOGOS_POR_CAMPO[campo], valor)
+    return valor
+
+
+def _serializar_actual(resolver, por_pk, campo, valor):
+    # Un valor leído de la base trae solo el id de la llave foránea; se busca el objeto
+    # entre los que ya cargó el resolver. por_pk se rehace si aparece un id nuevo.
+    if valor is None or isinstance(valor, models.Model):
+        return _serializar(valor)
+    if campo == "centro_costo":
+        modelo, objetos = CentroCosto, resolver.centros_costo
+    elif campo in CATALOGOS_POR_CAMPO:
+        modelo = CATALOGOS_POR_CAMPO[campo]
+        objetos = resolver.catalogos[modelo]
+    else:
+        return valor
+    if modelo not in por_pk or valor not in por_pk[modelo]:
+        por_pk[modelo] = {obj.pk: obj for obj in objetos.values() if obj.pk is not None}
+    return _serializar(por_pk[modelo].get(valor, valor))
+
+
+def _texto_auditoria(valor):
+    if valor is None or valor == "":
+        return "—"
+    if isinstance(valor, bool):
+        return "Sí" if valor else "No"
+    if isinstance(valor, list):
+        return " / ".join(valor)
+    return valor
+
+
+# Con bulk_create cada registro pasa por una instancia del modelo y, en SQLite, por
+# RETURNING; un executemany directo cuesta una fracción por fila.
+INSERTAR_AUDITORIA = (
+    f"INSERT INTO {AuditLog._meta.db_table} (fecha, accion, resumen, equipo_id, cambios, lote) "
+    "VALUES (%s, %s, %s, %s, %s, %s)"
+)
+
+
+class AuditoriaEquipos:
+    # Un AuditLog por equipo creado o actualizado, con los cambios campo por campo en el
+    # formato de la vista previa. Se escriben por lotes al final de cada lote de equipos;
+    # registrar_importacion los liga después al ImportLog por su lote.
+    def __init__(self, lote, resolver):
+        self.lote = lote
+        self.resolver = resolver
+        self.pendientes = []
+        self._por_pk = {}
+
+    def __len__(self):
+        return len(self.pendientes)
+
+    def diferencias(self, campos, actuales, nuevos):
+        return {
+            campo: [
+                _serializar_actual(self.resolver, self._por_pk, campo, actuales[campo]),
+                _serializar_actual(self.resolver, self._por_pk, campo, nuevos[campo]),
+            ]
+            for campo in campos
+        }
+
+    def alta(self, equipo):
+        self.pendientes.append((equipo, None))
+
+    def cambio(self, equipo, cambios):
+        # equipo puede ser la instancia o solo su pk.
+        self.pendientes.append((equipo, cambios))
+
+    def flush(self):
+        if not self.pendientes:
+            return
+        ahora = connection.ops.adapt_datetimefield_value(timezone.now())
+        filas = []
+        for equipo, cambios in self.pendientes:
+            equipo_id = getattr(equipo, "pk", equipo)
+            if cambios is None:
+                filas.append((ahora, "IMPORT_ALTA", "Alta por importación.", equipo_id, None, self.lote))
+                continue
+            resumen = "Actualizado por importación. " + "; ".join(
+                f"{campo}: '{_texto_auditoria(antes)}' → '{_texto_auditoria(despues)}'"
+                for campo, (antes, despues) in cambios.items()
+            )
+            filas.append((ahora, "IMPORT_CAMBIO", resumen, equipo_id, json.dumps(cambios), self.lote))
+        with connection.cursor() as cursor:
+            cursor.executemany(INSERTAR_AUDITORIA, filas)
+        self.pendientes = []
+
+
+class ChangeSet:
+    # Sustituye al writer en la vista previa: registra lo que se escribiría, fila por
+    # fila, para aplicarlo después sin volver a leer el archivo.
+    def __init__(self, modo):
+        self.modo = modo
+        self.operaciones = []
+        self.inventarios_liberados = set()
+        self.resolver = None
+        self._series_vistas = set()
+        self._por_pk = {}
+
+    def __len__(self):
+        return 0
+
+    def crear(self, equipo, fila=None):
+        self._series_vistas.add(equipo.numero_serie)
+        self.operaciones.append(
+            {
+                "accion": "crear",
+                "fila": fila,
+                "numero_serie": equipo.numero_serie,
+                "identificador": equipo.identificador,
+                "valores": {campo: _serializar(getattr(equipo, campo)) for campo in EQUIPO_IMPORT_FIELDS},
+            }
+        )
+
+    def actualizar(self, equipo, campos, fila=None, actuales=None):
+        if actuales is None or not set(campos) & set(EQUIPO_IMPORT_FIELDS):
+            return
+        _registrar_liberado(self.inventarios_liberados, campos, actuales)
+        operacion = {
+            "accion": "actualizar",
+            "fila": fila,
+            "numero_serie": equipo.numero_serie,
+            "identificador": equipo.identificador,
+            "cambios": {
+                campo: [
+                    _serializar_actual(self.resolver, self._por_pk, campo, actuales[campo]),
+                    _serializar(getattr(equipo, campo)),
+                ]
+                for campo in campos
+            },
+        }
+        if equipo.numero_serie not in self._series_vistas:
+            # Huella del registro tal como estaba en la base al generar la vista previa.
+            operacion["huella"] = calcular_import_hash(actuales)
+            self._series_vistas.add(equipo.numero_serie)
+        self.operaciones.append(operacion)
+
+    def flush(self):
+        # No escribe nada: aplicar_cambios respeta el orden de las operaciones y escribe
+        # lo pendiente antes de reasignar un inventario liberado.
+        self.inventarios_liberados = set()
+        return []
+
+    def catalogos(self):
+        pendientes = self.resolver.pendientes
+        cambiados = self.resolver.nombres_cambiados
+        sociedades = pendientes[Sociedad] + list(cambiados[Sociedad].values())
+        divisiones = pendientes[Division] + list(cambiados[Division].values())
+        centros_costo = pendientes[CentroCosto] + list(cambiados[CentroCosto].values())
+        catalogos = {
+            "sociedades": [[obj.codigo, obj.nombre] for obj in sociedades],
+            "divisiones": [[obj.sociedad.codigo, obj.codigo, obj.nombre] for obj in divisiones],
+            "centros_costo": [
+                [obj.division.sociedad.codigo, obj.division.codigo, obj.codigo, obj.nombre] for obj in centros_costo
+            ],
+        }
+        for model in CATALOG_MODELS:
+            catalogos[model._meta.model_name] = [obj.nombre for obj in pendientes[model]]
+        return catalogos
+
+    def as_dict(self, resultados, errores):
+        return {
+            "modo": self.modo,
+            "resultados": resultados,
+            "errores": errores,
+            "catalogos": self.catalogos(),
+            "operaciones": self.operaciones,
+        }
+
+
+def _valor_comparable(valor):
+    # Un catálogo aún sin guardar solo es igual a sí mismo.
+    if isinstance(valor, models.Model) and valor.pk is not None:
+        return valor.pk
+    return valor
+
+
+def _es_mismo_equipo(owner, equipo):
+    if equipo is None:
+        return False
+    if equipo.pk is None:
+        return owner is equipo
+    return owner == equipo.pk
+
+
+# Columnas con pocos valores distintos: cada valor crudo se normaliza una sola vez.
+COLUMNAS_REPETITIVAS = (
+    "sociedad",
+    "sociedad_nombre",
+    "division",
+    "division_nombre",
+    "centro_costo",
+    "marca",
+    "sistema_operativo",
+    "tipo_equipo",
+    "modelo",
+    "antiguedad",
+    "infraestructura_critica",
+    "entidad",
+    "municipio",
+)
+NORMALIZATION_CACHE_SIZE = 10000
+
+
+class CacheNormalizacion:
+    # Un diccionario por columna de valor crudo a valor normalizado; las filas con el
+    # mismo valor comparten el objeto ya normalizado. Una columna que llega a
+    # NORMALIZATION_CACHE_SIZE valores distintos deja de agregar entradas.
+    # Cada fila consulta todas las columnas, así que aciertos = filas - fallos.
+    def __init__(self):
+        self.valores = {columna: {} for columna in COLUMNAS_REPETITIVAS}
+        self.fallos = dict.fromkeys(COLUMNAS_REPETITIVAS, 0)
+        self.filas = 0
+
+    def normalizar(self, columna, valor, funcion=normalize_value):
+        valores = self.valores[columna]
+        try:
+            return valores[valor]
+        except KeyError:
+            pass
+        self.fallos[columna] += 1
+        resultado = funcion(valor)
+        if len(valores) < NORMALIZATION_CACHE_SIZE:
+            valores[valor] = resultado
+        return resultado
+
+    def tomar_conteo(self):
+        # Para los procesos del pool: devuelve lo contado desde la última llamada.
+        conteo = (self.filas, self.fallos)
+        self.filas = 0
+        self.fallos = dict.fromkeys(COLUMNAS_REPETITIVAS, 0)
+        return conteo
+
+    def sumar(self, conteo):
+        filas, fallos = conteo
+        self.filas += filas
+        for columna, cantidad in fallos.items():
+            self.fallos[columna] += cantidad
+
+    def as_dict(self):
+        columnas = {}
+        for columna in COLUMNAS_REPETITIVAS:
+            aciertos = self.filas - self.fallos[columna]
+            columnas[columna] = {
+                "aciertos": aciertos,
+                "fallos": self.fallos[columna],
+                "tasa_aciertos": round(aciertos / self.filas, 4) if self.filas else 0,
+            }
+        consultas = self.filas * len(COLUMNAS_REPETITIVAS)
+        aciertos = consultas - sum(self.fallos.values())
+        return {
+            "filas": self.filas,
+            "tasa_aciertos": round(aciertos / consultas, 4) if consultas else 0,
+            "columnas": columnas,
+        }
+
+
+def _normalizar_sin_cache(columna, valor, funcion=normalize_value):
+    return funcion(valor)
+
+
+def parse_row(columnas, row, cache=None):
+    if cache is None:
+        normalizar = _normalizar_sin_cache
+    else:
+        normalizar = cache.normalizar
+        cache.filas += 1
+    inventario = normalize_value(columnas.get(row, "inventario"))
+    numero_serie = normalize_value(columnas.get(row, "numero_serie"))
+    clave = normalize_value(columnas.get(row, "clave"))
+    identificador = inventario or clave or numero_serie
+    sociedad_codigo = normalizar("sociedad", columnas.get(row, "sociedad"))
+    division_codigo = normalizar("division", columnas.get(row, "division"))
+    return {
+        "inventario": inventario,
+        "numero_serie": numero_serie,
+        "clave": clave,
+        "identificador": identificador,
+        "nombre": normalize_value(columnas.get(row, "nombre")) or identificador,
+        "sociedad_codigo": sociedad_codigo,
+        "sociedad_nombre": normalizar("sociedad_nombre", columnas.get(row, "sociedad_nombre")) or sociedad_codigo,
+        "division_codigo": division_codigo,
+        "division_nombre": normalizar("division_nombre", columnas.get(row, "division_nombre")) or division_codigo,
+        "centro_codigo": normalizar("centro_costo", columnas.get(row, "centro_costo")),
+        "marca": normalizar("marca", columnas.get(row, "marca")),
+        "sistema_operativo": normalizar("sistema_operativo", columnas.get(row, "sistema_operativo")),
+        "tipo_equipo": normalizar("tipo_equipo", columnas.get(row, "tipo_equipo")),
+        "modelo": normalizar("modelo", columnas.get(row, "modelo")),
+        "codigo_postal": normalize_value(columnas.get(row, "codigo_postal")),
+        "domicilio": normalize_value(columnas.get(row, "domicilio")),
+        "antiguedad": normalizar("antiguedad", columnas.get(row, "antiguedad")),
+        "rpe_responsable": normalize_value(columnas.get(row, "rpe_responsable")),
+        "nombre_responsable": normalize_value(columnas.get(row, "nombre_responsable")),
+        "infraestructura_critica": normalizar(
+            "infraestructura_critica", columnas.get(row, "infraestructura_critica"), parse_boolean
+        ),
+        "direccion_ip": normalize_value(columnas.get(row, "direccion_ip")),
+        "direccion_mac": normalize_value(columnas.get(row, "direccion_mac")),
+        "entidad": normalizar("entidad", columnas.get(row, "entidad")),
+        "municipio": normalizar("municipio", columnas.get(row, "municipio")),
+    }
+
+
+# Orden de las llaves de parse_row(); los procesos del pool devuelven solo los valores.
+CAMPOS_FILA = (
+    "inventario",
+    "numero_serie",
+    "clave",
+    "identificador",
+    "nombre",
+    "sociedad_codigo",
+    "sociedad_nombre",
+    "division_codigo",
+    "division_nombre",
+    "centro_codigo",
+    "marca",
+    "sistema_operativo",
+    "tipo_equipo",
+    "modelo",
+    "codigo_postal",
+    "domicilio",
+    "antiguedad",
+    "rpe_responsable",
+    "nombre_responsable",
+    "infraestructura_critica",
+    "direccion_ip",
+    "direccion_mac",
+    "entidad",
+    "municipio",
+)
+
+INDICE_SERIE = CAMPOS_FILA.index("numero_serie")
+
+_columnas_worker = None
+_cache_worker = None
+
+
+def _iniciar_worker(encabezado):
+    global _columnas_worker, _cache_worker
+    _columnas_worker = HeaderMap(encabezado)
+    _cache_worker = CacheNormalizacion()
+
+
+def _parsear_bloque(filas):
+    # Corre en un proceso del pool: (marca, valores de parse_row) por fila y el conteo
+    # del cache del proceso para sumarlo a las métricas.
+    columnas = _columnas_worker
+    cache = _cache_worker
+    parseadas = [
+        (modificacion_key(columnas.get(row, "modificacion")), tuple(parse_row(columnas, row, cache).values()))
+        for row in filas
+    ]
+    return parseadas, cache.tomar_conteo()
+
+
+def filas_numeradas(lector, inicio=2, lineas=None):
+    # csv.DictReader omitía las líneas vacías sin contarlas como fila. Con lineas
+    # (LineasConPosicion) cada fila lleva el offset donde termina, para el checkpoint.
+    numero_fila = inicio
+    for row in lector:
+        if row:
+            yield numero_fila, row, lineas.posicion if lineas is not None else 0, None
+            numero_fila += 1
+
+
+def parsear_en_paralelo(filas, encabezado, workers, cache):
+    # Los procesos normalizan bloques de filas y los resultados vuelven en el orden del
+    # archivo; con a lo más 2 * workers bloques en vuelo la memoria queda acotada.
+    with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker, initargs=(encabezado,)) as pool:
+        pendientes = deque()
+        bloque = []
+        for numero_fila, row, posicion, _ in filas:
+            bloque.append((numero_fila, row, posicion))
+            if len(bloque) < PARSE_BLOCK_ROWS:
+                continue
+            pendientes.append(_enviar_bloque(pool, bloque))
+            bloque = []
+            if len(pendientes) >= 2 * workers:
+                yield from _recibir_bloque(*pendientes.popleft(), cache)
+        if bloque:
+            pendientes.append(_enviar_bloque(pool, bloque))
+        while pendientes:
+            yield from _recibir_bloque(*pendientes.popleft(), cache)
+
+
+def _enviar_bloque(pool, bloque):
+    futuro = pool.submit(_parsear_bloque, [row for _, row, _ in bloque])
+    return [(numero_fila, posicion) for numero_fila, _, posicion in bloque], futuro
+
+
+def _recibir_bloque(filas, futuro, cache):
+    parseadas, conteo = futuro.result()
+    cache.sumar(conteo)
+    for (numero_fila, posicion), parseada in zip(filas, parseadas):
+        yield numero_fila, None, posicion, parseada
+
+
+def validate_row(datos):
+    if not datos["identificador"]:
+        raise ValueError("Identificador vacío (Número de inventario, Clave o Número de serie).")
+    if not datos["numero_serie"]:
+        raise ValueError("Número de serie vacío.")
+    if not datos["sociedad_codigo"]:
+        raise ValueError("Sociedad vacía.")
+    if not datos["division_codigo"]:
+        raise ValueError("División vacía.")
+    if not datos["centro_codigo"]:
+        raise ValueError("Centro de costo vacío.")
+
+
+def import_inventario_csv(
+    path,
+    modo,
+    batch_size=None,
+    progress=None,
+    preview=None,
+    desde=None,
+    chunk_size=None,
+    checkpoint=None,
+    on_checkpoint=None,
+    workers=None,
+    hoja=None,
+    archivo_errores=None,
+):
+    # Con preview (un ChangeSet) no se escribe nada: las operaciones quedan registradas
+    # en él para confirmarlas después con aplicar_cambios().
+    # Con desde (la marca de una importación anterior) se saltan las filas cuya
+    # Modificación es anterior, antes de normalizarlas.
+    # Con chunk_size se hace commit cada N filas; antes de cada commit se pasa a
+    # on_checkpoint el estado para reanudar (checkpoint) tras una falla.
+    # Con workers > 1 la normalización de las filas corre en un pool de procesos y
+    # aquí solo se aplican los resultados, en el orden del archivo.
+    # Un .xlsx se lee con openpyxl en modo read_only; hoja elige la hoja por nombre o número.
+    # Con archivo_errores todos los errores quedan en ese CSV comprimido; lo que se
+    # devuelve es solo la muestra.
+    if chunk_size and preview is not None:
+        raise ValueError("La vista previa no se puede importar por bloques.")
+    if checkpoint and not chunk_size:
+        raise ValueError("Solo una importación por bloques se puede reanudar.")
+    metricas = ImportMetrics()
+    cache = CacheNormalizacion()
+    registro = RegistroErrores(
+        archivo_errores,
+        muestra=checkpoint["errores"] if checkpoint else None,
+        posicion=checkpoint.get("posicion_errores") if checkpoint else None,
+    )
+    with registro, metricas.medir():
+        resultados, errores = _import_inventario_csv(
+            path,
+            modo,
+            batch_size,
+            progress,
+            preview,
+            desde,
+            metricas.fases,
+            chunk_size,
+            checkpoint,
+            on_checkpoint,
+            workers,
+            hoja,
+            registro,
+            cache,
+        )
+    resultados["archivo_errores"] = registro.archivo
+    resultados["metricas"] = metricas.as_dict(resultados["total"])
+    resultados["metricas"]["cache_normalizacion"] = cache.as_dict()
+    return resultados, errores
+
+
+def _import_inventario_csv(
+    path,
+    modo,
+    batch_size,
+    progress,
+    preview,
+    desde,
+    fases,
+    chunk_size,
+    checkpoint,
+    on_checkpoint,
+    workers,
+    hoja,
+    registro,
+    cache,
+):
     resultados = {
         "total": 0,
         "creados": 0,
         "actualizados": 0,
+        "sin_cambios": 0,
         "omitidos": 0,
         "errores": 0,
+        "omitidos_por_marca": 0,
     }
-    errores = []
+    errores = registro.muestra
+    desde_key = timezone.localtime(desde).strftime(MARCA_FORMATO) if desde else ""
+    marca_maxima = ""
+    marca_error = ""
 
     if not path.exists():
-        errores.append({"fila": "-", "identificador": "-", "mensaje": "No se encontró el archivo CSV."})
+        registro.agregar("-", "-", "No se encontró el archivo CSV.")
         resultados["errores"] = 1
         resultados["omitidos"] = 1
         return resultados, errores
 
-    equipos_por_serie = {
-        equipo.numero_serie: equipo
-        for equipo in Equipo.objects.exclude(numero_serie="").exclude(numero_serie__isnull=True)
-    }
-    inventarios_en_uso = {
-        equipo.numero_inventario: equipo.pk
-        for equipo in Equipo.objects.exclude(numero_inventario="").exclude(numero_inventario__isnull=True)
-    }
+    if progress:
+        progress("cargando", 0)
+    fases.cambiar("carga")
+    # Una sola pasada con values_list: serie -> ResumenEquipo, inventario -> pk y los
+    # identificadores ocupados. Las instancias completas las trae CargadorEquipos solo para
+    # las filas que actualizan.
+    equipos_por_serie = {}
+    inventarios_en_uso = {}
+    identificadores_en_uso = set()
+    existentes = Equipo.objects.values_list("pk", "identificador", "numero_serie", "numero_inventario", "import_hash")
+    for pk, identificador, numero_serie, numero_inventario, import_hash in existentes.iterator(
+        chunk_size=LOAD_CHUNK_SIZE
+    ):
+        identificadores_en_uso.add(identificador)
+        if numero_serie:
+            equipos_por_serie[numero_serie] = ResumenEquipo(pk, numero_inventario, import_hash)
+        if numero_inventario:
+            inventarios_en_uso[numero_inventario] = pk
+    resolver = CatalogResolver(diferido=bool(batch_size) or preview is not None)
+    auditoria = None
+    if preview is None:
+        # El lote viaja en los resultados (y en el checkpoint): una importación reanudada
+        # sigue con el mismo.
+        lote = checkpoint["resultados"].get("lote_auditoria") if checkpoint else None
+        resultados["lote_auditoria"] = lote or uuid.uuid4().hex
+        auditoria = AuditoriaEquipos(resultados["lote_auditoria"], resolver)
+    writer = None
+    if preview is not None:
+        writer = preview
+        preview.resolver = resolver
+    elif batch_size:
+        writer = BulkEquipoWriter(batch_size, auditoria)
 
-    with transaction.atomic():
-        with open(path, encoding="utf-8-sig", errors="replace", newline="") as archivo:
-            lector = csv.DictReader(archivo)
-            for numero_fila, row in enumerate(lector, start=2):
+    def flush_writer():
+        if preview is not None:
+            # La vista previa no escribe: los catálogos nuevos siguen pendientes en el
+            # resolver, así ChangeSet.catalogos() los incluye y aplicar_cambios los crea.
+            preview.flush()
+            return
+        resolver.flush()
+        escritos = writer.pendientes()
+        for equipo_creado in writer.flush():
+            inventario_creado = equipo_creado.numero_inventario
+            if inventario_creado and inventarios_en_uso.get(inventario_creado) is equipo_creado:
+                inventarios_en_uso[inventario_creado] = equipo_creado.pk
+        # Ya escritos, los equipos vuelven a ocupar solo su resumen.
+        for equipo in escritos:
+            if equipos_por_serie.get(equipo.numero_serie) is equipo:
+                equipos_por_serie[equipo.numero_serie] = resumen_equipo(equipo)
+
+    def serie_de_fila(fila):
+        _, row, _, parseada = fila
+        if parseada is None:
+            return normalize_value(columnas.get(row, "numero_serie"))
+        return parseada[1][INDICE_SERIE]
+
+    def confirmar_bloque(transaccion, posicion, fila):
+        if writer is not None:
+            flush_writer()
+        else:
+            resolver.flush()
+            auditoria.flush()
+        if on_checkpoint:
+            # Se guarda dentro de la transacción del bloque: el checkpoint y las filas
+            # que cubre se confirman juntos.
+            on_checkpoint(
+                {
+                    "posicion": posicion,
+                    "fila": fila,
+                    "resultados": dict(resultados),
+                    "errores": list(errores),
+                    "posicion_errores": registro.punto_de_control(),
+                    "marca_maxima": marca_maxima,
+                    "marca_error": marca_error,
+                }
+            )
+        transaccion.confirmar()
+
+    with TransaccionPorBloques(chunk_size) as transaccion:
+        with open_import_rows(path, hoja, posicional=bool(chunk_size)) as (lector, lineas):
+            encabezado = next(lector, [])
+            columnas = HeaderMap(encabezado)
+            resultados.update(columnas.resumen())
+            fila_inicial = 2
+            if checkpoint:
+                lineas.saltar(checkpoint["posicion"])
+                fila_inicial = checkpoint["fila"] + 1
+                resultados.update(checkpoint["resultados"])
+                resultados["reanudado_en_fila"] = fila_inicial
+                marca_maxima = checkpoint["marca_maxima"]
+                marca_error = checkpoint["marca_error"]
+            posicion = lineas.posicion if chunk_size else 0
+            confirmadas = resultados["total"]
+            if progress:
+                progress("procesando", resultados["total"])
+            filas = filas_numeradas(lector, fila_inicial, lineas)
+            if workers and workers > 1:
+                filas = parsear_en_paralelo(filas, encabezado, workers, cache)
+            cargador = CargadorEquipos(filas, serie_de_fila, equipos_por_serie)
+            for numero_fila, row, posicion_fila, parseada in fases.medir(cargador, "lectura"):
+                if chunk_size:
+                    # posicion es el final de la fila anterior: el checkpoint reanuda en esta.
+                    if resultados["total"] - confirmadas >= chunk_size:
+                        fases.cambiar("escritura")
+                        confirmar_bloque(transaccion, posicion, numero_fila - 1)
+                        confirmadas = resultados["total"]
+                    posicion = posicion_fila
+                fases.cambiar("normalizacion")
                 resultados["total"] += 1
-                if resultados["total"] % 200 == 0:
-                    print(f"Procesadas {resultados['total']} filas...")
+                if progress and resultados["total"] % PROGRESS_EVERY == 0:
+                    progress("procesando", resultados["total"])
+
+                if parseada is None:
+                    marca = modificacion_key(columnas.get(row, "modificacion"))
+                else:
+                    marca = parseada[0]
+                if marca:
+                    if marca > marca_maxima:
+                        marca_maxima = marca
+                    if marca < desde_key:
+                        resultados["omitidos_por_marca"] += 1
+                        continue
 
                 identificador = ""
                 try:
-                    normalized_row = build_normalized_row(row)
-                    inventario = normalize_value(
-                        get_row_value(
-                            row,
-                            normalized_row,
-                            "Número de inventario*",
-                            "Número de inventario",
-                            "Numero de inventario",
-                            "No. de inventario",
-                            "Inventario",
-                        )
-                    )
-                    numero_serie = normalize_value(
-                        get_row_value(
-                            row,
-                            normalized_row,
-                            "Número de serie*",
-                            "Número de serie",
-                            "Numero de serie",
-                            "No. de serie",
-                            "Serie",
-                        )
-                    )
-                    clave = normalize_value(get_row_value(row, normalized_row, "Clave"))
-                    identificador = inventario or clave or numero_serie
-                    if not identificador:
-                        raise ValueError("Identificador vacío (Número de inventario, Clave o Número de serie).")
-
-                    if not numero_serie:
-                        raise ValueError("Número de serie vacío.")
-
-                    nombre_equipo = normalize_value(get_row_value(row, normalized_row, "Nombre")) or identificador
-
-                    sociedad_codigo = normalize_value(get_row_value(row, normalized_row, "Sociedad"))
-                    sociedad_nombre = (
-                        normalize_value(get_row_value(row, normalized_row, "Nombre de Sociedad"))
-                        or sociedad_codigo
-                    )
-                    if not sociedad_codigo:
-                        raise ValueError("Sociedad vacía.")
-                    sociedad, _ = Sociedad.objects.get_or_create(
-                        codigo=sociedad_codigo,
-                        defaults={"nombre": sociedad_nombre or sociedad_codigo},
-                    )
-                    if sociedad_nombre and sociedad.nombre != sociedad_nombre:
-                        sociedad.nombre = sociedad_nombre
-                        sociedad.save(update_fields=["nombre"])
-
-                    division_codigo = normalize_value(get_row_value(row, normalized_row, "División", "Division"))
-                    division_nombre = (
-                        normalize_value(get_row_value(row, normalized_row, "Nombre de División", "Nombre de Division"))
-                        or division_codigo
-                    )
-                    if not division_codigo:
-                        raise ValueError("División vacía.")
-                    division, _ = Division.objects.get_or_create(
-                        sociedad=sociedad,
-                        codigo=division_codigo,
-                        defaults={"nombre": division_nombre or division_codigo},
-                    )
-                    if division_nombre and division.nombre != division_nombre:
-                        division.nombre = division_nombre
-                        division.save(update_fields=["nombre"])
-
-                    centro_codigo = normalize_value(
-                        get_row_value(row, normalized_row, "Centro de Costo", "Centro de costo")
-                    )
-                    centro_nombre = centro_codigo
-                    if not centro_codigo:
-                        raise ValueError("Centro de costo vacío.")
-                    centro_costo, _ = CentroCosto.objects.get_or_create(
-                        division=division,
-                        codigo=centro_codigo,
-                        defaults={"nombre": centro_nombre or centro_codigo},
-                    )
-                    if centro_nombre and centro_costo.nombre != centro_nombre:
-                        centro_costo.nombre = centro_nombre
-                        centro_costo.save(update_fields=["nombre"])
-
-                    marca = get_or_create_catalog(Marca, get_row_value(row, normalized_row, "Marca"))
-                    sistema_operativo = get_or_create_catalog(
-                        SistemaOperativo, get_row_value(row, normalized_row, "Sistema operativo")
-                    )
-                    tipo_equipo = get_or_create_catalog(
-                        TipoEquipo,
-                        get_row_value(row, normalized_row, "Tipo de equipos", "Tipo de equipo"),
-                    )
-                    modelo = get_or_create_catalog(ModeloEquipo, get_row_value(row, normalized_row, "Modelo"))
-                    codigo_postal = normalize_value(
-                        get_row_value(row, normalized_row, "Código Postal", "Codigo Postal")
-                    )
-                    domicilio = normalize_value(get_row_value(row, normalized_row, "Domicilio"))
-                    antiguedad = normalize_value(
-                        get_row_value(row, normalized_row, "Antigüedad", "Antiguedad")
-                    )
-                    rpe_responsable = normalize_value(
-                        get_row_value(row, normalized_row, "RPE de Responsable")
-                    )
-                    nombre_responsable = normalize_value(
-                        get_row_value(row, normalized_row, "Nombre de Responsable")
-                    )
-                    infraestructura_critica = parse_boolean(
-                        get_row_value(
-                            row,
-                            normalized_row,
-                            "Es infraestructura crítica?",
-                            "Es infraestructura critica?",
-                        )
-                    )
-                    direccion_ip = normalize_value(
-                        get_row_value(row, normalized_row, "Dirección IP", "Direccion IP", "IP")
-                    )
-                    direccion_mac = normalize_value(
-                        get_row_value(row, normalized_row, "Dirección MAC", "Direccion MAC", "MAC")
-                    )
-                    entidad = normalize_value(get_row_value(row, normalized_row, "Entidad"))
-                    municipio = normalize_value(get_row_value(row, normalized_row, "Municipio"))
+                    if parseada is None:
+                        datos = parse_row(columnas, row, cache)
+                    else:
+                        datos = dict(zip(CAMPOS_FILA, parseada[1]))
+                    identificador = datos["identificador"]
+                    fases.cambiar("validacion")
+                    validate_row(datos)
+                    inventario = datos["inventario"]
+                    numero_serie = datos["numero_serie"]
+
+                    fases.cambiar("resolucion")
+                    sociedad = resolver.sociedad(datos["sociedad_codigo"], datos["sociedad_nombre"])
+                    division = resolver.division(sociedad, datos["division_codigo"], datos["division_nombre"])
+                    centro_costo = resolver.centro_costo(division, datos["centro_codigo"], datos["centro_codigo"])
 
                     equipo_existente = equipos_por_serie.get(numero_serie)
                     if equipo_existente and modo == "create_only":
@@ -232,8 +1294,8 @@ def import_inventario_csv(path, modo):
                         continue
 
                     if inventario:
-                        owner_pk = inventarios_en_uso.get(inventario)
-                        if owner_pk and (not equipo_existente or owner_pk != equipo_existente.pk):
+                        owner = inventarios_en_uso.get(inventario)
+                        if owner and not _es_mismo_equipo(owner, equipo_existente):
                             raise ValueError("Número de inventario ya existe en otro equipo.")
 
                     should_update_inventario = False
@@ -250,53 +1312,260 @@ def import_inventario_csv(path, modo):
 
                     defaults = {
                         "centro_costo": centro_costo,
-                        "clave": clave,
+                        "clave": datos["clave"],
                         "numero_inventario": numero_inventario_value,
-                        "nombre": nombre_equipo,
+                        "nombre": datos["nombre"],
                         "numero_serie": numero_serie,
-                        "marca": marca,
-                        "sistema_operativo": sistema_operativo,
-                        "tipo_equipo": tipo_equipo,
-                        "modelo": modelo,
-                        "codigo_postal": codigo_postal or None,
-                        "domicilio": domicilio or None,
-                        "antiguedad": antiguedad or None,
-                        "rpe_responsable": rpe_responsable or None,
-                        "nombre_responsable": nombre_responsable or None,
-                        "infraestructura_critica": infraestructura_critica,
-                        "direccion_ip": direccion_ip or None,
-                        "direccion_mac": direccion_mac or None,
-                        "entidad": entidad or None,
-                        "municipio": municipio or None,
+                        "marca": resolver.catalogo(Marca, datos["marca"]),
+                        "sistema_operativo": resolver.catalogo(SistemaOperativo, datos["sistema_operativo"]),
+                        "tipo_equipo": resolver.catalogo(TipoEquipo, datos["tipo_equipo"]),
+                        "modelo": resolver.catalogo(ModeloEquipo, datos["modelo"]),
+                        "codigo_postal": datos["codigo_postal"] or None,
+                        "domicilio": datos["domicilio"] or None,
+                        "antiguedad": datos["antiguedad"] or None,
+                        "rpe_responsable": datos["rpe_responsable"] or None,
+                        "nombre_responsable": datos["nombre_responsable"] or None,
+                        "infraestructura_critica": datos["infraestructura_critica"],
+                        "direccion_ip": datos["direccion_ip"] or None,
+                        "direccion_mac": datos["direccion_mac"] or None,
+                        "entidad": datos["entidad"] or None,
+                        "municipio": datos["municipio"] or None,
                     }
 
+                    if writer is not None and numero_inventario_value in writer.inventarios_liberados:
+                        # El inventario lo libera un cambio aún pendiente; se escribe antes para
+                        # respetar unique_numero_inventario_nonempty.
+                        fases.cambiar("escritura")
+                        flush_writer()
+
+                    fases.cambiar("comparacion")
+
                     if equipo_existente:
                         old_inventario = equipo_existente.numero_inventario
-                        for campo, valor in defaults.items():
-                            setattr(equipo_existente, campo, valor)
-                        equipo_existente.save()
+                        nuevo_hash = calcular_import_hash(defaults)
+                        if equipo_existente.import_hash == nuevo_hash:
+                            resultados["sin_cambios"] += 1
+                            continue
+                        if isinstance(equipo_existente, ResumenEquipo):
+                            equipo_existente = cargador.instancia(equipo_existente)
+                        actuales = equipo_existente.valores_importacion()
+                        cambios = [
+                            campo
+                            for campo, valor in defaults.items()
+                            if _valor_comparable(actuales[campo]) != _valor_comparable(valor)
+                        ]
+                        if not cambios:
+                            # Huella ausente o desactualizada: solo se guarda la huella.
+                            fases.cambiar("escritura")
+                            equipo_existente.import_hash = nuevo_hash
+                            if writer is not None:
+                                writer.actualizar(equipo_existente, ["import_hash"])
+                                equipos_por_serie[numero_serie] = equipo_existente
+                            else:
+                                equipo_existente.save(update_fields=["import_hash"])
+                                equipos_por_serie[numero_serie] = resumen_equipo(equipo_existente)
+                            resultados["sin_cambios"] += 1
+                            continue
+                        for campo in cambios:
+                            setattr(equipo_existente, campo, defaults[campo])
+                        equipo_existente.import_hash = nuevo_hash
+                        fases.cambiar("escritura")
+                        if writer is not None:
+                            writer.actualizar(equipo_existente, cambios, numero_fila, actuales)
+                        else:
+                            equipo_existente.save(update_fields=cambios + ["actualizado_en"])
+                            auditoria.cambio(equipo_existente, auditoria.diferencias(cambios, actuales, defaults))
                         if should_update_inventario and old_inventario:
                             inventarios_en_uso.pop(old_inventario, None)
                         if numero_inventario_value:
-                            inventarios_en_uso[numero_inventario_value] = equipo_existente.pk
-                        equipos_por_serie[numero_serie] = equipo_existente
+                            inventarios_en_uso[numero_inventario_value] = equipo_existente.pk or equipo_existente
+                        if writer is not None:
+                            equipos_por_serie[numero_serie] = equipo_existente
+                        else:
+                            equipos_por_serie[numero_serie] = resumen_equipo(equipo_existente)
                         resultados["actualizados"] += 1
                     else:
-                        equipo_creado = Equipo.objects.create(identificador=identificador, **defaults)
+                        # Se valida antes de escribir: con bulk_create el duplicado haría fallar
+                        # el lote completo y fila por fila dejaría la transacción inservible.
+                        if identificador in identificadores_en_uso:
+                            raise ValueError("Identificador ya existe en otro equipo.")
+                        fases.cambiar("escritura")
+                        if writer is not None:
+                            equipo_creado = Equipo(identificador=identificador, **defaults)
+                            writer.crear(equipo_creado, numero_fila)
+                        else:
+                            equipo_creado = Equipo.objects.create(identificador=identificador, **defaults)
+                            auditoria.alta(equipo_creado)
+                        identificadores_en_uso.add(identificador)
                         if numero_inventario_value:
-                            inventarios_en_uso[numero_inventario_value] = equipo_creado.pk
-                        equipos_por_serie[numero_serie] = equipo_creado
+                            inventarios_en_uso[numero_inventario_value] = equipo_creado.pk or equipo_creado
+                        if writer is not None:
+                            equipos_por_serie[numero_serie] = equipo_creado
+                        else:
+                            equipos_por_serie[numero_serie] = resumen_equipo(equipo_creado)
                         resultados["creados"] += 1
                 except Exception as exc:
                     resultados["errores"] += 1
                     resultados["omitidos"] += 1
-                    if len(errores) < ERRORS_LIMIT:
-                        errores.append(
-                            {
-                                "fila": numero_fila,
-                                "identificador": identificador,
-                                "mensaje": str(exc),
-                            }
-                        )
+                    if marca and (not marca_error or marca < marca_error):
+                        marca_error = marca
+                    registro.agregar(numero_fila, identificador, str(exc))
+
+                if writer is not None and preview is None and len(writer) >= batch_size:
+                    fases.cambiar("escritura")
+                    flush_writer()
+                elif writer is None and len(auditoria) >= APPLY_BATCH_SIZE:
+                    fases.cambiar("escritura")
+                    auditoria.flush()
+                fases.detener()
+
+            if progress:
+                progress("guardando", resultados["total"])
+            fases.cambiar("escritura")
+            if writer is not None and preview is None:
+                flush_writer()
+            elif writer is None:
+                resolver.flush()
+                auditoria.flush()
+
+    registrar_marca(resultados, marca_maxima, marca_error, desde)
+    return resultados, errores
+
+
+def registrar_marca(resultados, marca_maxima, marca_error, desde):
+    # La marca no pasa de la primera fila con error para que la siguiente importación
+    # incremental la vuelva a intentar.
+    desde_key = timezone.localtime(desde).strftime(MARCA_FORMATO) if desde else ""
+    nueva_marca = min(marca_maxima, marca_error) if marca_error else marca_maxima
+    nueva_marca = max(nueva_marca, desde_key)
+    resultados["marca_modificacion"] = marca_desde_key(nueva_marca).isoformat() if nueva_marca else None
+    resultados["incremental_desde"] = desde.isoformat() if desde else None
+
+
+def aplicar_cambios(cambios, batch_size=None, progress=None, archivo_errores=None):
+    # El archivo de errores arranca con los de la vista previa y suma los de la aplicación.
+    metricas = ImportMetrics()
+    registro = RegistroErrores(
+        archivo_errores,
+        muestra=cambios["errores"],
+        copiar_de=cambios["resultados"].get("archivo_errores") if archivo_errores else None,
+    )
+    with registro, metricas.medir():
+        resultados, errores = _aplicar_cambios(cambios, batch_size, progress, metricas.fases, registro)
+    resultados["archivo_errores"] = registro.archivo
+    resultados["metricas"] = metricas.as_dict(len(cambios["operaciones"]))
+    return resultados, errores
+
+
+def _aplicar_cambios(cambios, batch_size, progress, fases, registro):
+    resultados = dict(cambios["resultados"], creados=0, actualizados=0, lote_auditoria=uuid.uuid4().hex)
+    errores = registro.muestra
+    operaciones = cambios["operaciones"]
+    batch_size = batch_size or APPLY_BATCH_SIZE
+
+    def registrar_error(operacion, mensaje):
+        resultados["errores"] += 1
+        resultados["omitidos"] += 1
+        registro.agregar(operacion["fila"], operacion["identificador"], mensaje)
+
+    if progress:
+        progress("cargando", 0)
+    fases.cambiar("carga")
+    with transaction.atomic():
+        equipos_por_serie = Equipo.objects.in_bulk(
+            {operacion["numero_serie"] for operacion in operaciones}, field_name="numero_serie"
+        )
+        inventarios_en_uso = dict(
+            Equipo.objects.exclude(numero_inventario="")
+            .exclude(numero_inventario__isnull=True)
+            .values_list("numero_inventario", "pk")
+        )
+        identificadores_en_uso = set(Equipo.objects.values_list("identificador", flat=True))
+
+        resolver = CatalogResolver(diferido=True)
+        catalogos = cambios["catalogos"]
+        for codigo, nombre in catalogos["sociedades"]:
+            resolver.sociedad(codigo, nombre)
+        for sociedad_codigo, codigo, nombre in catalogos["divisiones"]:
+            resolver.division(resolver.sociedad(sociedad_codigo, ""), codigo, nombre)
+        for sociedad_codigo, division_codigo, codigo, nombre in catalogos["centros_costo"]:
+            division = resolver.division(resolver.sociedad(sociedad_codigo, ""), division_codigo, "")
+            resolver.centro_costo(division, codigo, nombre)
+        for model in CATALOG_MODELS:
+            for nombre in catalogos[model._meta.model_name]:
+                resolver.catalogo(model, nombre)
+
+        writer = BulkEquipoWriter(batch_size, AuditoriaEquipos(resultados["lote_auditoria"], resolver))
+
+        def flush_writer():
+            resolver.flush()
+            for equipo_creado in writer.flush():
+                inventario_creado = equipo_creado.numero_inventario
+                if inventario_creado and inventarios_en_uso.get(inventario_creado) is equipo_creado:
+                    inventarios_en_uso[inventario_creado] = equipo_creado.pk
+
+        if progress:
+            progress("aplicando", 0)
+        for numero, operacion in enumerate(operaciones, start=1):
+            fases.cambiar("comparacion")
+            if progress and numero % PROGRESS_EVERY == 0:
+                progress("aplicando", numero)
+            numero_serie = operacion["numero_serie"]
+            equipo = equipos_por_serie.get(numero_serie)
+            if operacion["accion"] == "crear":
+                if equipo is not None:
+                    registrar_error(operacion, "El equipo ya existe; la vista previa está desactualizada.")
+                    continue
+                if operacion["identificador"] in identificadores_en_uso:
+                    registrar_error(operacion, "Identificador ya existe en otro equipo.")
+                    continue
+                valores = operacion["valores"]
+            else:
+                if equipo is None:
+                    registrar_error(operacion, "El equipo ya no existe; la vista previa está desactualizada.")
+                    continue
+                if "huella" in operacion and equipo.calcular_import_hash() != operacion["huella"]:
+                    registrar_error(operacion, "El equipo cambió después de la vista previa.")
+                    continue
+                valores = {campo: nuevo for campo, (_, nuevo) in operacion["cambios"].items()}
+
+            inventario = valores.get("numero_inventario")
+            if inventario:
+                owner = inventarios_en_uso.get(inventario)
+                if owner and not _es_mismo_equipo(owner, equipo):
+                    registrar_error(operacion, "Número de inventario ya existe en otro equipo.")
+                    continue
+                if inventario in writer.inventarios_liberados:
+                    fases.cambiar("escritura")
+                    flush_writer()
+
+            fases.cambiar("resolucion")
+            valores = {campo: _deserializar(resolver, campo, valor) for campo, valor in valores.items()}
+            fases.cambiar("escritura")
+            if equipo is None:
+                equipo = Equipo(identificador=operacion["identificador"], **valores)
+                writer.crear(equipo)
+                identificadores_en_uso.add(equipo.identificador)
+                equipos_por_serie[numero_serie] = equipo
+                resultados["creados"] += 1
+            else:
+                old_inventario = equipo.numero_inventario
+                actuales = equipo.valores_importacion()
+                for campo, valor in valores.items():
+                    setattr(equipo, campo, valor)
+                writer.actualizar(equipo, list(valores), actuales=actuales)
+                if "numero_inventario" in valores and old_inventario:
+                    inventarios_en_uso.pop(old_inventario, None)
+                resultados["actualizados"] += 1
+            if inventario:
+                inventarios_en_uso[inventario] = equipo.pk or equipo
+
+            if len(writer) >= batch_size:
+                flush_writer()
+
+        if progress:
+            progress("guardando", len(operaciones))
+        fases.cambiar("escritura")
+        flush_writer()
 
     return resultados, errores
@@ -0,0 +1,467 @@
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from openpyxl import load_workbook
+
+from equipos.models import AuditLog, ImportJob, ImportLog
+from inventario.importer import (
+    ChangeSet,
+    aplicar_cambios,
+    elegir_hoja,
+    es_xlsx,
+    import_inventario_csv,
+    open_import_file,
+)
+from inventario.locks import ImportacionEnCurso, bloqueo_importacion
+from inventario.uploads import eliminar_subida, file_sha256
+
+PROGRESS_INTERVAL = 1.0
+LOCK_RETRY_INTERVAL = 5.0
+RETENCION_DIAS = 30
+
+_progreso_en_memoria = {}
+_progreso_lock = threading.Lock()
+
+
+def registrar_importacion(
+    usuario,
+    path,
+    resultados,
+    errores,
+    resumen="Importación CSV ejecutada.",
+    sha256="",
+    modo="",
+):
+    path = Path(path)
+    log = ImportLog.objects.create(
+        usuario=usuario,
+        archivo=str(path),
+        archivo_sha256=sha256,
+        archivo_tamano=path.stat().st_size if path.exists() else 0,
+        modo=modo,
+        total_filas=resultados["total"],
+        creados=resultados["creados"],
+        actualizados=resultados["actualizados"],
+        sin_cambios=resultados.get("sin_cambios", 0),
+        omitidos=resultados["omitidos"],
+        errores=resultados["errores"],
+        resumen_errores=errores,
+        marca_modificacion=parse_datetime(resultados.get("marca_modificacion") or ""),
+        incremental_desde=parse_datetime(resultados.get("incremental_desde") or ""),
+        metricas=resultados.get("metricas") or {},
+        archivo_errores=resultados.get("archivo_errores") or "",
+    )
+    if resultados.get("lote_auditoria"):
+        # Los registros por equipo que escribió la importación quedan ligados a su log.
+        AuditLog.objects.filter(lote=resultados["lote_auditoria"]).update(import_log=log, usuario=usuario)
+    AuditLog.objects.create(
+        usuario=usuario,
+        accion="IMPORT",
+        resumen=(
+            f"{resumen} "
+            f"Total: {resultados['total']}, "
+            f"Creados: {resultados['creados']}, "
+            f"Actualizados: {resultados['actualizados']}, "
+            f"Sin cambios: {resultados.get('sin_cambios', 0)}, "
+            f"Omitidos: {resultados['omitidos']}, "
+            f"Errores: {resultados['errores']}."
+        ),
+    )
+    return log
+
+
+def ruta_errores(nombre):
+    return Path(getattr(settings, "IMPORT_ERRORS_DIR", Path(settings.IMPORT_UPLOAD_DIR) / "errores")) / nombre
+
+
+def find_previous_import(sha256, modo):
+    if not sha256:
+        return None
+    return ImportLog.objects.filter(archivo_sha256=sha256, modo=modo).order_by("-fecha", "-pk").first()
+
+
+def find_watermark(modo):
+    log = (
+        ImportLog.objects.filter(modo=modo, marca_modificacion__isnull=False)
+        .order_by("-fecha", "-pk")
+        .only("marca_modificacion")
+        .first()
+    )
+    return log.marca_modificacion if log else None
+
+
+def resultados_ya_importado(log):
+    return {
+        "total": log.total_filas,
+        "creados": log.creados,
+        "actualizados": log.actualizados,
+        "sin_cambios": log.sin_cambios,
+        "omitidos": log.omitidos,
+        "errores": log.errores,
+        "ya_importado": True,
+        "log_original": log.pk,
+        "fecha_original": log.fecha.isoformat(),
+        "marca_modificacion": log.marca_modificacion.isoformat() if log.marca_modificacion else None,
+    }
+
+
+def estimar_filas(path, hoja=None):
+    try:
+        if es_xlsx(path):
+            # En modo read_only max_row sale de la dimensión guardada en la hoja.
+            libro = load_workbook(path, read_only=True)
+            try:
+                return max((elegir_hoja(libro, hoja).max_row or 1) - 1, 0)
+            finally:
+                libro.close()
+        with open_import_file(path, binary=True) as archivo:
+            return max(sum(1 for _ in archivo) - 1, 0)
+    except (OSError, ValueError, EOFError):
+        return 0
+
+
+class JobProgress:
+    def __init__(self, job):
+        self.job_id = job.pk
+        self.inicio = time.monotonic()
+        self.snapshot = {"fase": job.fase, "filas_procesadas": 0, "filas_por_segundo": 0.0}
+        self._detener = threading.Event()
+        self._hilo = None
+        # En SQLite un segundo escritor durante la transacción de la importación puede
+        # provocar "database is locked"; ahí el avance solo se publica en memoria.
+        if connection.vendor != "sqlite":
+            self._hilo = threading.Thread(target=self._persistir_periodicamente, daemon=True)
+            self._hilo.start()
+
+    def actualizar(self, fase, filas_procesadas):
+        transcurrido = time.monotonic() - self.inicio
+        snapshot = {
+            "fase": fase,
+            "filas_procesadas": filas_procesadas,
+            "filas_por_segundo": round(filas_procesadas / transcurrido, 1) if transcurrido else 0.0,
+        }
+        self.snapshot = snapshot
+        with _progreso_lock:
+            _progreso_en_memoria[self.job_id] = snapshot
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        with _progreso_lock:
+            _progreso_en_memoria.pop(self.job_id, None)
+
+    def _persistir_periodicamente(self):
+        try:
+            while not self._detener.wait(PROGRESS_INTERVAL):
+                try:
+                    ImportJob.objects.filter(pk=self.job_id).update(**self.snapshot)
+                except DatabaseError:
+                    pass
+        finally:
+            connection.close()
+
+
+def progreso_en_memoria(job_id):
+    with _progreso_lock:
+        return _progreso_en_memoria.get(job_id)
+
+
+def job_status(job):
+    status = {
+        "id": job.pk,
+        "estado": job.estado,
+        "estado_display": job.get_estado_display(),
+        "fase": job.fase,
+        "filas_procesadas": job.filas_procesadas,
+        "filas_estimadas": job.filas_estimadas,
+        "filas_por_segundo": job.filas_por_segundo,
+        "terminado": job.terminado,
+        "mensaje": job.mensaje,
+        "log_id": job.import_log_id,
+    }
+    if not job.terminado:
+        status.update(progreso_en_memoria(job.pk) or {})
+    filas_estimadas = status["filas_estimadas"]
+    if job.estado == ImportJob.Estado.COMPLETADO:
+        status["porcentaje"] = 100
+    elif filas_estimadas:
+        status["porcentaje"] = min(99, int(status["filas_procesadas"] * 100 / filas_estimadas))
+    else:
+        status["porcentaje"] = 0
+    return status
+
+
+def claim_job(job_id):
+    actualizados = ImportJob.objects.filter(pk=job_id, estado=ImportJob.Estado.PENDIENTE).update(
+        estado=ImportJob.Estado.EN_PROCESO,
+        fase="iniciando",
+        mensaje="",
+        iniciado_en=timezone.now(),
+    )
+    if not actualizados:
+        return None
+    return ImportJob.objects.select_related("usuario", "vista_previa").get(pk=job_id)
+
+
+def next_pending_job():
+    pendientes = (
+        ImportJob.objects.filter(estado=ImportJob.Estado.PENDIENTE)
+        .order_by("creado_en", "pk")
+        .values_list("pk", flat=True)
+    )
+    for job_id in pendientes:
+        job = claim_job(job_id)
+        if job is not None:
+            return job
+    return None
+
+
+def guardar_checkpoint(job, checkpoint):
+    job.checkpoint = checkpoint
+    job.filas_procesadas = checkpoint["resultados"]["total"]
+    ImportJob.objects.filter(pk=job.pk).update(checkpoint=checkpoint, filas_procesadas=job.filas_procesadas)
+
+
+def run_import_job(job, batch_size=None, workers=None):
+    # Las vistas previas solo leen; todo lo que escribe toma el candado de importación.
+    # Si otra importación lo tiene, el job vuelve a la cola con el motivo en mensaje.
+    if job.es_vista_previa:
+        job = _run_import_job(job, batch_size, workers)
+    else:
+        propietario = f"Importación #{job.pk} de {job.usuario or 'comando'}"
+        try:
+            with bloqueo_importacion(propietario, usuario=job.usuario, job=job):
+                job = _run_import_job(job, batch_size, workers)
+        except ImportacionEnCurso as exc:
+            job.estado = ImportJob.Estado.PENDIENTE
+            job.fase = "esperando_lock"
+            job.mensaje = str(exc)
+            job.iniciado_en = None
+            job.save(update_fields=["estado", "fase", "mensaje", "iniciado_en"])
+            return job
+    # El archivo subido solo se conserva para reanudar el job o confirmar la vista previa;
+    # al aplicarla ya no se lee (los cambios están guardados en el job).
+    if not job.puede_reanudarse and not (job.es_vista_previa and job.estado == ImportJob.Estado.COMPLETADO):
+        eliminar_subida(job.archivo)
+    return job
+
+
+def limpiar_archivos_importacion(dias=None):
+    # Borra los archivos de errores y las subidas con más de IMPORT_RETENCION_DIAS días,
+    # salvo los de jobs en cola, en proceso o que se pueden reanudar. Los logs cuyo
+    # archivo de errores se borra quedan con la muestra de errores guardada en la base.
+    dias = getattr(settings, "IMPORT_RETENCION_DIAS", RETENCION_DIAS) if dias is None else dias
+    limite = time.time() - dias * 86400
+    activos = ImportJob.objects.filter(
+        Q(estado__in=[ImportJob.Estado.PENDIENTE, ImportJob.Estado.EN_PROCESO])
+        | Q(estado=ImportJob.Estado.ERROR, checkpoint__isnull=False)
+    ).values_list("pk", "archivo")
+    en_uso = set()
+    for job_id, archivo in activos:
+        en_uso.update({Path(archivo).resolve(), ruta_errores(f"job_{job_id}.csv.gz").resolve()})
+
+    borrados = {"subidas": [], "errores": []}
+    for clave, directorio in (("subidas", Path(settings.IMPORT_UPLOAD_DIR)), ("errores", ruta_errores(""))):
+        if not directorio.is_dir():
+            continue
+        for ruta in directorio.iterdir():
+            try:
+                if not ruta.is_file() or ruta.resolve() in en_uso or ruta.stat().st_mtime >= limite:
+                    continue
+                ruta.unlink()
+            except FileNotFoundError:
+                continue
+            borrados[clave].append(str(ruta))
+    if borrados["errores"]:
+        ImportLog.objects.filter(archivo_errores__in=borrados["errores"]).update(archivo_errores="")
+    return len(borrados["subidas"]), len(borrados["errores"])
+
+
+def _run_import_job(job, batch_size, workers):
+    path = Path(job.archivo)
+    batch_size = batch_size or getattr(settings, "IMPORT_BATCH_SIZE", None)
+    vista_previa = job.vista_previa
+    if not job.sha256 and path.exists():
+        job.sha256 = file_sha256(path)
+        job.save(update_fields=["sha256"])
+    if vista_previa is None and not job.es_vista_previa and not job.forzar and not job.checkpoint:
+        previo = find_previous_import(job.sha256, job.modo)
+        if previo is not None:
+            # Mismo archivo y modo ya importados: no se vuelve a leer.
+            job.estado = ImportJob.Estado.COMPLETADO
+            job.resultados = resultados_ya_importado(previo)
+            job.import_log = previo
+            job.fase = "finalizado"
+            job.finalizado_en = timezone.now()
+            job.save()
+            return job
+    if vista_previa is not None:
+        job.filas_estimadas = len(vista_previa.cambios["operaciones"])
+    else:
+        job.filas_estimadas = estimar_filas(path, job.hoja)
+    job.save(update_fields=["filas_estimadas"])
+    progreso = JobProgress(job)
+    archivo_errores = ruta_errores(f"job_{job.pk}.csv.gz")
+    try:
+        if job.es_vista_previa:
+            cambios = ChangeSet(job.modo)
+            resultados, errores = import_inventario_csv(
+                path,
+                job.modo,
+                progress=progreso.actualizar,
+                preview=cambios,
+                desde=find_watermark(job.modo) if job.incremental else None,
+                workers=workers,
+                hoja=job.hoja,
+                archivo_errores=archivo_errores,
+            )
+            job.cambios = cambios.as_dict(resultados, errores)
+            log = None
+        elif vista_previa is not None:
+            resultados, errores = aplicar_cambios(
+                vista_previa.cambios,
+                batch_size=batch_size,
+                progress=progreso.actualizar,
+                archivo_errores=archivo_errores,
+            )
+            log = registrar_importacion(
+                job.usuario,
+                path,
+                resultados,
+                errores,
+                resumen=f"Importación CSV aplicada desde la vista previa #{vista_previa.pk}.",
+                sha256=job.sha256,
+                modo=job.modo,
+            )
+        else:
+            resultados, errores = import_inventario_csv(
+                path,
+                job.modo,
+                batch_size=batch_size,
+                progress=progreso.actualizar,
+                desde=find_watermark(job.modo) if job.incremental else None,
+                chunk_size=job.chunk_size,
+                checkpoint=job.checkpoint,
+                on_checkpoint=partial(guardar_checkpoint, job),
+                workers=workers,
+                hoja=job.hoja,
+                archivo_errores=archivo_errores,
+            )
+            log = registrar_importacion(
+                job.usuario,
+                path,
+                resultados,
+                errores,
+                sha256=job.sha256,
+                modo=job.modo,
+            )
+    except Exception as exc:
+        job.estado = ImportJob.Estado.ERROR
+        job.mensaje = str(exc)
+        if job.chunk_size:
+            # El checkpoint del bloque que falló pudo quedar solo en memoria.
+            job.checkpoint = ImportJob.objects.filter(pk=job.pk).values_list("checkpoint", flat=True).first()
+    else:
+        job.estado = ImportJob.Estado.COMPLETADO
+        job.resultados = resultados
+        job.import_log = log
+        job.checkpoint = None
+        job.filas_procesadas = job.filas_estimadas if vista_previa is not None else resultados["total"]
+    finally:
+        progreso.detener()
+
+    transcurrido = time.monotonic() - progreso.inicio
+    if job.estado == ImportJob.Estado.ERROR:
+        job.filas_procesadas = progreso.snapshot["filas_procesadas"]
+    job.filas_por_segundo = round(job.filas_procesadas / transcurrido, 1) if transcurrido else 0.0
+    job.fase = "finalizado"
+    job.finalizado_en = timezone.now()
+    job.save()
+    return job
+
+
+def _run_in_thread(job_id):
+    try:
+        while True:
+            job = claim_job(job_id)
+            if job is None:
+                return
+            job = run_import_job(job)
+            if job.estado != ImportJob.Estado.PENDIENTE:
+                return
+            # Espera a que se libere el candado de importación.
+            time.sleep(getattr(settings, "IMPORT_LOCK_RETRY", LOCK_RETRY_INTERVAL))
+    finally:
+        connections.close_all()
+
+
+def start_worker_thread(job_id):
+    hilo = threading.Thread(target=_run_in_thread, args=(job_id,), daemon=True, name=f"import-job-{job_id}")
+    hilo.start()
+    return hilo
+
+
+def _encolar(job):
+    if getattr(settings, "IMPORT_JOBS_WORKER", "thread") == "thread":
+        transaction.on_commit(lambda: start_worker_thread(job.pk))
+    return job
+
+
+def enqueue_import(
+    path,
+    modo,
+    usuario=None,
+    preview=False,
+    sha256="",
+    forzar=False,
+    incremental=False,
+    chunk_size=None,
+    hoja="",
+):
+    job = ImportJob.objects.create(
+        usuario=usuario,
+        archivo=str(path),
+        sha256=sha256,
+        modo=modo,
+        forzar=forzar,
+        incremental=incremental,
+        hoja=hoja,
+        fase="en_cola",
+        es_vista_previa=preview,
+        chunk_size=None if preview else chunk_size or getattr(settings, "IMPORT_CHUNK_SIZE", None),
+    )
+    return _encolar(job)
+
+
+def reanudar_importacion(job, encolar=True):
+    # El job vuelve a la cola con su checkpoint; run_import_job continúa desde ahí.
+    if not job.puede_reanudarse:
+        raise ValueError("La importación no se puede reanudar (no falló o no tiene checkpoint).")
+    job.estado = ImportJob.Estado.PENDIENTE
+    job.fase = "en_cola"
+    job.mensaje = ""
+    job.finalizado_en = None
+    job.save(update_fields=["estado", "fase", "mensaje", "finalizado_en"])
+    return _encolar(job) if encolar else job
+
+
+def confirmar_vista_previa(vista_previa, usuario=None, encolar=True):
+    if not vista_previa.puede_confirmarse:
+        raise ValueError("La vista previa no se puede confirmar (no terminó o ya se aplicó).")
+    job = ImportJob.objects.create(
+        usuario=usuario,
+        archivo=vista_previa.archivo,
+        sha256=vista_previa.sha256,
+        modo=vista_previa.modo,
+        fase="en_cola",
+        vista_previa=vista_previa,
+    )
+    return _encolar(job) if encolar else job
@@ -0,0 +1,130 @@
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection
+from django.utils import timezone
+
+from equipos.models import ImportLock
+
+IMPORT_LOCK = "importacion"
+HOST = socket.gethostname()
+
+
+class ImportacionEnCurso(RuntimeError):
+    def __init__(self, lock):
+        self.lock = lock
+        super().__init__(describir_lock(lock))
+
+
+def describir_lock(lock):
+    desde = timezone.localtime(lock.adquirido_en).strftime("%Y-%m-%d %H:%M") if lock.adquirido_en else "-"
+    return f"Hay una importación en curso: {lock.propietario or 'desconocido'} (desde {desde}, {lock.host} pid {lock.pid})."
+
+
+def _timeout():
+    return timedelta(seconds=getattr(settings, "IMPORT_LOCK_TIMEOUT", 600))
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def lock_abandonado(lock):
+    # En el mismo equipo basta con ver si el proceso sigue vivo; desde otro equipo solo
+    # queda el latido. os.kill(pid, 0) termina el proceso en Windows, ahí no se usa.
+    if lock.host == HOST and lock.pid and os.name == "posix":
+        return not _proceso_vivo(lock.pid)
+    return lock.latido is None or lock.latido < timezone.now() - _timeout()
+
+
+def lock_actual():
+    # El candado vigente, o None si está libre o su dueño lo abandonó.
+    lock = ImportLock.objects.select_related("usuario", "job").filter(nombre=IMPORT_LOCK).first()
+    if lock is None or not lock.ocupado or lock_abandonado(lock):
+        return None
+    return lock
+
+
+def adquirir_lock(propietario, usuario=None, job=None):
+    try:
+        ImportLock.objects.get_or_create(nombre=IMPORT_LOCK)
+    except IntegrityError:
+        pass
+    lock = ImportLock.objects.get(nombre=IMPORT_LOCK)
+    if lock.ocupado and not lock_abandonado(lock):
+        raise ImportacionEnCurso(lock)
+    token = uuid.uuid4().hex
+    ahora = timezone.now()
+    try:
+        # Solo gana quien todavía ve el token que se leyó arriba.
+        tomados = ImportLock.objects.filter(nombre=IMPORT_LOCK, token=lock.token).update(
+            token=token,
+            propietario=propietario[:200],
+            usuario=usuario,
+            job=job,
+            host=HOST,
+            pid=os.getpid(),
+            adquirido_en=ahora,
+            latido=ahora,
+        )
+    except DatabaseError:
+        # En SQLite otra importación con la base bloqueada también cuenta como ocupado.
+        tomados = 0
+    if not tomados:
+        raise ImportacionEnCurso(ImportLock.objects.get(nombre=IMPORT_LOCK))
+    return token
+
+
+def liberar_lock(token):
+    ImportLock.objects.filter(nombre=IMPORT_LOCK, token=token).update(token="", latido=timezone.now())
+
+
+class LatidoLock:
+    # Renueva el latido mientras dura la importación. Como JobProgress, en SQLite no usa
+    # un hilo aparte: ahí el candado se valida por pid, no por latido.
+    def __init__(self, token):
+        self.token = token
+        self._detener = threading.Event()
+        self._hilo = None
+        if connection.vendor != "sqlite":
+            self._hilo = threading.Thread(target=self._latir, daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def _latir(self):
+        intervalo = _timeout().total_seconds() / 4
+        try:
+            while not self._detener.wait(intervalo):
+                try:
+                    ImportLock.objects.filter(nombre=IMPORT_LOCK, token=self.token).update(latido=timezone.now())
+                except DatabaseError:
+                    pass
+        finally:
+            connection.close()
+
+
+@contextmanager
+def bloqueo_importacion(propietario, usuario=None, job=None):
+    # Lanza ImportacionEnCurso si otra importación tiene el candado.
+    token = adquirir_lock(propietario, usuario, job)
+    latido = LatidoLock(token)
+    try:
+        yield token
+    finally:
+        latido.detener()
+        liberar_lock(token)
@@ -0,0 +1,117 @@
+import sys
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+class QueryCounter:
+    # Cuenta consultas con execute_wrapper; a diferencia de CaptureQueriesContext no
+    # guarda el SQL, así que sirve para importaciones de millones de filas.
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.consultas += 1
+
+    @contextmanager
+    def contar(self, conexion=None):
+        with (conexion or connection).execute_wrapper(self):
+            yield self
+
+
+def reset_peak_rss():
+    # En Linux escribir "5" en clear_refs reinicia VmHWM; en otros sistemas el pico
+    # es el de todo el proceso.
+    try:
+        with open("/proc/self/clear_refs", "w") as archivo:
+            archivo.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_kb():
+    try:
+        with open("/proc/self/status") as archivo:
+            for linea in archivo:
+                if linea.startswith("VmHWM:"):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reporta bytes; Linux, kilobytes.
+    return pico // 1024 if sys.platform == "darwin" else pico
+
+
+class PhaseTimer:
+    # Acumula el tiempo de cada fase cambiando de una a otra con cambiar(); es más barato
+    # que un context manager por fila.
+    def __init__(self):
+        self.segundos = {}
+        self.fase = None
+        self.desde = 0.0
+
+    def cambiar(self, fase):
+        ahora = time.perf_counter()
+        if self.fase is not None:
+            self.segundos[self.fase] = self.segundos.get(self.fase, 0.0) + ahora - self.desde
+        self.fase = fase
+        self.desde = ahora
+
+    def detener(self):
+        self.cambiar(None)
+
+    def medir(self, filas, fase):
+        # Envuelve un iterador para atribuir a la fase el tiempo de obtener cada fila.
+        iterador = iter(filas)
+        while True:
+            self.cambiar(fase)
+            try:
+                fila = next(iterador)
+            except StopIteration:
+                return
+            finally:
+                self.detener()
+            yield fila
+
+
+class ImportMetrics:
+    def __init__(self):
+        self.fases = PhaseTimer()
+        self.consultas = QueryCounter()
+        self.inicio = time.perf_counter()
+        reset_peak_rss()
+        self.memoria_inicial_kb = peak_rss_kb()
+
+    @contextmanager
+    def medir(self, conexion=None):
+        with self.consultas.contar(conexion):
+            try:
+                yield self
+            finally:
+                self.fases.detener()
+
+    def as_dict(self, filas):
+        segundos = time.perf_counter() - self.inicio
+        fases = {fase: round(valor, 3) for fase, valor in self.fases.segundos.items()}
+        fases["otros"] = round(max(segundos - sum(self.fases.segundos.values()), 0), 3)
+        return {
+            "segundos": round(segundos, 3),
+            "filas": filas,
+            "filas_por_segundo": round(filas / segundos, 1) if segundos else 0,
+            "fases": fases,
+            "consultas": self.consultas.consultas,
+            "segundos_consultas": round(self.consultas.segundos, 3),
+            "memoria_inicial_kb": self.memoria_inicial_kb,
+            "pico_memoria_kb": peak_rss_kb(),
+        }
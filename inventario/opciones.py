@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from equipos.models import (
+    CentroCosto,
+    Division,
+    Equipo,
+    Marca,
+    SistemaOperativo,
+    Sociedad,
+    TipoEquipo,
+)
+from inventario.conteos import version_inventario
+
+# Valores distintos de una columna con índice sin recorrer la tabla: cada paso busca en el
+# índice el siguiente valor mayor al anterior (un salto por valor, no por fila).
+VALORES_DISTINTOS = """
+WITH RECURSIVE valores (valor) AS (
+    SELECT MIN({columna}) FROM {equipo} WHERE {columna} <> ''
+    UNION ALL
+    SELECT (SELECT MIN({columna}) FROM {equipo} WHERE {columna} > valor) FROM valores WHERE valor IS NOT NULL
+)
+SELECT valor FROM valores WHERE valor IS NOT NULL
+"""
+
+
+def _en_uso(modelo, campo):
+    # Solo los registros del catálogo que tiene algún equipo; cada EXISTS usa el índice de
+    # la llave foránea en equipos_equipo.
+    return modelo.objects.filter(Exists(Equipo.objects.filter(**{campo: OuterRef("pk")})))
+
+
+def _valores_distintos(campo):
+    columna = Equipo._meta.get_field(campo).column
+    with connection.cursor() as cursor:
+        cursor.execute(VALORES_DISTINTOS.format(columna=columna, equipo=Equipo._meta.db_table))
+        return [valor for (valor,) in cursor.fetchall()]
+
+
+def _calcular_opciones():
+    return {
+        "sociedades": list(
+            _en_uso(Sociedad, "centro_costo__division__sociedad")
+            .order_by("codigo")
+            .values_list("id", "codigo", "nombre")
+        ),
+        "divisiones": list(
+            _en_uso(Division, "centro_costo__division").order_by("codigo").values_list("id", "codigo", "nombre")
+        ),
+        "centros_costo": list(
+            _en_uso(CentroCosto, "centro_costo").order_by("codigo").values_list("id", "codigo", "nombre")
+        ),
+        "marcas": list(_en_uso(Marca, "marca").order_by("nombre").values_list("id", "nombre")),
+        "sistemas_operativos": list(
+            _en_uso(SistemaOperativo, "sistema_operativo").order_by("nombre").values_list("id", "nombre")
+        ),
+        "tipos_equipo": list(_en_uso(TipoEquipo, "tipo_equipo").order_by("nombre").values_list("id", "nombre")),
+        "entidades": _valores_distintos("entidad"),
+        "municipios": _valores_distintos("municipio"),
+    }
+
+
+def opciones_filtros(*nombres):
+    # Opciones de los selects de filtros de la lista y los reportes: lo que usa algún
+    # equipo. Se guardan en caché por versión del inventario, que sube con cada escritura
+    # de equipos o catálogos, así que no hace falta invalidarlas aparte.
+    clave = f"equipos:opciones:{version_inventario()}"
+    opciones = cache.get(clave)
+    if opciones is None:
+        opciones = _calcular_opciones()
+        cache.set(clave, opciones, getattr(settings, "EQUIPOS_OPCIONES_CACHE_TIMEOUT", 3600))
+    if not nombres:
+        return opciones
+    return {nombre: opciones[nombre] for nombre in nombres}
@@ -93,6 +93,49 @@ STATIC_URL = 'static/'
 
 CSV_INVENTARIO_PATH = BASE_DIR / 'data' / 'computadoras9.csv'
 
+# Archivos subidos desde la vista de importación (CSV, .csv.gz o .zip).
+IMPORT_UPLOAD_DIR = BASE_DIR / 'data' / 'importaciones'
+
+# Errores completos de cada importación (CSV comprimido con gzip, uno por importación).
+IMPORT_ERRORS_DIR = BASE_DIR / 'data' / 'errores_importacion'
+
+# El archivo subido se borra al terminar su importación. procesar_importaciones borra los
+# archivos de errores (y las subidas que hayan quedado) con más de estos días.
+IMPORT_RETENCION_DIAS = 30
+
+# 'thread' ejecuta las importaciones en un hilo del proceso web; con 'command' solo se
+# encolan y las procesa `python manage.py procesar_importaciones`.
+IMPORT_JOBS_WORKER = 'thread'
+
+# Filas por transacción en las importaciones encoladas; None importa todo el archivo en
+# una sola transacción. Con bloques, una falla se reanuda desde el último checkpoint.
+IMPORT_CHUNK_SIZE = None
+
+# Solo una importación escribe a la vez. Un candado cuyo dueño murió (mismo equipo) o
+# sin latido por IMPORT_LOCK_TIMEOUT segundos (otro equipo) se puede tomar; los jobs
+# que lo encuentran ocupado esperan en la cola y reintentan cada IMPORT_LOCK_RETRY.
+IMPORT_LOCK_TIMEOUT = 600
+IMPORT_LOCK_RETRY = 5
+
+# 'cursor' pagina la lista de equipos por (actualizado_en, identificador, id) sin OFFSET y
+# calcula el total solo a pedido; 'paginas' usa números de página con el total siempre.
+EQUIPOS_PAGINACION = 'cursor'
+
+# Los totales de la lista se guardan en caché por filtros y versión del inventario; con
+# cursor se muestran sin pedirlos solo si ya están en caché. Al pedir el total, si no está
+# en caché y la tabla tiene más de EQUIPOS_CONTEO_EXACTO_HASTA equipos, la lista muestra
+# un total estimado (marcado como aproximado) con la opción de contar exacto.
+EQUIPOS_CONTEO_CACHE_TIMEOUT = 3600
+EQUIPOS_CONTEO_EXACTO_HASTA = 200000
+
+# Opciones de los filtros (sociedades, marcas, entidades...) en caché por versión del
+# inventario; cualquier escritura de equipos o catálogos las invalida.
+EQUIPOS_OPCIONES_CACHE_TIMEOUT = 3600
+
+# Tiempo máximo para calcular los conteos por faceta de la lista; si no alcanza, la
+# página se muestra sin conteos en los selects.
+EQUIPOS_FACETAS_PRESUPUESTO_MS = 300
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = 'login'
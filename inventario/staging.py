@@ -0,0 +1,584 @@
+import uuid
+from collections import Counter
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from equipos.models import (
+    EQUIPO_IMPORT_FIELDS,
+    AuditLog,
+    CentroCosto,
+    Division,
+    Equipo,
+    Sociedad,
+    calcular_import_hash,
+)
+from inventario.conteos import marcar_cambio
+from inventario.importer import (
+    CATALOGOS_POR_CAMPO,
+    ERRORS_LIMIT,
+    MARCA_FORMATO,
+    PROGRESS_EVERY,
+    AuditoriaEquipos,
+    CacheNormalizacion,
+    CatalogResolver,
+    HeaderMap,
+    RegistroErrores,
+    modificacion_key,
+    open_import_rows,
+    parse_row,
+    registrar_marca,
+    validate_row,
+)
+from inventario.metrics import ImportMetrics
+
+STAGING_TABLE = "importacion_staging"
+STAGING_BATCH_SIZE = 5000
+
+# Columnas de equipos_equipo que llena la importación, en el orden de EQUIPO_IMPORT_FIELDS.
+COLUMNAS_EQUIPO = [Equipo._meta.get_field(campo).column for campo in EQUIPO_IMPORT_FIELDS]
+COLUMNAS_TEXTO = (
+    "identificador",
+    "clave",
+    "numero_inventario",
+    "nombre",
+    "numero_serie",
+    "sociedad_codigo",
+    "sociedad_nombre",
+    "division_codigo",
+    "division_nombre",
+    "centro_codigo",
+    "marca",
+    "sistema_operativo",
+    "tipo_equipo",
+    "modelo",
+    "codigo_postal",
+    "domicilio",
+    "antiguedad",
+    "rpe_responsable",
+    "nombre_responsable",
+    "direccion_ip",
+    "direccion_mac",
+    "entidad",
+    "municipio",
+)
+COLUMNAS_CARGA = ("fila", "marca_modificacion") + COLUMNAS_TEXTO + ("infraestructura_critica",)
+ERRORES_SQL = {
+    "error_inventario": "Número de inventario ya existe en otro equipo.",
+    "error_identificador": "Identificador ya existe en otro equipo.",
+}
+
+CREAR_STAGING = """
+CREATE TEMPORARY TABLE {staging} (
+    fila INTEGER PRIMARY KEY,
+    marca_modificacion VARCHAR(14) NOT NULL,
+    {texto},
+    infraestructura_critica BOOLEAN NOT NULL,
+    centro_costo_id INTEGER NULL,
+    marca_id INTEGER NULL,
+    sistema_operativo_id INTEGER NULL,
+    tipo_equipo_id INTEGER NULL,
+    modelo_id INTEGER NULL,
+    equipo_id INTEGER NULL,
+    import_hash VARCHAR(64) NULL,
+    estado VARCHAR(20) NULL
+)
+"""
+INDICES_STAGING = ("numero_serie, fila", "numero_inventario, fila", "identificador", "equipo_id")
+
+# Cada sentencia se formatea con los nombres de tabla de tablas().
+SOCIEDADES = """
+INSERT INTO {sociedad} (codigo, nombre)
+SELECT sociedad_codigo, sociedad_nombre FROM {staging}
+WHERE fila IN (SELECT MAX(fila) FROM {staging} GROUP BY sociedad_codigo)
+ON CONFLICT (codigo) DO UPDATE SET nombre = excluded.nombre WHERE {sociedad}.nombre <> excluded.nombre
+"""
+DIVISIONES = """
+INSERT INTO {division} (sociedad_id, codigo, nombre)
+SELECT so.id, s.division_codigo, s.division_nombre FROM {staging} s
+JOIN {sociedad} so ON so.codigo = s.sociedad_codigo
+WHERE s.fila IN (SELECT MAX(fila) FROM {staging} GROUP BY sociedad_codigo, division_codigo)
+ON CONFLICT (sociedad_id, codigo) DO UPDATE SET nombre = excluded.nombre WHERE {division}.nombre <> excluded.nombre
+"""
+# Como en CatalogResolver, el nombre del centro de costo es su código.
+CENTROS_COSTO = """
+INSERT INTO {centro_costo} (division_id, codigo, nombre)
+SELECT d.id, s.centro_codigo, s.centro_codigo FROM {staging} s
+JOIN {sociedad} so ON so.codigo = s.sociedad_codigo
+JOIN {division} d ON d.sociedad_id = so.id AND d.codigo = s.division_codigo
+WHERE s.fila IN (SELECT MAX(fila) FROM {staging} GROUP BY sociedad_codigo, division_codigo, centro_codigo)
+ON CONFLICT (division_id, codigo) DO UPDATE SET nombre = excluded.nombre WHERE {centro_costo}.nombre <> excluded.nombre
+"""
+ASIGNAR_CENTROS_COSTO = """
+UPDATE {staging} SET centro_costo_id = (
+    SELECT c.id FROM {centro_costo} c
+    JOIN {division} d ON d.id = c.division_id
+    JOIN {sociedad} so ON so.id = d.sociedad_id
+    WHERE so.codigo = {staging}.sociedad_codigo
+    AND d.codigo = {staging}.division_codigo
+    AND c.codigo = {staging}.centro_codigo
+)
+"""
+ASIGNAR_EQUIPOS = """
+UPDATE {staging} SET equipo_id = (SELECT e.id FROM {equipo} e WHERE e.numero_serie = {staging}.numero_serie)
+"""
+# Con el mismo número de serie repetido en el archivo gana la última fila sin error; en
+# create_only, la primera (las siguientes ya encontrarían el equipo creado).
+REINICIAR_DUPLICADOS = "UPDATE {staging} SET estado = NULL WHERE estado = 'duplicado'"
+DUPLICADOS = """
+UPDATE {staging} SET estado = 'duplicado'
+WHERE estado IS NULL AND fila NOT IN (SELECT {agregado}(fila) FROM {staging} WHERE estado IS NULL GROUP BY numero_serie)
+"""
+OMITIR_POR_MODO = {
+    "update_only": "UPDATE {staging} SET estado = 'omitido' WHERE estado IS NULL AND equipo_id IS NULL",
+    "create_only": "UPDATE {staging} SET estado = 'omitido' WHERE estado IS NULL AND equipo_id IS NOT NULL",
+}
+# Las validaciones reproducen el orden de la importación fila por fila: un equipo tiene
+# un inventario desde la fila que se lo asigna hasta la siguiente fila del mismo equipo
+# que lo cambia por otro.
+INVENTARIO_OCUPADO = """
+UPDATE {staging} SET estado = 'error_inventario'
+WHERE estado IS NULL AND numero_inventario <> '' AND EXISTS (
+    SELECT 1 FROM {equipo} e
+    WHERE e.numero_inventario = {staging}.numero_inventario
+    AND ({staging}.equipo_id IS NULL OR e.id <> {staging}.equipo_id)
+    AND NOT EXISTS (
+        SELECT 1 FROM {staging} otra
+        WHERE otra.equipo_id = e.id AND otra.estado IS NULL AND otra.fila < {staging}.fila
+        AND otra.numero_inventario <> '' AND otra.numero_inventario <> e.numero_inventario
+    )
+)
+"""
+INVENTARIO_REPETIDO = """
+UPDATE {staging} SET estado = 'error_inventario'
+WHERE estado IS NULL AND numero_inventario <> '' AND EXISTS (
+    SELECT 1 FROM {staging} otra
+    WHERE otra.numero_inventario = {staging}.numero_inventario AND otra.fila < {staging}.fila
+    AND otra.numero_serie <> {staging}.numero_serie AND otra.estado IS NULL
+    AND NOT EXISTS (
+        SELECT 1 FROM {staging} despues
+        WHERE despues.numero_serie = otra.numero_serie AND despues.estado IS NULL
+        AND despues.fila > otra.fila AND despues.fila < {staging}.fila
+        AND despues.numero_inventario <> '' AND despues.numero_inventario <> otra.numero_inventario
+    )
+)
+"""
+# Un equipo nuevo se da de alta con el identificador de su primera fila sin error.
+IDENTIFICADOR_OCUPADO = """
+UPDATE {staging} SET estado = 'error_identificador'
+WHERE estado IS NULL AND equipo_id IS NULL
+AND NOT EXISTS (
+    SELECT 1 FROM {staging} antes
+    WHERE antes.numero_serie = {staging}.numero_serie AND antes.fila < {staging}.fila AND antes.estado IS NULL
+)
+AND (
+    EXISTS (SELECT 1 FROM {equipo} e WHERE e.identificador = {staging}.identificador)
+    OR EXISTS (
+        SELECT 1 FROM {staging} otra
+        WHERE otra.identificador = {staging}.identificador AND otra.fila < {staging}.fila
+        AND otra.numero_serie <> {staging}.numero_serie AND otra.equipo_id IS NULL AND otra.estado IS NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM {staging} antes
+            WHERE antes.numero_serie = otra.numero_serie AND antes.fila < otra.fila AND antes.estado IS NULL
+        )
+    )
+)
+"""
+# Sin inventario en la fila, el equipo conserva el último que tuvo. Solo cuentan las filas
+# repetidas anteriores: en create_only las posteriores nunca se aplican.
+CONSERVAR_INVENTARIO = """
+UPDATE {staging} SET numero_inventario = COALESCE(
+    (
+        SELECT otra.numero_inventario FROM {staging} otra
+        WHERE otra.numero_serie = {staging}.numero_serie AND otra.estado = 'duplicado'
+        AND otra.fila < {staging}.fila AND otra.numero_inventario <> ''
+        ORDER BY otra.fila DESC LIMIT 1
+    ),
+    (SELECT e.numero_inventario FROM {equipo} e WHERE e.id = {staging}.equipo_id),
+    ''
+)
+WHERE estado IS NULL AND numero_inventario = ''
+"""
+# {aplicadas}: las filas que la importación fila por fila aplicaría, con las repetidas
+# anteriores de una serie salvo en create_only.
+CATALOGO = """
+INSERT INTO {catalogo} (nombre)
+SELECT DISTINCT {campo} FROM {staging} WHERE {aplicadas} AND {campo} IS NOT NULL
+ON CONFLICT (nombre) DO NOTHING
+"""
+ASIGNAR_CATALOGO = """
+UPDATE {staging} SET {campo}_id = (SELECT c.id FROM {catalogo} c WHERE c.nombre = {staging}.{campo})
+WHERE {aplicadas} AND {campo} IS NOT NULL
+"""
+COMPARAR = """
+SELECT s.fila, s.equipo_id, e.import_hash, s.estado, s.numero_serie, {columnas_staging}, {columnas_equipo}
+FROM {staging} s LEFT JOIN {equipo} e ON e.id = s.equipo_id
+WHERE {aplicadas_s} AND s.fila > %s ORDER BY s.fila LIMIT %s
+"""
+# Los inventarios que cambian se vacían antes del upsert para que un intercambio entre
+# equipos no choque con unique_numero_inventario_nonempty a media sentencia.
+LIBERAR_INVENTARIOS = """
+UPDATE {equipo} SET numero_inventario = ''
+WHERE id IN (
+    SELECT s.equipo_id FROM {staging} s JOIN {equipo} e ON e.id = s.equipo_id
+    WHERE s.estado = 'actualizar' AND s.numero_inventario <> e.numero_inventario
+)
+"""
+FUSIONAR = """
+INSERT INTO {equipo} (identificador, {columnas}, activo, is_baja, creado_en, actualizado_en, import_hash)
+SELECT COALESCE(
+    (
+        SELECT primera.identificador FROM {staging} primera
+        WHERE primera.numero_serie = {staging}.numero_serie AND primera.estado = 'duplicado'
+        AND primera.fila < {staging}.fila
+        ORDER BY primera.fila LIMIT 1
+    ),
+    identificador
+), {columnas}, %s, %s, %s, %s, import_hash FROM {staging}
+WHERE estado IN ('crear', 'actualizar') ORDER BY fila
+ON CONFLICT (numero_serie) DO UPDATE SET {actualizar}, actualizado_en = excluded.actualizado_en,
+import_hash = excluded.import_hash
+"""
+# Las altas se auditan después del upsert, cuando ya tienen id.
+AUDITAR_ALTAS = """
+INSERT INTO {auditlog} (fecha, accion, resumen, equipo_id, lote)
+SELECT %s, 'IMPORT_ALTA', 'Alta por importación.', e.id, %s FROM {staging} s
+JOIN {equipo} e ON e.numero_serie = s.numero_serie
+WHERE s.estado = 'crear'
+"""
+SOLO_HUELLA = """
+UPDATE {equipo} SET import_hash = (
+    SELECT s.import_hash FROM {staging} s WHERE s.equipo_id = {equipo}.id AND s.estado = 'solo_huella'
+)
+WHERE id IN (SELECT equipo_id FROM {staging} WHERE estado = 'solo_huella')
+"""
+
+
+def tablas():
+    return {
+        "staging": STAGING_TABLE,
+        "equipo": Equipo._meta.db_table,
+        "sociedad": Sociedad._meta.db_table,
+        "division": Division._meta.db_table,
+        "centro_costo": CentroCosto._meta.db_table,
+        "auditlog": AuditLog._meta.db_table,
+    }
+
+
+def soporta_staging(conexion=None):
+    conexion = conexion or connection
+    if conexion.vendor == "postgresql":
+        return True
+    # INSERT ... ON CONFLICT DO UPDATE existe desde SQLite 3.24.
+    return conexion.vendor == "sqlite" and conexion.Database.sqlite_version_info >= (3, 24, 0)
+
+
+class StagingImport:
+    # Carga las filas normalizadas en una tabla temporal y resuelve catálogos, validaciones
+    # y escritura con unas cuantas sentencias sobre todo el conjunto.
+    def __init__(self, cursor, modo, fases):
+        self.cursor = cursor
+        self.modo = modo
+        self.fases = fases
+        self.tablas = tablas()
+        # creados, actualizados y sin_cambios como los cuenta import_inventario_csv; ver comparar().
+        self.conteo_filas = Counter()
+
+    def aplicadas(self, alias=""):
+        if self.modo == "create_only":
+            return f"{alias}estado IS NULL"
+        return f"({alias}estado IS NULL OR {alias}estado = 'duplicado')"
+
+    def sql(self, sentencia, params=(), **formato):
+        self.cursor.execute(sentencia.format(**self.tablas, **formato), params)
+        return self.cursor.rowcount
+
+    def crear_tabla(self):
+        texto = ",\n    ".join(f"{columna} VARCHAR(255) NULL" for columna in COLUMNAS_TEXTO)
+        self.sql("DROP TABLE IF EXISTS {staging}")
+        self.sql(CREAR_STAGING, texto=texto)
+        for columna in INDICES_STAGING:
+            nombre = columna.split(",")[0]
+            self.sql(f"CREATE INDEX {{staging}}_{nombre} ON {{staging}} ({columna})")
+
+    def insertar(self, filas):
+        if not filas:
+            return
+        self.fases.cambiar("staging")
+        columnas = ", ".join(COLUMNAS_CARGA)
+        marcadores = ", ".join(["%s"] * len(COLUMNAS_CARGA))
+        self.cursor.executemany(f"INSERT INTO {STAGING_TABLE} ({columnas}) VALUES ({marcadores})", filas)
+        self.fases.cambiar("normalizacion")
+
+    def resolver_jerarquia(self):
+        self.fases.cambiar("resolucion")
+        self.sql(SOCIEDADES)
+        self.sql(DIVISIONES)
+        self.sql(CENTROS_COSTO)
+        self.sql(ASIGNAR_CENTROS_COSTO)
+
+    def validar(self):
+        self.fases.cambiar("validacion")
+        self.sql(ASIGNAR_EQUIPOS)
+        if self.modo in OMITIR_POR_MODO:
+            self.sql(OMITIR_POR_MODO[self.modo])
+        # Una fila con error deja libre su inventario o identificador, o cede el lugar a una
+        # fila anterior del mismo equipo, así que se repite hasta que ninguna fila cambia.
+        # En create_only las filas repetidas no se aplican, así que tampoco ocupan nada.
+        solo_primera = self.modo == "create_only"
+        while True:
+            self.sql(REINICIAR_DUPLICADOS)
+            if solo_primera:
+                self.sql(DUPLICADOS, agregado="MIN")
+            errores = self.sql(INVENTARIO_OCUPADO) + self.sql(INVENTARIO_REPETIDO) + self.sql(IDENTIFICADOR_OCUPADO)
+            if not solo_primera:
+                self.sql(DUPLICADOS, agregado="MAX")
+            if not errores:
+                break
+        self.sql(CONSERVAR_INVENTARIO)
+
+    def resolver_catalogos(self):
+        self.fases.cambiar("resolucion")
+        for campo, model in CATALOGOS_POR_CAMPO.items():
+            self.sql(CATALOGO, campo=campo, catalogo=model._meta.db_table, aplicadas=self.aplicadas())
+            self.sql(ASIGNAR_CATALOGO, campo=campo, catalogo=model._meta.db_table, aplicadas=self.aplicadas())
+
+    def comparar(self, auditoria):
+        # La huella se calcula en Python (con los ids de catálogo ya resueltos) igual que
+        # en calcular_import_hash, por bloques de filas. Cada bloque deja en auditoria los
+        # cambios campo por campo de los equipos que se actualizan.
+        # Solo la última fila de una serie repetida se escribe, comparada con la base; para
+        # los conteos, como fila por fila, cada fila se compara con la anterior de su serie.
+        self.fases.cambiar("comparacion")
+        sentencia = COMPARAR.format(
+            **self.tablas,
+            columnas_staging=", ".join(f"s.{columna}" for columna in COLUMNAS_EQUIPO),
+            columnas_equipo=", ".join(f"e.{columna}" for columna in COLUMNAS_EQUIPO),
+            aplicadas_s=self.aplicadas("s."),
+        )
+        critica = EQUIPO_IMPORT_FIELDS.index("infraestructura_critica")
+        inventario = EQUIPO_IMPORT_FIELDS.index("numero_inventario")
+        total = len(COLUMNAS_EQUIPO)
+        # serie -> (huella, inventario) de la fila repetida anterior, hasta llegar a la última.
+        repetidas = {}
+        ultima = 0
+        while True:
+            self.cursor.execute(sentencia, [ultima, STAGING_BATCH_SIZE])
+            filas = self.cursor.fetchall()
+            if not filas:
+                break
+            cambios = []
+            for fila in filas:
+                numero_fila, equipo_id, huella, estado_fila, numero_serie = fila[:5]
+                nuevos = list(fila[5 : 5 + total])
+                nuevos[critica] = bool(nuevos[critica])
+                actuales = list(fila[5 + total :])
+                actuales[critica] = bool(actuales[critica])
+                anterior = repetidas.get(numero_serie)
+                if not nuevos[inventario]:
+                    # Sin inventario la fila conserva el que tenía el equipo hasta ese momento.
+                    nuevos[inventario] = anterior[1] if anterior else actuales[inventario] or ""
+                nuevo_hash = calcular_import_hash(dict(zip(EQUIPO_IMPORT_FIELDS, nuevos)))
+                actuales = dict(zip(EQUIPO_IMPORT_FIELDS, actuales))
+                if anterior is not None:
+                    conteo = "sin_cambios" if anterior[0] == nuevo_hash else "actualizados"
+                elif equipo_id is None:
+                    conteo = "creados"
+                elif nuevo_hash in (huella, calcular_import_hash(actuales)):
+                    conteo = "sin_cambios"
+                else:
+                    conteo = "actualizados"
+                self.conteo_filas[conteo] += 1
+                if estado_fila == "duplicado":
+                    repetidas[numero_serie] = (nuevo_hash, nuevos[inventario])
+                    continue
+                repetidas.pop(numero_serie, None)
+                if equipo_id is None:
+                    estado = "crear"
+                elif huella == nuevo_hash:
+                    estado = "sin_cambios"
+                elif calcular_import_hash(actuales) == nuevo_hash:
+                    estado = "solo_huella"
+                else:
+                    estado = "actualizar"
+                    nuevos = dict(zip(EQUIPO_IMPORT_FIELDS, nuevos))
+                    campos = [campo for campo in EQUIPO_IMPORT_FIELDS if actuales[campo] != nuevos[campo]]
+                    auditoria.cambio(equipo_id, auditoria.diferencias(campos, actuales, nuevos))
+                cambios.append((estado, nuevo_hash, numero_fila))
+            if cambios:
+                self.cursor.executemany(
+                    f"UPDATE {STAGING_TABLE} SET estado = %s, import_hash = %s WHERE fila = %s", cambios
+                )
+            self.fases.cambiar("escritura")
+            auditoria.flush()
+            self.fases.cambiar("comparacion")
+            ultima = filas[-1][0]
+
+    def fusionar(self, lote):
+        self.fases.cambiar("escritura")
+        ahora = connection.ops.adapt_datetimefield_value(timezone.now())
+        self.sql(LIBERAR_INVENTARIOS)
+        self.sql(
+            FUSIONAR,
+            [True, False, ahora, ahora],
+            columnas=", ".join(COLUMNAS_EQUIPO),
+            actualizar=", ".join(
+                f"{columna} = excluded.{columna}" for columna in COLUMNAS_EQUIPO if columna != "numero_serie"
+            ),
+        )
+        self.sql(SOLO_HUELLA)
+        self.sql(AUDITAR_ALTAS, [ahora, lote])
+
+    def conteos(self):
+        self.sql("SELECT estado, COUNT(*) FROM {staging} GROUP BY estado")
+        return dict(self.cursor.fetchall())
+
+    def errores(self, registro):
+        # Todos van al archivo de errores; se devuelve solo la muestra de ERRORS_LIMIT.
+        estados = ", ".join(f"'{estado}'" for estado in ERRORES_SQL)
+        self.sql(f"SELECT fila, identificador, estado FROM {{staging}} WHERE estado IN ({estados}) ORDER BY fila")
+        while True:
+            filas = self.cursor.fetchmany(STAGING_BATCH_SIZE)
+            if not filas:
+                break
+            for fila, identificador, estado in filas:
+                registro.agregar(fila, identificador, ERRORES_SQL[estado], en_muestra=False)
+        self.sql(
+            f"SELECT fila, identificador, estado FROM {{staging}} WHERE estado IN ({estados}) ORDER BY fila LIMIT %s",
+            [ERRORS_LIMIT],
+        )
+        errores = [
+            {"fila": fila, "identificador": identificador, "mensaje": ERRORES_SQL[estado]}
+            for fila, identificador, estado in self.cursor.fetchall()
+        ]
+        self.sql(
+            f"SELECT MIN(marca_modificacion) FROM {{staging}} WHERE estado IN ({estados}) AND marca_modificacion <> ''"
+        )
+        return errores, self.cursor.fetchone()[0] or ""
+
+    def borrar_tabla(self):
+        self.sql("DROP TABLE IF EXISTS {staging}")
+
+
+def _fila_staging(numero_fila, marca, datos):
+    valores = [numero_fila, marca]
+    for columna in COLUMNAS_TEXTO:
+        valor = datos[columna if columna != "numero_inventario" else "inventario"]
+        if columna in ("identificador", "clave", "numero_inventario", "nombre", "numero_serie"):
+            valores.append(valor)
+        else:
+            valores.append(valor or None)
+    valores.append(datos["infraestructura_critica"])
+    return valores
+
+
+def import_inventario_staging(path, modo, progress=None, desde=None, hoja=None, archivo_errores=None):
+    # Alternativa a import_inventario_csv para cargas completas muy grandes: mismos
+    # resultados y formato de errores, pero la escritura es un INSERT ... ON CONFLICT.
+    if not soporta_staging():
+        raise ValueError("El motor staging requiere PostgreSQL o SQLite 3.24 o posterior.")
+    metricas = ImportMetrics()
+    cache = CacheNormalizacion()
+    registro = RegistroErrores(archivo_errores)
+    with registro, metricas.medir():
+        resultados, errores = _import_inventario_staging(
+            path, modo, progress, desde, hoja, metricas.fases, registro, cache
+        )
+    resultados["archivo_errores"] = registro.archivo
+    resultados["metricas"] = metricas.as_dict(resultados["total"])
+    resultados["metricas"]["cache_normalizacion"] = cache.as_dict()
+    return resultados, errores
+
+
+def _import_inventario_staging(path, modo, progress, desde, hoja, fases, registro, cache):
+    resultados = {
+        "total": 0,
+        "creados": 0,
+        "actualizados": 0,
+        "sin_cambios": 0,
+        "omitidos": 0,
+        "errores": 0,
+        "omitidos_por_marca": 0,
+    }
+    errores = registro.muestra
+    desde_key = timezone.localtime(desde).strftime(MARCA_FORMATO) if desde else ""
+    marca_maxima = ""
+    marca_error = ""
+
+    if not path.exists():
+        registro.agregar("-", "-", "No se encontró el archivo CSV.")
+        resultados["errores"] = 1
+        resultados["omitidos"] = 1
+        return resultados, errores
+
+    if progress:
+        progress("cargando", 0)
+    with transaction.atomic(), connection.cursor() as cursor:
+        staging = StagingImport(cursor, modo, fases)
+        fases.cambiar("staging")
+        staging.crear_tabla()
+        fases.cambiar("normalizacion")
+        with open_import_rows(path, hoja) as (lector, _):
+            columnas = HeaderMap(next(lector, []))
+            resultados.update(columnas.resumen())
+            if progress:
+                progress("procesando", 0)
+            lote = []
+            for numero_fila, row in enumerate((row for row in lector if row), start=2):
+                resultados["total"] += 1
+                if progress and resultados["total"] % PROGRESS_EVERY == 0:
+                    progress("procesando", resultados["total"])
+
+                marca = modificacion_key(columnas.get(row, "modificacion"))
+                if marca:
+                    if marca > marca_maxima:
+                        marca_maxima = marca
+                    if marca < desde_key:
+                        resultados["omitidos_por_marca"] += 1
+                        continue
+
+                identificador = ""
+                try:
+                    datos = parse_row(columnas, row, cache)
+                    identificador = datos["identificador"]
+                    validate_row(datos)
+                except Exception as exc:
+                    resultados["errores"] += 1
+                    resultados["omitidos"] += 1
+                    if marca and (not marca_error or marca < marca_error):
+                        marca_error = marca
+                    registro.agregar(numero_fila, identificador, str(exc))
+                    continue
+
+                lote.append(_fila_staging(numero_fila, marca, datos))
+                if len(lote) >= STAGING_BATCH_SIZE:
+                    staging.insertar(lote)
+                    lote = []
+            staging.insertar(lote)
+
+        if progress:
+            progress("guardando", resultados["total"])
+        staging.resolver_jerarquia()
+        staging.validar()
+        staging.resolver_catalogos()
+        resultados["lote_auditoria"] = uuid.uuid4().hex
+        staging.comparar(AuditoriaEquipos(resultados["lote_auditoria"], CatalogResolver()))
+        staging.fusionar(resultados["lote_auditoria"])
+        marcar_cambio()
+
+        conteos = staging.conteos()
+        errores_sql, marca_error_sql = staging.errores(registro)
+        staging.borrar_tabla()
+
+    errores_sql_total = sum(conteos.get(estado, 0) for estado in ERRORES_SQL)
+    for campo in ("creados", "actualizados", "sin_cambios"):
+        resultados[campo] = staging.conteo_filas[campo]
+    # En create_only las filas repetidas después de la primera se omiten, como fila por fila.
+    repetidas = conteos.get("duplicado", 0) if modo == "create_only" else 0
+    resultados["errores"] += errores_sql_total
+    resultados["omitidos"] += errores_sql_total + conteos.get("omitido", 0) + repetidas
+    errores = sorted(errores + errores_sql, key=lambda error: error["fila"])[:ERRORS_LIMIT]
+    if marca_error_sql and (not marca_error or marca_error_sql < marca_error):
+        marca_error = marca_error_sql
+    registrar_marca(resultados, marca_maxima, marca_error, desde)
+    return resultados, errores
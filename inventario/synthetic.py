@@ -0,0 +1,170 @@
+import csv
+import gzip
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from inventario.importer import normalize_header, open_import_file
+
+SISTEMAS_OPERATIVOS = ("Windows 10", "Windows 11", "Ubuntu 22.04", "No disponible")
+TIPOS_EQUIPO = ("Computadoras de escritorio", "Laptops", "Estaciones de trabajo")
+ENTIDADES = (
+    ("Ciudad de México", ("CUAUHTEMOC", "Benito Juarez", "Coyoacán", "Miguel Hidalgo")),
+    ("Chihuahua", ("Chihuahua", "Juárez")),
+    ("Jalisco", ("Guadalajara", "Zapopan")),
+    ("Nuevo León", ("Monterrey", "San Pedro Garza García")),
+)
+NOMBRES = ("ANA", "CARLOS", "CLAUDIA", "JORGE", "LUCIA", "MIGUEL", "PATRICIA", "RAUL")
+APELLIDOS = ("CRUZ", "GARCIA", "HERNANDEZ", "LOPEZ", "MARTINEZ", "MORALES", "RUIZ", "SANCHEZ")
+FECHA_BASE = datetime(2021, 1, 1, 8, 0)
+INVALIDOS = ("Número de serie*", "Sociedad", "División", "Centro de Costo")
+
+
+class InventoryGenerator:
+    # Genera filas con el mismo encabezado que el CSV de plantilla. Cada fila es "nueva",
+    # "actualizada" (existe en el archivo base con otros valores), "sin cambios" (igual
+    # que en el base) o "inválida" (le falta un campo obligatorio).
+    def __init__(
+        self,
+        plantilla,
+        sociedades=3,
+        divisiones=12,
+        centros=60,
+        marcas=8,
+        modelos=40,
+        nuevos=0.2,
+        actualizados=0.3,
+        invalidos=0.02,
+        semilla=1,
+    ):
+        if nuevos + actualizados + invalidos > 1:
+            raise ValueError("La suma de nuevos, actualizados e inválidos no puede pasar de 1.")
+        with open_import_file(plantilla) as archivo:
+            lector = csv.reader(archivo)
+            self.encabezado = next(lector)
+            self.filas_plantilla = [row for row in lector if len(row) == len(self.encabezado)][:500]
+        if not self.filas_plantilla:
+            self.filas_plantilla = [[""] * len(self.encabezado)]
+        self.posiciones = {}
+        for index, columna in enumerate(self.encabezado):
+            self.posiciones.setdefault(normalize_header(columna), []).append(index)
+        self._indices = {}
+        self.random = random.Random(semilla)
+        self.sociedades = [(f"{1000 + i}-{i % 9 + 1}", f"SOCIEDAD SINTÉTICA {i + 1}") for i in range(sociedades)]
+        self.divisiones = [
+            (self.sociedades[i % sociedades], f"{2000 + i}", f"DIVISIÓN SINTÉTICA {i + 1}") for i in range(divisiones)
+        ]
+        self.centros = [(self.divisiones[i % divisiones], f"{30000 + i}") for i in range(centros)]
+        self.marcas = [f"MARCA {i + 1}" for i in range(marcas)]
+        self.modelos = [(self.marcas[i % marcas], f"MODELO {i + 1}") for i in range(modelos)]
+        self.cortes = (nuevos, nuevos + actualizados, nuevos + actualizados + invalidos)
+
+    def _asignar(self, row, columna, valor):
+        indices = self._indices.get(columna)
+        if indices is None:
+            indices = self._indices[columna] = self.posiciones.get(normalize_header(columna), [])
+        for index in indices:
+            row[index] = valor
+
+    def _fecha(self, dias):
+        fecha = FECHA_BASE + timedelta(days=dias, minutes=self.random.randrange(600))
+        return fecha.strftime("%d/%m/%Y %H:%M")
+
+    def _fila(self, numero, modificacion):
+        rnd = self.random
+        row = list(rnd.choice(self.filas_plantilla))
+        (sociedad, division_codigo, division_nombre), centro_codigo = rnd.choice(self.centros)
+        marca, modelo = rnd.choice(self.modelos)
+        entidad, municipios = rnd.choice(ENTIDADES)
+        valores = {
+            "Clave": str(1000000 + numero),
+            "Creación": self._fecha(numero % 365),
+            "Modificación": self._fecha(modificacion),
+            "Sociedad": sociedad[0],
+            "Nombre de Sociedad": sociedad[1],
+            "División": division_codigo,
+            "Nombre de División": division_nombre,
+            "Centro de Costo": centro_codigo,
+            "Nombre": f"EQ{numero:08d}",
+            "RPE de Responsable": f"{rnd.randrange(10000, 99999)}",
+            "Nombre de Responsable": f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}",
+            "Número de inventario*": f"INV{numero:09d}",
+            "Sistema operativo*": rnd.choice(SISTEMAS_OPERATIVOS),
+            "Dirección IP": f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(1, 255)}",
+            "Dirección MAC": "-".join(f"{rnd.randrange(256):02X}" for _ in range(6)),
+            "Es infraestructura crítica?": "SI" if rnd.random() < 0.05 else "NO",
+            "Marca*": marca,
+            "Número de serie*": f"SYN{numero:09d}",
+            "Tipo de equipos*": rnd.choice(TIPOS_EQUIPO),
+            "Modelo*": modelo,
+            "Antigüedad*": str(rnd.randrange(2015, 2025)),
+            "Entidad*": entidad,
+            "Municipio*": rnd.choice(municipios),
+            "Domicilio*": f"CALLE {rnd.randrange(1, 300)} NÚMERO {rnd.randrange(1, 2000)}",
+            "Código Postal": f"{rnd.randrange(1000, 99999):05d}",
+        }
+        for columna, valor in valores.items():
+            self._asignar(row, columna, valor)
+        return row
+
+    def _modificar(self, row, numero):
+        # Una versión posterior de la misma fila con algunos campos cambiados.
+        actualizada = list(row)
+        self._asignar(actualizada, "Modificación", self._fecha(400 + numero % 300))
+        self._asignar(actualizada, "Dirección IP", f"172.16.{self.random.randrange(256)}.{self.random.randrange(1, 255)}")
+        if self.random.random() < 0.5:
+            self._asignar(actualizada, "RPE de Responsable", f"{self.random.randrange(10000, 99999)}")
+        if self.random.random() < 0.3:
+            (sociedad, division_codigo, division_nombre), centro_codigo = self.random.choice(self.centros)
+            self._asignar(actualizada, "Sociedad", sociedad[0])
+            self._asignar(actualizada, "Nombre de Sociedad", sociedad[1])
+            self._asignar(actualizada, "División", division_codigo)
+            self._asignar(actualizada, "Nombre de División", division_nombre)
+            self._asignar(actualizada, "Centro de Costo", centro_codigo)
+        return actualizada
+
+    def filas(self, total):
+        # Produce (fila_base, fila) por cada fila del archivo; fila_base es None si el
+        # equipo no existe antes de la importación.
+        nuevos, actualizados, invalidos = self.cortes
+        for numero in range(total):
+            tipo = self.random.random()
+            row = self._fila(numero, numero % 365)
+            if tipo < nuevos:
+                yield None, row
+            elif tipo < actualizados:
+                yield row, self._modificar(row, numero)
+            elif tipo < invalidos:
+                self._asignar(row, self.random.choice(INVALIDOS), "")
+                yield None, row
+            else:
+                yield row, row
+
+    def escribir(self, total, salida, base=None):
+        conteo = {"filas": 0, "base": 0}
+        with _open_output(salida) as archivo_salida, _open_output(base) as archivo_base:
+            escritor = csv.writer(archivo_salida)
+            escritor.writerow(self.encabezado)
+            escritor_base = None
+            if archivo_base is not None:
+                escritor_base = csv.writer(archivo_base)
+                escritor_base.writerow(self.encabezado)
+            for fila_base, row in self.filas(total):
+                escritor.writerow(row)
+                conteo["filas"] += 1
+                if fila_base is not None and escritor_base is not None:
+                    escritor_base.writerow(fila_base)
+                    conteo["base"] += 1
+        return conteo
+
+
+@contextmanager
+def _open_output(path):
+    if path is None:
+        yield None
+    elif str(path).endswith(".gz"):
+        with gzip.open(path, "wt", encoding="utf-8-sig", newline="") as archivo:
+            yield archivo
+    else:
+        with open(path, "w", encoding="utf-8-sig", newline="") as archivo:
+            yield archivo
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.utils import timezone
+
+UPLOAD_FIELD = "archivo"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class ImportFileWriter:
+    # Escribe el archivo por bloques directamente en IMPORT_UPLOAD_DIR calculando el
+    # SHA-256 al vuelo; nunca se tiene el archivo completo en memoria.
+    def __init__(self, nombre):
+        self.nombre = Path(nombre or "importacion.csv").name
+        self.directorio = Path(settings.IMPORT_UPLOAD_DIR)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.sha256 = hashlib.sha256()
+        self.tamano = 0
+        self.archivo = tempfile.NamedTemporaryFile(dir=self.directorio, prefix="subida_", suffix=".part", delete=False)
+
+    def escribir(self, chunk):
+        self.sha256.update(chunk)
+        self.tamano += len(chunk)
+        self.archivo.write(chunk)
+
+    def cerrar(self):
+        self.archivo.close()
+        seguro = re.sub(r"[^\w.-]", "_", self.nombre)
+        destino = self.directorio / f"{timezone.now():%Y%m%d_%H%M%S}_{self.sha256.hexdigest()[:12]}_{seguro}"
+        os.replace(self.archivo.name, destino)
+        return destino
+
+    def descartar(self):
+        self.archivo.close()
+        Path(self.archivo.name).unlink(missing_ok=True)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as archivo:
+        for chunk in iter(lambda: archivo.read(STREAM_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def eliminar_subida(path):
+    # Solo borra archivos guardados en IMPORT_UPLOAD_DIR; un CSV indicado por ruta
+    # (CSV_INVENTARIO_PATH o el argumento del comando) nunca se toca.
+    ruta = Path(path)
+    if ruta.parent.resolve() != Path(settings.IMPORT_UPLOAD_DIR).resolve():
+        return False
+    ruta.unlink(missing_ok=True)
+    return True
+
+
+def save_import_stream(stream, nombre):
+    writer = ImportFileWriter(nombre)
+    try:
+        for chunk in iter(lambda: stream.read(STREAM_CHUNK_SIZE), b""):
+            writer.escribir(chunk)
+    except BaseException:
+        writer.descartar()
+        raise
+    return writer.cerrar(), writer.sha256.hexdigest(), writer.tamano
+
+
+class ImportUploadHandler(FileUploadHandler):
+    # Sustituye al TemporaryFileUploadHandler para el campo del archivo de importación.
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.writer = None
+        if field_name == UPLOAD_FIELD:
+            self.writer = ImportFileWriter(file_name)
+            raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.writer is None:
+            return raw_data
+        self.writer.escribir(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.writer is None:
+            return None
+        ruta = self.writer.cerrar()
+        subido = UploadedFile(
+            file=open(ruta, "rb"),
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+        )
+        subido.ruta = ruta
+        subido.sha256 = self.writer.sha256.hexdigest()
+        self.writer = None
+        return subido
+
+    def upload_interrupted(self):
+        if getattr(self, "writer", None) is not None:
+            self.writer.descartar()
+            self.writer = None
@@ -8,6 +8,7 @@ from inventario import views
 urlpatterns = [
     path('', views.inicio_dashboard, name='inicio'),
     path('importar', views.importar_inventario, name='importar'),
+    path('importar/estado/<int:job_id>', views.importar_estado, name='importar_estado'),
     path('', include('equipos.urls')),
     path('accounts/login/', auth_views.LoginView.as_view(), name='login'),
     path('accounts/logout/', auth_views.LogoutView.as_view(), name='logout'),
@@ -1,18 +1,28 @@
 import csv
 from datetime import datetime
+import gzip
 import json
+from pathlib import Path
 
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
-from django.shortcuts import render
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
-from equipos.models import AuditLog, Equipo, ImportLog
+from equipos.models import Equipo, ImportJob, ImportLog
 from equipos.permissions import can_import
 from django.db.models import Count
-from inventario.importer import import_inventario_csv
+from inventario.jobs import confirmar_vista_previa, enqueue_import, job_status, reanudar_importacion
+from inventario.locks import lock_actual
+from inventario.uploads import STREAM_CHUNK_SIZE, UPLOAD_FIELD, ImportUploadHandler
+
+
+VISTA_PREVIA_LIMIT = 200
 
 
 def permission_denied(request, exception=None):
@@ -85,6 +95,7 @@ def _build_dashboard_context(request):
     if import_model:
         import_logs = (
             import_model.objects.select_related("usuario")
+            .defer("resumen_errores", "metricas")
             .order_by("-fecha")[:5]
         )
 
@@ -139,10 +150,19 @@ def inicio_dashboard(request):
     return render(request, "inicio_dashboard.html", context)
 
 @login_required
+@csrf_exempt
 def importar_inventario(request):
     if not can_import(request.user):
         return render(request, '403.html', status=403)
+    # El manejador se instala antes de que CSRF lea el cuerpo para que el archivo se
+    # escriba por bloques a disco en lugar de pasar por memoria.
+    if request.method == 'POST':
+        request.upload_handlers.insert(0, ImportUploadHandler(request))
+    return _importar_inventario(request)
 
+
+@csrf_protect
+def _importar_inventario(request):
     context = {
         'modo': 'update_create',
         'resultados': None,
@@ -161,43 +181,116 @@ def importar_inventario(request):
         return _export_errors_csv(log)
 
     if request.method == 'POST':
-        modo = request.POST.get('modo', 'update_create')
-        context['modo'] = modo
-        path = settings.CSV_INVENTARIO_PATH
-        resultados, errores = import_inventario_csv(path, modo)
-
-        log = ImportLog.objects.create(
-            usuario=request.user,
-            archivo=str(path),
-            total_filas=resultados['total'],
-            creados=resultados['creados'],
-            actualizados=resultados['actualizados'],
-            omitidos=resultados['omitidos'],
-            errores=resultados['errores'],
-            resumen_errores=errores,
-        )
-        AuditLog.objects.create(
-            usuario=request.user,
-            accion='IMPORT',
-            resumen=(
-                'Importación CSV ejecutada. '
-                f"Total: {resultados['total']}, "
-                f"Creados: {resultados['creados']}, "
-                f"Actualizados: {resultados['actualizados']}, "
-                f"Omitidos: {resultados['omitidos']}, "
-                f"Errores: {resultados['errores']}."
-            ),
-        )
-        context['resultados'] = resultados
-        context['errores'] = errores
-        context['log_id'] = log.pk
+        if request.POST.get('reanudar'):
+            job = get_object_or_404(ImportJob, pk=request.POST['reanudar'], es_vista_previa=False)
+            try:
+                job = reanudar_importacion(job)
+            except ValueError as exc:
+                return HttpResponse(str(exc), status=409)
+        elif request.POST.get('confirmar'):
+            vista_previa = get_object_or_404(ImportJob, pk=request.POST['confirmar'], es_vista_previa=True)
+            try:
+                job = confirmar_vista_previa(vista_previa, usuario=request.user)
+            except ValueError as exc:
+                return HttpResponse(str(exc), status=409)
+        else:
+            modo = request.POST.get('modo', 'update_create')
+            subido = request.FILES.get(UPLOAD_FIELD)
+            job = enqueue_import(
+                subido.ruta if subido else settings.CSV_INVENTARIO_PATH,
+                modo,
+                usuario=request.user,
+                preview=request.POST.get('accion') == 'preview',
+                sha256=subido.sha256 if subido else '',
+                forzar=bool(request.POST.get('forzar')),
+                incremental=bool(request.POST.get('incremental')),
+                hoja=request.POST.get('hoja', '').strip(),
+            )
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse(job_status(job), status=202)
+        return redirect(f"{reverse('importar')}?job_id={job.pk}")
+
+    job_id = request.GET.get('job_id')
+    if job_id and job_id.isdigit():
+        job = ImportJob.objects.select_related('import_log').filter(pk=job_id).first()
+        if job:
+            context['modo'] = job.modo
+            context['job'] = job
+            context['job_status'] = job_status(job)
+            if job.import_log:
+                context['resultados'] = job.resultados
+                context['errores'] = job.import_log.resumen_errores or []
+                context['log_id'] = job.import_log_id
+            elif job.es_vista_previa and job.cambios:
+                context['resultados'] = job.resultados
+                context['errores'] = job.cambios['errores']
+                context['vista_previa'] = _resumen_vista_previa(job.cambios)
+                context['puede_confirmarse'] = job.puede_confirmarse
+
+    if context['resultados']:
+        for campo in ('incremental_desde', 'marca_modificacion'):
+            context[campo] = parse_datetime(context['resultados'].get(campo) or '')
+
+    # Quién tiene el candado de importación; otra importación queda en cola hasta que termine.
+    context['lock'] = lock_actual()
 
     return render(request, 'importar.html', context)
 
 
+@login_required
+def importar_estado(request, job_id):
+    if not can_import(request.user):
+        return JsonResponse({'error': 'Sin permiso.'}, status=403)
+    job = get_object_or_404(ImportJob, pk=job_id)
+    return JsonResponse(job_status(job))
+
+
+def _texto_valor(valor):
+    if valor is None or valor == '':
+        return '—'
+    if isinstance(valor, bool):
+        return 'Sí' if valor else 'No'
+    if isinstance(valor, list):
+        return ' / '.join(valor)
+    return valor
+
+
+def _resumen_vista_previa(cambios):
+    operaciones = []
+    for operacion in cambios['operaciones'][:VISTA_PREVIA_LIMIT]:
+        if operacion['accion'] == 'crear':
+            detalle = [
+                (campo, None, _texto_valor(valor))
+                for campo, valor in operacion['valores'].items()
+                if valor not in (None, '', False)
+            ]
+        else:
+            detalle = [
+                (campo, _texto_valor(antes), _texto_valor(despues))
+                for campo, (antes, despues) in operacion['cambios'].items()
+            ]
+        operaciones.append({**operacion, 'detalle': detalle})
+    catalogos = cambios['catalogos']
+    return {
+        'operaciones': operaciones,
+        'total_operaciones': len(cambios['operaciones']),
+        'catalogos': sum(len(valores) for valores in catalogos.values()),
+    }
+
+
+def _leer_gzip(ruta):
+    with gzip.open(ruta, 'rb') as archivo:
+        yield from iter(lambda: archivo.read(STREAM_CHUNK_SIZE), b'')
+
+
 def _export_errors_csv(log):
-    response = HttpResponse(content_type='text/csv')
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if log.archivo_errores and Path(log.archivo_errores).exists():
+        # El archivo completo se descomprime y se envía por bloques.
+        response = StreamingHttpResponse(_leer_gzip(log.archivo_errores), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="errores_importacion_{timestamp}.csv"'
+        return response
+    response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = f'attachment; filename="errores_importacion_{timestamp}.csv"'
     writer = csv.writer(response)
     writer.writerow(['fila', 'identificador', 'mensaje'])